@@ -0,0 +1,175 @@
+# 每日運勢：N 位使用者 x D 天，逐日分析當日干支與各人本命八字的關係
+#
+# 流日干支的天干只與本命四干、地支只與本命四支發生關係，因此把使用者依本命四干、四支分組，
+# 每組只需算 10 個天干、12 個地支的結果，之後每人每天都是查表。
+#
+#   python almanac.py --charts charts.jsonl --start 2026-01-01 --days 365 > almanac.jsonl
+#
+# charts.jsonl 為 `python main.py --batch` 的輸出（使用其中的 id 與 pillars 欄位）。
+
+import argparse
+import json
+import sys
+from datetime import date, timedelta
+
+import numpy as np
+
+import codes
+
+EPOCH = date(1970, 1, 1)
+
+# 日柱：1970-01-01 為辛巳（六十甲子第 17）
+_DAY_CODE_OFFSET = 17
+
+
+def day_code(day):
+    """
+    求某日日柱的六十甲子編碼
+    :param day: date
+    :return: 0-59
+    """
+    return ((day - EPOCH).days + _DAY_CODE_OFFSET) % 60
+
+
+def _flow_hits(natal, flow, analyze):
+    """
+    分析流日的一個干（或支）與本命四干（或四支）的關係，只保留涉及流日者
+    """
+    found = analyze(natal + (flow,), (0, 1, 2, 3, codes.FLOW))
+    return tuple(r for r in found if codes.FLOW in r.positions)
+
+
+class AlmanacEngine:
+    """
+    每日運勢批次引擎：使用者依本命四干、四支分組，每組的結果只算一次
+    """
+
+    def __init__(self):
+        self.user_ids = []
+        self._user_stem_group = []
+        self._user_branch_group = []
+        self._stem_groups = {}
+        self._branch_groups = {}
+        self._stem_tables = []  # 每組 10 個天干的結果編號
+        self._branch_tables = []  # 每組 12 個地支的結果編號
+        self.entries = [()]  # 結果編號 -> (Relation, ...)；0 為無關係
+        self._entry_ids = {(): 0}
+        self._arrays = None
+
+    def _entry(self, relations):
+        entry_id = self._entry_ids.get(relations)
+        if entry_id is None:
+            entry_id = self._entry_ids[relations] = len(self.entries)
+            self.entries.append(relations)
+        return entry_id
+
+    def add(self, user_id, heavenly_stems, earthly_branches):
+        """
+        加入一位使用者
+        :param user_id: 使用者編號
+        :param heavenly_stems: 本命天干列表 [年干, 月干, 日干, 時干]
+        :param earthly_branches: 本命地支列表 [年支, 月支, 日支, 時支]
+        """
+        stems, branches = codes.encode_bazi(heavenly_stems, earthly_branches)
+        group = self._stem_groups.get(stems)
+        if group is None:
+            group = self._stem_groups[stems] = len(self._stem_tables)
+            self._stem_tables.append([self._entry(_flow_hits(stems, s, codes.analyze_stems)) for s in range(10)])
+        self._user_stem_group.append(group)
+
+        group = self._branch_groups.get(branches)
+        if group is None:
+            group = self._branch_groups[branches] = len(self._branch_tables)
+            self._branch_tables.append([self._entry(_flow_hits(branches, b, codes.analyze_branches)) for b in range(12)])
+        self._user_branch_group.append(group)
+
+        self.user_ids.append(user_id)
+        self._arrays = None
+
+    def stats(self):
+        """
+        :return: 使用者數、天干組數、地支組數、不同結果數
+        """
+        return {
+            "users": len(self.user_ids),
+            "stem_groups": len(self._stem_tables),
+            "branch_groups": len(self._branch_tables),
+            "entries": len(self.entries),
+        }
+
+    def _lookup_arrays(self):
+        if self._arrays is None:
+            self._arrays = (
+                np.asarray(self._stem_tables, dtype=np.int32).reshape(-1, 10),
+                np.asarray(self._branch_tables, dtype=np.int32).reshape(-1, 12),
+                np.asarray(self._user_stem_group, dtype=np.int32),
+                np.asarray(self._user_branch_group, dtype=np.int32),
+            )
+        return self._arrays
+
+    def iter_days(self, start, days):
+        """
+        逐日產生全部使用者的結果編號（向量化）
+        :param start: 起始日期 (date)
+        :param days: 天數
+        :return: 產生 (日期, 日柱編碼, 天干結果編號陣列, 地支結果編號陣列) 的產生器；
+                 陣列依使用者加入順序排列，編號對應 self.entries
+        """
+        stem_tables, branch_tables, user_stem_group, user_branch_group = self._lookup_arrays()
+        for offset in range(days):
+            day = start + timedelta(days=offset)
+            code = day_code(day)
+            yield day, code, stem_tables[user_stem_group, code % 10], branch_tables[user_branch_group, code % 12]
+
+    def rows(self, start, days, skip_empty=True):
+        """
+        逐人逐日產生結果
+        :param start: 起始日期 (date)
+        :param days: 天數
+        :param skip_empty: 略過當天與本命無任何關係的使用者
+        :return: 產生 (使用者編號, 日期, 日柱干支, 天干結果編號, 地支結果編號) 的產生器
+        """
+        for day, code, stem_ids, branch_ids in self.iter_days(start, days):
+            pillar = codes.JIA_ZI[code]
+            if skip_empty:
+                users = np.flatnonzero(stem_ids | branch_ids).tolist()
+            else:
+                users = range(len(self.user_ids))
+            stem_list, branch_list = stem_ids.tolist(), branch_ids.tolist()
+            for u in users:
+                yield self.user_ids[u], day, pillar, stem_list[u], branch_list[u]
+
+
+def write_jsonl(engine, start, days, output, skip_empty=True):
+    """
+    將每日結果寫成 JSONL；每個結果的文字只產生一次
+    :return: 寫入筆數
+    """
+    rendered = [json.dumps([r.render() for r in relations], ensure_ascii=False) for relations in engine.entries]
+    count = 0
+    for user_id, day, pillar, stem_id, branch_id in engine.rows(start, days, skip_empty):
+        output.write(
+            f'{{"id": {json.dumps(user_id, ensure_ascii=False)}, "date": "{day.isoformat()}", '
+            f'"pillar": "{pillar}", "heavenly": {rendered[stem_id]}, "branch": {rendered[branch_id]}}}\n'
+        )
+        count += 1
+    return count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="每日運勢批次計算")
+    parser.add_argument("--charts", required=True, help="main.py --batch 輸出的命盤 JSONL，- 表示標準輸入")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--all", action="store_true", help="輸出全部使用者，包括當天無關係者")
+    args = parser.parse_args()
+
+    engine = AlmanacEngine()
+    stream = sys.stdin if args.charts == "-" else open(args.charts, encoding="utf-8")
+    for line_no, line in enumerate(stream, start=1):
+        if line.strip():
+            chart = json.loads(line)
+            pillars = chart["pillars"]
+            engine.add(chart.get("id", line_no), [p[0] for p in pillars], [p[1] for p in pillars])
+    count = write_jsonl(engine, args.start, args.days, sys.stdout, skip_empty=not args.all)
+    print(f"{engine.stats()}，輸出 {count} 筆", file=sys.stderr)
@@ -0,0 +1,107 @@
+# 批次排盤：以 NumPy 向量化計算大量出生時間的四柱，輸出整數編碼
+#
+# 天干編碼 0-9 對應 basic.heavenly_stems，地支編碼 0-11 對應 basic.earthly_branches，
+# 結果與 solar_to_lunar / get_bazi_from_solar_date 的字串輸出逐字相同。
+
+import numpy as np
+
+from config import basic
+import jieqi
+
+SECONDS_PER_DAY = 86400
+
+# 1970-01-01 正午的儒略日為 2440588，lunar_python 以 (儒略日 - 11) 取日柱干支
+_DAY_OFFSET = 2440588 - 11
+
+
+def _build_month_table():
+    """
+    由節氣時刻表整理出每個「節」的交節日期及其月柱干支
+    :return: (交節日數陣列, 月干陣列, 月支陣列)
+    """
+    first_index, seconds = jieqi.jie_qi_seconds()
+    seconds = np.asarray(seconds, dtype=np.int64)
+    name_index = (first_index + np.arange(len(seconds))) % 24
+    is_jie = name_index % 2 == 1
+    seconds = seconds[is_jie]
+    jie_index = (name_index[is_jie] - 1) // 2  # 小寒 0, 立春 1, ..., 大雪 11
+
+    # 月令在交節當天即交接（lunar_python 以日期比較）
+    jie_days = seconds // SECONDS_PER_DAY
+
+    month_zhi = (jie_index + 1) % 12  # 小寒 丑, 立春 寅, ..., 大雪 子
+    # 五虎遁：以立春年的年干定寅月月干，小寒（丑月）仍屬前一年
+    solar_year = seconds.astype("datetime64[s]").astype("datetime64[Y]").astype(np.int64) + 1970
+    li_chun_year = solar_year - (jie_index == 0)
+    tiger_start = ((li_chun_year - 4) % 10 % 5 * 2 + 2) % 10
+    month_gan = (tiger_start + (month_zhi - 2) % 12) % 10
+    return jie_days, month_gan, month_zhi
+
+
+_jie_days, _month_gan, _month_zhi = _build_month_table()
+_new_year_first, _new_year_days = jieqi.lunar_new_year_days()
+_new_year_days = np.asarray(_new_year_days, dtype=np.int64)
+
+
+def month_table():
+    """
+    取得每個「節」的交節日期及其月柱
+    :return: (交節日數陣列（自 1970-01-01 起算）, 月干陣列, 月支陣列)
+    """
+    return _jie_days, _month_gan, _month_zhi
+
+
+def bazi_batch(datetimes):
+    """
+    批次計算四柱干支
+    :param datetimes: 出生時間陣列 (numpy datetime64 或 datetime 序列)
+    :return: (天干陣列, 地支陣列)，皆為 shape (N, 4) 的 int8，欄位依序為 年、月、日、時
+    """
+    seconds = np.asarray(datetimes, dtype="datetime64[s]").astype(np.int64).ravel()
+    if len(_jie_days) == 0:
+        raise ValueError("找不到節氣時刻表，請先執行 python jieqi.py")
+    days = seconds // SECONDS_PER_DAY
+    if days.size and (days.min() < _jie_days[0] or days.max() >= _jie_days[-1]):
+        raise ValueError(f"出生時間超出節氣表範圍 ({jieqi.FIRST_YEAR}-{jieqi.LAST_YEAR})")
+    hours = seconds % SECONDS_PER_DAY // 3600
+
+    stems = np.empty((len(seconds), 4), dtype=np.int8)
+    branches = np.empty((len(seconds), 4), dtype=np.int8)
+
+    # 年柱：以正月初一為界的農曆年
+    lunar_year = _new_year_first - 1 + np.searchsorted(_new_year_days, days, side="right")
+    stems[:, 0] = (lunar_year - 4) % 10
+    branches[:, 0] = (lunar_year - 4) % 12
+
+    # 月柱：出生日期之前最近的一個「節」
+    jie = np.searchsorted(_jie_days, days, side="right") - 1
+    stems[:, 1] = _month_gan[jie]
+    branches[:, 1] = _month_zhi[jie]
+
+    # 日柱：日數取 60 甲子
+    day_offset = days + _DAY_OFFSET
+    day_gan = day_offset % 10
+    stems[:, 2] = day_gan
+    branches[:, 2] = day_offset % 12
+
+    # 時柱：五鼠遁，23 時（夜子時）以次日日干起時干
+    hour_zhi = (hours + 1) // 2 % 12
+    stems[:, 3] = ((day_gan + (hours == 23)) % 5 * 2 + hour_zhi) % 10
+    branches[:, 3] = hour_zhi
+
+    return stems, branches
+
+
+def decode_batch(stems, branches):
+    """
+    將整數編碼的四柱轉回字串
+    :param stems: 天干編碼陣列 (N, 4)
+    :param branches: 地支編碼陣列 (N, 4)
+    :return: [(天干列表, 地支列表), ...]，格式同 get_bazi_from_solar_date
+    """
+    gan = basic.heavenly_stems
+    zhi = basic.earthly_branches
+    return [
+        ([gan[s] for s in stem_row], [zhi[b] for b in branch_row])
+        for stem_row, branch_row in zip(stems.tolist(), branches.tolist())
+    ]
@@ -0,0 +1,424 @@
+# 效能基準測試：各步驟的微基準、合成出生資料的端到端吞吐量、每張命盤的記憶體用量，
+# 以及以全新直譯器排一張命盤的冷啟動時間
+#
+# 結果寫成 JSON，可與先前的結果比較，退步超過門檻時以 1 結束，方便在不同 commit 之間比對。
+# 每一項都量測多輪：微基準每輪至少跑 50 毫秒並取最快的一輪，吞吐量及冷啟動取中位數，並記錄各輪的離散程度
+# （spread）。是否退步只看門檻：超過門檻的項目先重新量測（--retries 次，取最好的一次），仍超過門檻時，
+# 若離散程度本身大於門檻則標為不確定並以 2 結束（請增加 --rounds 重測），否則為退步。
+#
+#   python benchmark.py --output bench.json                       # 完整測試（10k 張命盤、1M 筆批次）
+#   python benchmark.py --quick --baseline bench.json --threshold 0.2
+#
+# 出生資料以固定亂數種子產生，不需網路及外部資料。
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+import numpy as np
+
+import codes
+import main
+from batch import bazi_batch
+
+# 各項結果的方向：lower 表示越小越好
+LOWER = "lower"
+HIGHER = "higher"
+
+
+def synthetic_births(count, seed=0, first_year=1950, last_year=2020):
+    """
+    產生合成出生資料
+    :param count: 筆數
+    :param seed: 亂數種子
+    :return: [(年, 月, 日, 時, 性別, 分), ...]
+    """
+    rng = random.Random(seed)
+    return [
+        (rng.randint(first_year, last_year), rng.randint(1, 12), rng.randint(1, 28),
+         rng.randint(0, 23), rng.randint(0, 1), rng.randint(0, 59))
+        for _ in range(count)
+    ]
+
+
+def synthetic_timestamps(count, seed=0, first_year=1950, last_year=2020):
+    """
+    產生合成出生時間（numpy datetime64 陣列），供批次排盤使用
+    """
+    rng = np.random.default_rng(seed)
+    lo = np.datetime64(f"{first_year}-01-01T00:00:00", "s").astype(np.int64)
+    hi = np.datetime64(f"{last_year + 1}-01-01T00:00:00", "s").astype(np.int64)
+    return rng.integers(lo, hi, size=count).astype("datetime64[s]")
+
+
+def measure(func, args_list, repeat=5, min_time=0.05):
+    """
+    以多輪中最快的一輪計算每次呼叫的平均時間。每輪至少跑 min_time 秒（不足時整個參數列表重複呼叫），
+    量測期間停用 gc，避免太短的一輪被排程或垃圾回收的雜訊左右
+    :param func: 受測函式
+    :param args_list: 每次呼叫的參數列表，每輪依序全部呼叫一次或多次
+    :param repeat: 輪數
+    :param min_time: 每輪的最短秒數
+    :return: (每次呼叫的奈秒數, 各輪的離散程度，見 spread)
+    """
+    def one_round(loops):
+        start = time.perf_counter_ns()
+        for _ in range(loops):
+            for args in args_list:
+                func(*args)
+        return time.perf_counter_ns() - start
+
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        loops = 1
+        while one_round(loops) < min_time * 1e9:
+            loops *= 2
+        times = [one_round(loops) for _ in range(repeat)]
+    finally:
+        if enabled:
+            gc.enable()
+    return min(times) / (loops * len(args_list)), spread(times)
+
+
+def spread(times):
+    """
+    各輪耗時的離散程度：去掉最慢的一輪（偶發的干擾只會讓一輪變慢）後，最慢與最快之差相對於最快的比例
+    :param times: 各輪耗時
+    :return: 比例（0.1 表示 10%）
+    """
+    times = sorted(times)
+    if len(times) >= 3:
+        times = times[:-1]
+    return round((times[-1] - times[0]) / times[0], 3)
+
+
+def _result(value, unit, better, **extra):
+    return {"value": round(value, 3), "unit": unit, "better": better, **extra}
+
+
+def _micro(func, args_list):
+    per_call, noise = measure(func, args_list)
+    return _result(per_call, "ns/op", LOWER, spread=noise)
+
+
+def micro_benchmarks(count=2000, seed=0):
+    """
+    main.py 各步驟的微基準
+    :param count: 每項使用的不同輸入數
+    :return: {名稱: 結果}
+    """
+    births = synthetic_births(count, seed)
+    results = {}
+
+    # solar_to_lunar：冷快取（停用時辰快取，每輪每筆都要經過 lunar_python）及熱快取
+    main.configure_lunar_cache(0)
+    cold = [(y, m, d, h, mi) for y, m, d, h, _, mi in births[:max(count // 10, 1)]]
+    results["solar_to_lunar.cold"] = _micro(main.solar_to_lunar, cold)
+    main.configure_lunar_cache()
+    warm = [(y, m, d, h, mi) for y, m, d, h, _, mi in births]
+    for args in warm:
+        main.solar_to_lunar(*args)
+    results["solar_to_lunar.warm"] = _micro(main.solar_to_lunar, warm)
+    if main.ephemeris.default() is not None:
+        fast = [args + (0, False) for args in warm]
+        results["solar_to_lunar.ephemeris"] = _micro(main.solar_to_lunar, fast)
+
+    lunar_infos = [main.solar_to_lunar(*args) for args in warm]
+    pillars = [main.get_bazi_from_solar_date(info) for info in lunar_infos]
+
+    # analyze_bazi：冷快取與熱快取
+    codes.configure_cache(maxsize=0)
+    results["analyze_bazi.uncached"] = _micro(main.analyze_bazi, pillars)
+    codes.configure_cache()
+    results["analyze_bazi.cached"] = _micro(main.analyze_bazi, pillars)
+
+    luck_args = [
+        (info, gender, datetime(y, m, d, h, mi))
+        for info, (y, m, d, h, gender, mi) in zip(lunar_infos, births)
+    ]
+    results["get_start_luck"] = _micro(main.get_start_luck, luck_args)
+    luck_infos = [(main.get_start_luck(*args),) for args in luck_args]
+    results["get_luck_pillars"] = _micro(main.get_luck_pillars, luck_infos)
+    return results
+
+
+def chart_throughput(count, seed=0, rounds=5):
+    """
+    端到端：逐筆 compute_chart（每輪都清空快取，從冷快取起算），取各輪的中位數
+    :param count: 命盤數
+    :param rounds: 輪數
+    :return: {名稱: 結果}
+    """
+    births = synthetic_births(count, seed)
+    times = []
+    for _ in range(rounds):
+        main.configure_lunar_cache()
+        codes.configure_cache()
+        start = time.perf_counter()
+        for birth in births:
+            main.compute_chart(*birth)
+        times.append(time.perf_counter() - start)
+    elapsed = statistics.median(times)
+    return {f"compute_chart.{count}": _result(count / elapsed, "charts/s", HIGHER, seconds=round(elapsed, 3),
+                                              spread=spread(times))}
+
+
+def batch_throughput(count, seed=0, rounds=5):
+    """
+    端到端：向量化四柱（batch.bazi_batch）加上編碼分析（codes.analyze_codes），各取各輪的中位數
+    :param count: 出生時間數
+    :param rounds: 輪數
+    :return: {名稱: 結果}
+    """
+    timestamps = synthetic_timestamps(count, seed)
+    analyze = codes.analyze_codes
+    pillar_times = []
+    total_times = []
+    for _ in range(rounds):
+        codes.configure_cache()
+        start = time.perf_counter()
+        stems, branches = bazi_batch(timestamps)
+        pillars_done = time.perf_counter()
+        for s, b in zip(stems.tolist(), branches.tolist()):
+            analyze(s, b)
+        pillar_times.append(pillars_done - start)
+        total_times.append(time.perf_counter() - start)
+    elapsed = statistics.median(total_times)
+    return {
+        f"bazi_batch.{count}": _result(count / statistics.median(pillar_times), "charts/s", HIGHER,
+                                       spread=spread(pillar_times)),
+        f"batch_chart.{count}": _result(count / elapsed, "charts/s", HIGHER, seconds=round(elapsed, 3),
+                                        spread=spread(total_times)),
+    }
+
+
+def memory_per_chart(count=1000, seed=0):
+    """
+    每張命盤（compute_chart 的結果）常駐的記憶體量。
+    先不追蹤地跑一輪填滿快取（tracemalloc 會讓 lunar_python 慢上數十倍），
+    因此量到的是每張命盤本身的增量，不含快取共用的部分
+    :param count: 命盤數
+    :return: {名稱: 結果}
+    """
+    births = synthetic_births(count, seed + 1)
+    main.configure_lunar_cache()
+    codes.configure_cache()
+    for birth in births:
+        main.compute_chart(*birth)
+    gc.collect()
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    charts = [main.compute_chart(*birth) for birth in births]
+    after, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del charts
+    return {
+        "memory.chart": _result((after - before) / count, "bytes/chart", LOWER),
+        "memory.peak": _result((peak - before) / count, "bytes/chart", LOWER),
+    }
+
+
+# 冷啟動測試：每項在全新的直譯器中執行
+COLD_START_SCRIPTS = {
+    "cold_start.python": "pass",  # 直譯器本身，作為下限參考
+    "cold_start.import": "import main",
+    "cold_start.chart": "import main; main.compute_chart(1990, 5, 17, 14)",
+    "cold_start.chart_fast": "import main; main.compute_chart(1990, 5, 17, 14, lunar_date=False)",
+}
+
+
+def cold_start(runs=15):
+    """
+    冷啟動：從啟動直譯器到排完一張命盤的實際時間（取中位數），對應只排一張命盤的命令列或無伺服器呼叫。
+    每項先跑一次以產生 .pyc 及規則編譯快照；沒有星曆檔時略過 cold_start.chart_fast
+    :param runs: 每項執行次數
+    :return: {名稱: 結果}
+    """
+    here = os.path.dirname(os.path.abspath(__file__))
+    results = {}
+    for name, script in COLD_START_SCRIPTS.items():
+        if name == "cold_start.chart_fast" and main.ephemeris.default() is None:
+            continue
+        command = [sys.executable, "-c", script]
+        subprocess.run(command, cwd=here, check=True)
+        times = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            subprocess.run(command, cwd=here, check=True)
+            times.append(time.perf_counter() - start)
+        results[name] = _result(statistics.median(times) * 1000, "ms", LOWER, spread=spread(times))
+    return results
+
+
+def environment():
+    """
+    記錄執行環境，方便比較不同機器或 commit 的結果
+    """
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__)), check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "numpy": np.__version__,
+    }
+
+
+def benchmarks(chart_count=10000, batch_count=1000000, micro_count=2000, memory_count=1000, seed=0, cold_runs=15,
+               rounds=5):
+    """
+    各組基準測試，每組可單獨重跑（重新量測時使用）
+    :param cold_runs: 冷啟動每項的執行次數，0 表示略過
+    :param rounds: 吞吐量量測的輪數
+    :return: [無參數函式, ...]，各回傳 {名稱: 結果}
+    """
+    groups = []
+    if cold_runs:
+        groups.append(lambda: cold_start(cold_runs))
+    groups.append(lambda: micro_benchmarks(micro_count, seed))
+    groups.append(lambda: chart_throughput(chart_count, seed, rounds))
+    groups.append(lambda: batch_throughput(batch_count, seed, rounds))
+    groups.append(lambda: memory_per_chart(memory_count, seed))
+    return groups
+
+
+def run(groups):
+    """
+    執行全部基準測試
+    :param groups: benchmarks() 的結果
+    :return: ({"environment": ..., "results": {名稱: {"value", "unit", "better", ...}}}, {名稱: 所屬的組})
+    """
+    results = {}
+    sources = {}
+    for group in groups:
+        group_results = group()
+        results.update(group_results)
+        sources.update(dict.fromkeys(group_results, group))
+    return {"environment": environment(), "results": results}, sources
+
+
+def _better(a, b):
+    if a["better"] == LOWER:
+        return a if a["value"] <= b["value"] else b
+    return a if a["value"] >= b["value"] else b
+
+
+def remeasure(report, names, sources):
+    """
+    重跑指定項目所屬的組，每項保留歷次量測中最好的一次（真正的退步每次都會出現，偶發的雜訊則不會），
+    並記錄量測次數（attempts）
+    :param report: run 的結果，就地更新
+    :param names: 要重新量測的項目
+    :param sources: run 回傳的 {名稱: 所屬的組}
+    """
+    groups = []
+    for name in names:
+        if sources[name] not in groups:
+            groups.append(sources[name])
+    for group in groups:
+        for name, result in group().items():
+            if name in names:
+                previous = report["results"][name]
+                best = dict(_better(previous, result))
+                best["attempts"] = previous.get("attempts", 1) + 1
+                report["results"][name] = best
+
+
+REGRESSED = "退步"
+INCONCLUSIVE = "不確定"
+
+
+def compare(baseline, current, threshold=0.2):
+    """
+    與先前的結果比較。是否超過門檻只看 threshold；超過門檻但任一邊的離散程度（spread）本身就大於門檻時，
+    這次量測無法區分退步與雜訊，標為不確定而非退步
+    :param baseline: 先前 run 的結果
+    :param current: 本次 run 的結果
+    :param threshold: 容許的退步比例（0.2 表示 20%）
+    :return: [(名稱, 先前值, 本次值, 變化比例, None / REGRESSED / INCONCLUSIVE), ...]；只列出兩邊都有的項目
+    """
+    rows = []
+    for name, now in current["results"].items():
+        before = baseline["results"].get(name)
+        if before is None or not before["value"] or before["unit"] != now["unit"]:
+            continue
+        change = (now["value"] - before["value"]) / before["value"]
+        worse = change if now["better"] == LOWER else -change
+        status = None
+        if worse > threshold:
+            noisy = max(before.get("spread", 0), now.get("spread", 0)) > threshold
+            status = INCONCLUSIVE if noisy else REGRESSED
+        rows.append((name, before["value"], now["value"], change, status))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="八字計算效能基準測試")
+    parser.add_argument("--output", help="結果 JSON 檔，預設輸出至標準輸出")
+    parser.add_argument("--baseline", help="先前的結果 JSON 檔，用於比較")
+    parser.add_argument("--threshold", type=float, default=0.2, help="容許的退步比例，預設 0.2")
+    parser.add_argument("--quick", action="store_true", help="縮小規模（1k 張命盤、100k 筆批次）")
+    parser.add_argument("--charts", type=int, help="compute_chart 端到端的命盤數，預設 10000")
+    parser.add_argument("--batch", type=int, help="批次排盤的出生時間數，預設 1000000")
+    parser.add_argument("--cold-runs", type=int, help="冷啟動每項的執行次數，預設 15，0 表示略過")
+    parser.add_argument("--rounds", type=int, default=5, help="吞吐量量測的輪數（取中位數），預設 5")
+    parser.add_argument("--retries", type=int, default=2, help="超過門檻的項目重新量測的次數，預設 2")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    chart_count = args.charts or (1000 if args.quick else 10000)
+    batch_count = args.batch or (100000 if args.quick else 1000000)
+    micro_count = 500 if args.quick else 2000
+    cold_runs = args.cold_runs if args.cold_runs is not None else (5 if args.quick else 15)
+    groups = benchmarks(chart_count, batch_count, micro_count, memory_count=min(chart_count, 1000), seed=args.seed,
+                        cold_runs=cold_runs, rounds=args.rounds)
+    report, sources = run(groups)
+
+    baseline = None
+    rows = []
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+        rows = compare(baseline, report, args.threshold)
+        for _ in range(args.retries):
+            flagged = [row[0] for row in rows if row[4]]
+            if not flagged:
+                break
+            remeasure(report, flagged, sources)
+            rows = compare(baseline, report, args.threshold)
+
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+    else:
+        print(text)
+
+    if baseline is not None:
+        for name, before, now, change, status in rows:
+            print(f"{name:32} {before:>14.3f} -> {now:>14.3f} {change:+7.1%} {status or ''}", file=sys.stderr)
+        regressions = sum(row[4] == REGRESSED for row in rows)
+        inconclusive = sum(row[4] == INCONCLUSIVE for row in rows)
+        if regressions:
+            print(f"{regressions} 項退步超過 {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+        if inconclusive:
+            print(f"{inconclusive} 項變化超過 {args.threshold:.0%} 但量測離散程度過大，無法判斷，"
+                  f"請增加 --rounds 或重新量測", file=sys.stderr)
+            sys.exit(2)
@@ -0,0 +1,264 @@
+# 批次命盤：逐筆讀取 CSV / JSONL 出生資料，輸出 JSONL 命盤
+#
+# 以產生器逐行處理，記憶體用量與輸入大小無關；單筆錯誤寫到錯誤輸出，不中斷整批。
+#
+#   python main.py --batch births.jsonl --output charts.jsonl --errors errors.jsonl
+#   cat births.csv | python main.py --batch - --format csv > charts.jsonl
+
+import argparse
+import csv
+import json
+import sys
+
+import metrics
+import serialize
+from main import compute_chart
+
+# 輸入欄位：year, month, day 必填；hour, minute 預設 0；gender 預設 1（男）；id 原樣帶到輸出
+GENDERS = {"1": 1, "0": 0, "男": 1, "女": 0, "M": 1, "F": 0, "m": 1, "f": 0}
+
+
+def read_births(stream, fmt="jsonl"):
+    """
+    逐筆讀取出生資料
+    :param stream: 文字輸入串流
+    :param fmt: "jsonl" 或 "csv"
+    :return: 產生 (行號, 原始資料 dict 或解析錯誤) 的產生器
+    """
+    if fmt == "csv":
+        for line_no, row in enumerate(csv.DictReader(stream), start=2):
+            yield line_no, row
+        return
+    for line_no, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_no, json.loads(line)
+        except json.JSONDecodeError as e:
+            yield line_no, ValueError(f"JSON 格式錯誤: {e}")
+
+
+def parse_birth(record):
+    """
+    將一筆原始資料轉為 compute_chart 的參數
+    :param record: 原始資料 dict
+    :return: (year, month, day, hour, gender, minute)
+    """
+    def number(key, default=None):
+        value = record.get(key, default)
+        if value is None or value == "":
+            if default is None:
+                raise ValueError(f"缺少欄位: {key}")
+            value = default
+        return int(value)
+
+    gender = str(record.get("gender", 1)).strip()
+    if gender not in GENDERS:
+        raise ValueError(f"無效的性別: {gender}")
+    return number("year"), number("month"), number("day"), number("hour", 0), GENDERS[gender], number("minute", 0)
+
+
+@metrics.instrument("chart_to_json")
+def chart_to_json(chart):
+    """
+    將 compute_chart 的結果轉為可 JSON 序列化的字典
+    :param chart: 命盤字典
+    :return: dict
+    """
+    lunar_info = chart["lunar_info"]
+    luck_info = chart["luck_info"]
+    stems, branches = chart["heavenly_stems"], chart["earthly_branches"]
+    return {
+        "birth": chart["birth_date"].isoformat(),
+        "gender": luck_info["gender"],
+        "pillars": [f"{s}{b}" for s, b in zip(stems, branches)],
+        "lunar": {
+            "year": lunar_info["year"],
+            "month": lunar_info["month"],
+            "day": lunar_info["day"],
+            "festival": lunar_info["festival"],
+        },
+        "jie_qi": {
+            "this": lunar_info["this_jie_qi"],
+            "this_start": lunar_info["this_jie_qi_starttime"],
+            "next": lunar_info["next_jie_qi"],
+            "next_start": lunar_info["next_jie_qi_starttime"].strftime("%Y-%m-%d %H:%M:%S"),
+        },
+        "luck": {
+            "start_age": luck_info["start_age"],
+            "start_date": luck_info["start_date"].strftime("%Y-%m-%d"),
+            "pillars": chart["luck_pillars"],
+        },
+        "analysis": chart["analysis"],
+    }
+
+
+def json_row(chart, record, line_no):
+    """
+    輸出 JSONL 時的一列：chart_to_json 的結果，原始資料有 id 時帶到最前面
+    """
+    row = chart_to_json(chart)
+    if "id" in record:
+        row = {"id": record["id"], **row}
+    return row
+
+
+def binary_row(chart, record, line_no):
+    """
+    輸出二進位格式時的一列：serialize.encode_chart 的結果，編號為整數 id（沒有時為行號）
+    """
+    try:
+        key = int(record["id"])
+    except (KeyError, TypeError, ValueError):
+        key = line_no
+    return serialize.encode_chart(chart, key)
+
+
+# 輸出格式 -> 每列的轉換函式
+OUTPUT_FORMATS = {"jsonl": json_row, "rows": binary_row, "npz": binary_row}
+
+# npz 輸出整批留在記憶體中（每筆約 100 位元組，存檔時另需同樣大小的欄式陣列），預設最多 500 萬筆（約 1 GB）
+NPZ_MAX_RECORDS = 5_000_000
+
+
+def chart_rows(births, convert=json_row):
+    """
+    逐筆計算命盤
+    :param births: read_births 產生的 (行號, 原始資料)
+    :param convert: 將命盤轉為輸出列的函式 convert(命盤, 原始資料, 行號)
+    :return: 產生 (行號, 原始資料, 輸出列或例外) 的產生器
+    """
+    for line_no, record in births:
+        if isinstance(record, Exception):
+            yield line_no, None, record
+            continue
+        try:
+            row = convert(compute_chart(*parse_birth(record)), record, line_no)
+        except Exception as e:
+            yield line_no, record, e
+            continue
+        yield line_no, record, row
+
+
+def write_results(results, output, errors, write=None):
+    """
+    將結果寫成 JSONL（或交給 write 處理），錯誤另寫到錯誤輸出
+    :param results: chart_rows 產生的 (行號, 原始資料, 輸出列或例外)
+    :param output: 命盤輸出串流
+    :param errors: 錯誤輸出串流
+    :param write: 處理每個輸出列的函式，預設寫成一行 JSON
+    :return: (成功筆數, 失敗筆數)
+    """
+    if write is None:
+        def write(row):
+            output.write(json.dumps(row, ensure_ascii=False) + "\n")
+
+    ok = failed = 0
+    for line_no, record, row in results:
+        if isinstance(row, Exception):
+            failed += 1
+            errors.write(json.dumps({"line": line_no, "error": str(row), "record": record}, ensure_ascii=False) + "\n")
+        else:
+            ok += 1
+            write(row)
+    return ok, failed
+
+
+def run_batch(stream, output, errors, fmt="jsonl"):
+    """
+    批次處理出生資料
+    :param stream: 輸入串流
+    :param output: 命盤輸出串流
+    :param errors: 錯誤輸出串流
+    :param fmt: "jsonl" 或 "csv"
+    :return: (成功筆數, 失敗筆數)
+    """
+    return write_results(chart_rows(read_births(stream, fmt)), output, errors)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="八字批次排盤")
+    parser.add_argument("--batch", required=True, metavar="PATH", help="出生資料檔案，- 表示標準輸入")
+    parser.add_argument("--format", choices=["jsonl", "csv"], help="輸入格式（預設依副檔名判斷）")
+    parser.add_argument("--output", default="-", metavar="PATH", help="命盤輸出檔案，預設標準輸出")
+    parser.add_argument("--output-format", choices=sorted(OUTPUT_FORMATS), default="jsonl",
+                        help="輸出格式：jsonl、rows（serialize 二進位列）、npz（serialize 欄式，整批在記憶體中組成，"
+                             "筆數上限見 --npz-max-records）")
+    parser.add_argument("--npz-max-records", type=int, default=NPZ_MAX_RECORDS,
+                        help="npz 輸出的筆數上限，超過時中止（每筆約 100 位元組，存檔時加倍），"
+                             f"預設 {NPZ_MAX_RECORDS}，0 表示不限；更多筆請用 rows 格式或分檔")
+    parser.add_argument("--errors", default=None, metavar="PATH", help="錯誤輸出檔案，預設標準錯誤")
+    parser.add_argument("--workers", type=int, default=1, help="工作進程數，大於 1 時以多進程計算（0 表示 CPU 核心數）")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="多進程模式每塊筆數")
+    parser.add_argument("--unordered", action="store_true", help="多進程模式不保持輸入順序（較快）")
+    parser.add_argument("--metrics", metavar="PATH", help="結束時寫出分段統計（.prom 為 Prometheus 格式，其餘為 JSON）")
+    parser.add_argument("--profile", choices=["cprofile", "sample"], help="剖析主進程，摘要寫到標準錯誤")
+    parser.add_argument("--profile-output", metavar="PATH", help="cProfile 原始統計輸出檔")
+    return parser
+
+
+def _open(path, mode, default):
+    if path is None or path == "-":
+        return (default.buffer if "b" in mode else default), False
+    if "b" in mode:
+        return open(path, mode), True
+    return open(path, mode, encoding="utf-8", newline="" if "r" in mode else None), True
+
+
+def cli(argv, parser=None):
+    """
+    命令列進入點
+    :param argv: 命令列參數
+    :param parser: 參數解析器（預設為 build_parser()）
+    :return: 結束代碼（有任何錯誤時為 1）
+    """
+    args = (parser or build_parser()).parse_args(argv)
+    fmt = args.format or ("csv" if args.batch.lower().endswith(".csv") else "jsonl")
+    stream, close_stream = _open(args.batch, "r", sys.stdin)
+    binary = args.output_format != "jsonl"
+    output, close_output = _open(args.output, "wb" if binary else "w", sys.stdout)
+    errors, close_errors = _open(args.errors, "w", sys.stderr)
+    convert = OUTPUT_FORMATS[args.output_format]
+    if args.metrics or args.profile:
+        metrics.enable()
+
+    def work():
+        if args.workers == 1:
+            results = chart_rows(read_births(stream, fmt), convert)
+        else:
+            from parallel import parallel_chart_rows
+
+            results = parallel_chart_rows(read_births(stream, fmt), workers=args.workers or None,
+                                          chunk_size=args.chunk_size, ordered=not args.unordered, convert=convert)
+        if args.output_format == "rows":
+            output.write(serialize.MAGIC)
+            return write_results(results, output, errors, output.write)
+        if args.output_format == "npz":
+            columns = serialize.ColumnWriter(max_records=args.npz_max_records or None)
+            try:
+                counts = write_results(results, output, errors, columns.append)
+            except ValueError as e:
+                raise SystemExit(f"錯誤: {e}（可調整 --npz-max-records）")
+            columns.save(output)
+            return counts
+        return write_results(results, output, errors)
+
+    try:
+        if args.profile == "cprofile":
+            (ok, failed), report = metrics.profile_cprofile(work, output=args.profile_output)
+            print(report, file=sys.stderr)
+        elif args.profile == "sample":
+            with metrics.SamplingProfiler() as profiler:
+                ok, failed = work()
+            print(profiler.report(), file=sys.stderr)
+        else:
+            ok, failed = work()
+    finally:
+        for f, should_close in ((stream, close_stream), (output, close_output), (errors, close_errors)):
+            if should_close:
+                f.close()
+    if args.metrics:
+        metrics.write(args.metrics)
+    print(f"完成 {ok} 筆，失敗 {failed} 筆", file=sys.stderr)
+    return 1 if failed else 0
@@ -0,0 +1,607 @@
+# 編碼表：將 config.basic / config.relation 編譯成以整數索引的查找表，並在整數編碼上分析八字
+#
+# 天干編碼 0-9、地支編碼 0-11（順序同 basic.heavenly_stems / basic.earthly_branches），
+# 五行編碼 1-5，0 表示無。所有關係由 RULES 規則表編譯為扁平查找表：雙元以 a * 邊長 + b 索引，
+# 三元以 (a * 邊長 + b) * 邊長 + c 索引（邊長 10 或 12）。
+#
+# 規則編譯結果會快照於 __pycache__/codes_tables.bin，規則雜湊相符時下次啟動直接載入；
+# 部署到唯讀環境前可先執行 `python codes.py` 產生快照。
+
+import marshal
+import os
+import sys
+import zlib
+from functools import lru_cache
+from itertools import permutations, product
+
+from config import basic, relation
+import metrics
+
+STEMS = tuple(basic.heavenly_stems)
+BRANCHES = tuple(basic.earthly_branches)
+ELEMENTS = (None, "木", "火", "土", "金", "水")
+
+STEM_CODE = {stem: i for i, stem in enumerate(STEMS)}
+BRANCH_CODE = {branch: i for i, branch in enumerate(BRANCHES)}
+ELEMENT_CODE = {element: i for i, element in enumerate(ELEMENTS) if element}
+
+# 地支 12 位元遮罩
+BRANCH_BIT = tuple(1 << i for i in range(12))
+
+# 位置：0-3 為本命四柱，4 為大運，5 為流年或流月
+POSITIONS = ("年", "月", "日", "時", "運", "流")
+LUCK = 4
+FLOW = 5
+
+# 關係種類
+LIU_HE = 0  # 地支六合
+HALF_COMBINE = 1  # 地支半三合
+ARCH_COMBINE = 2  # 地支拱合
+THREE_COMBINE = 3  # 地支三合
+HE = 4  # 天干相合
+XING = 5  # 地支相刑（含自刑）
+CHONG = 6  # 地支相沖
+HAI = 7  # 地支相害
+RELATION_NAMES = ("六合", "半三合", "拱", "三合", "合", "刑", "沖", "害")
+
+# 地支藏干（天干編碼）
+HIDDEN_STEMS = tuple(tuple(STEM_CODE[stem] for stem in basic.hidden_stems[branch]) for branch in BRANCHES)
+
+# 文昌貴人：日干 -> 地支編碼
+WEN_CHANG = bytes(BRANCH_CODE[relation.wen_chang_table[stem]] for stem in STEMS)
+
+
+# 關係規則：(種類, 部位, 元數, 查找表, 成立條件)
+#   部位 "干" / "支"；元數 2 或 3
+#   成立條件 "adjacency"：查找表為 {x: [y, ...]}，y 在 x 的列表中即成立（與原 analyze_bazi 相同，依出現先後查表）
+#   成立條件 "element"：查找表為 {(x, y[, z]): 五行}，不分先後，有對應五行即成立
+#   合化五行另由 ELEMENT_SOURCES 查詢
+# 新增規則（例如三會）只需在 config.py 加表並在此加一行，不需新增迴圈。
+RULES = (
+    (HE, "干", 2, relation.heavenly_relations["合"], "adjacency"),
+    (LIU_HE, "支", 2, relation.branch_relations["六合"], "adjacency"),
+    (HALF_COMBINE, "支", 2, relation.branch_half_combine, "element"),
+    (ARCH_COMBINE, "支", 2, relation.branch_arch_combine, "element"),
+    (XING, "支", 2, relation.branch_relations["刑"], "adjacency"),
+    (CHONG, "支", 2, relation.branch_relations["沖"], "adjacency"),
+    (HAI, "支", 2, relation.branch_relations["害"], "adjacency"),
+    (THREE_COMBINE, "支", 3, relation.branch_three_combine_elements, "element"),
+)
+
+# adjacency 規則的合化五行來源（不分先後）
+ELEMENT_SOURCES = {
+    HE: relation.heavenly_relations_elements,
+    LIU_HE: relation.branch_relations_elements,
+}
+
+
+def compile_rules(rules=RULES):
+    """
+    將規則編譯為扁平查找表：每個 (a, b) 或 (a, b, c) 格子存放所有成立規則的 (種類, 五行編碼)，
+    評估時一格一次查表，規則再多也不增加迴圈
+    :param rules: 規則列表
+    :return: {部位: (雙元表, 三元表, 雙元組合是否可能構成三元關係)}
+    """
+    compiled = {}
+    for part, names in (("干", STEM_CODE), ("支", BRANCH_CODE)):
+        size = len(names)
+        pairs = [[] for _ in range(size * size)]
+        triples = [[] for _ in range(size ** 3)]
+        for kind, rule_part, arity, table, mode in rules:
+            if rule_part != part:
+                continue
+            elements = {}
+            for key, value in ELEMENT_SOURCES.get(kind, {}).items():
+                elements[frozenset(key)] = ELEMENT_CODE[value]
+            if mode == "adjacency":
+                for x, ys in table.items():
+                    for y in ys:
+                        a, b = names[x], names[y]
+                        pairs[a * size + b].append((kind, elements.get(frozenset((x, y)), 0)))
+                continue
+            for key, value in table.items():
+                key_codes = [names[x] for x in key]
+                if arity == 2:
+                    cells = {key_codes[0] * size + key_codes[1], key_codes[1] * size + key_codes[0]}
+                    target = pairs
+                else:
+                    cells = {(a * size + b) * size + c for a, b, c in permutations(key_codes)}
+                    target = triples
+                for cell in cells:
+                    target[cell].append((kind, ELEMENT_CODE[value]))
+        # 依規則順序排列（同一格內的輸出順序固定）
+        order = {rule[0]: i for i, rule in enumerate(rules)}
+        pairs = tuple(tuple(sorted(hits, key=lambda h: order[h[0]])) for hits in pairs)
+        triples = tuple(tuple(sorted(hits, key=lambda h: order[h[0]])) for hits in triples)
+        possible = bytes(
+            any(triples[(a * size + b) * size + c] for c in range(size)) for a in range(size) for b in range(size)
+        )
+        compiled[part] = (pairs, triples, possible)
+    return compiled
+
+
+# 編譯結果快照：快照內存有規則內容（及 compile_rules 程式）的雜湊，與目前的規則相符時直接載入
+# （約 0.1 ms，重新編譯約 2 ms），不依賴檔案修改時間；快照不存在或不符時重新編譯並寫回，
+# 無法寫入（唯讀目錄等）或設定 PYTHONDONTWRITEBYTECODE 時不寫
+SNAPSHOT_VERSION = 2
+_HERE = os.path.dirname(os.path.abspath(__file__))
+SNAPSHOT_PATH = os.path.join(_HERE, "__pycache__", "codes_tables.bin")
+
+
+def rules_hash(rules=RULES):
+    """
+    規則內容的雜湊：規則表、合化五行來源、干支及五行編碼，加上 compile_rules 的程式碼
+    :param rules: 規則列表
+    :return: 32 位元整數
+    """
+    source = repr((rules, ELEMENT_SOURCES, STEM_CODE, BRANCH_CODE, ELEMENT_CODE)).encode("utf-8")
+    return _code_hash(compile_rules.__code__, zlib.crc32(source))
+
+
+def _code_hash(code, crc):
+    # 位元組碼、引用的名稱及常數（含巢狀函式）；不用 marshal.dumps，其輸出會因物件參照次數而不同
+    crc = zlib.crc32(code.co_code, crc)
+    crc = zlib.crc32(repr(code.co_names).encode("utf-8"), crc)
+    for const in code.co_consts:
+        if hasattr(const, "co_code"):
+            crc = _code_hash(const, crc)
+        else:
+            crc = zlib.crc32(repr(const).encode("utf-8"), crc)
+    return crc
+
+
+def _snapshot_key():
+    return SNAPSHOT_VERSION, marshal.version, sys.version_info[:2], rules_hash()
+
+
+def load_snapshot(path=SNAPSHOT_PATH):
+    """
+    讀取規則編譯結果的快照
+    :param path: 快照路徑
+    :return: 與 compile_rules() 相同的結果；快照不存在、規則雜湊不符或損壞時回傳 None
+    """
+    try:
+        with open(path, "rb") as f:
+            key, compiled = marshal.loads(f.read())
+    except (OSError, EOFError, ValueError, TypeError):
+        return None
+    return compiled if key == _snapshot_key() else None
+
+
+def freeze(path=SNAPSHOT_PATH, compiled=None):
+    """
+    將規則編譯結果寫成快照（先寫暫存檔再以 os.replace 改名，多個進程同時啟動也不會讀到寫一半的檔案；
+    寫入失敗時刪除暫存檔）
+    :param path: 快照路徑
+    :param compiled: compile_rules() 的結果，預設重新編譯
+    :return: 快照路徑
+    """
+    compiled = compile_rules() if compiled is None else compiled
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(temp, "wb") as f:
+            marshal.dump((_snapshot_key(), compiled), f)
+        os.replace(temp, path)
+    except BaseException:
+        try:
+            os.remove(temp)
+        except OSError:
+            pass
+        raise
+    return path
+
+
+def _load_compiled():
+    # 匯入時寫快照失敗（唯讀目錄、磁碟已滿等）不影響使用，直接用剛編譯的結果
+    compiled = load_snapshot()
+    if compiled is None:
+        compiled = compile_rules()
+        if not sys.dont_write_bytecode:
+            try:
+                freeze(compiled=compiled)
+            except OSError:
+                pass
+    return compiled
+
+
+_COMPILED = _load_compiled()
+STEM_PAIR_HITS, STEM_TRIPLE_HITS, STEM_TRIPLE_POSSIBLE = _COMPILED["干"]
+BRANCH_PAIR_HITS, BRANCH_TRIPLE_HITS, BRANCH_TRIPLE_POSSIBLE = _COMPILED["支"]
+
+
+class Relation:
+    """
+    一筆干支關係：種類、所在位置、參與的干支編碼及合化五行，需要時才產生文字
+    """
+    __slots__ = ("kind", "positions", "codes", "element")
+
+    def __init__(self, kind, positions, codes, element):
+        self.kind = kind  # 關係種類 (LIU_HE, HALF_COMBINE, ...)
+        self.positions = positions  # 位置 tuple，見 POSITIONS
+        self.codes = codes  # 參與的天干或地支編碼
+        self.element = element  # 合化五行編碼，0 表示無
+
+    @property
+    def is_stem(self):
+        return self.kind == HE
+
+    @property
+    def name(self):
+        return RELATION_NAMES[self.kind]
+
+    def render(self):
+        """
+        產生與 analyze_bazi 相同格式的文字，例如 "年支 子 六合 月支 丑 化為 土"
+        :return: str
+        """
+        if self.is_stem:
+            names, part = STEMS, "干"
+        else:
+            names, part = BRANCHES, "支"
+        terms = [f"{POSITIONS[p]}{part} {names[c]}" for p, c in zip(self.positions, self.codes)]
+        if len(terms) == 3:
+            text = f"{' '.join(terms)} {self.name}"
+            return f"{text}化為 {ELEMENTS[self.element]}" if self.element else text
+        text = f"{terms[0]} {self.name} {terms[1]}"
+        return f"{text} 化為 {ELEMENTS[self.element]}" if self.element else text
+
+    __str__ = render
+
+    def _key(self):
+        return self.kind, self.positions, self.codes, self.element
+
+    def __eq__(self, other):
+        return isinstance(other, Relation) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+    def __repr__(self):
+        return f"Relation({self.name}, positions={self.positions}, codes={self.codes}, element={ELEMENTS[self.element]})"
+
+
+class ChartAnalysis:
+    """
+    八字分析結果（整數編碼），以 render_analysis 轉成原本的字串字典
+    """
+    __slots__ = ("stems", "branches", "hidden_stems", "heavenly_relations", "branch_relations",
+                 "wen_chang", "wen_chang_positions")
+
+    def __init__(self, stems, branches, hidden_stems, heavenly_relations, branch_relations,
+                 wen_chang, wen_chang_positions):
+        self.stems = stems  # 天干編碼 (年, 月, 日, 時)
+        self.branches = branches  # 地支編碼 (年, 月, 日, 時)
+        self.hidden_stems = hidden_stems  # 各地支藏干編碼
+        self.heavenly_relations = heavenly_relations  # 天干關係 (Relation, ...)
+        self.branch_relations = branch_relations  # 地支關係 (Relation, ...)
+        self.wen_chang = wen_chang  # 日干文昌貴人所在地支編碼
+        self.wen_chang_positions = wen_chang_positions  # 文昌貴人在八字中出現的位置
+
+    @property
+    def relations(self):
+        return self.heavenly_relations + self.branch_relations
+
+    def __repr__(self):
+        pillars = " ".join(STEMS[s] + BRANCHES[b] for s, b in zip(self.stems, self.branches))
+        return f"ChartAnalysis({pillars}, relations={len(self.heavenly_relations) + len(self.branch_relations)})"
+
+
+def render_analysis(analysis):
+    """
+    將 ChartAnalysis 轉為 analyze_bazi 原本的字串字典
+    :param analysis: ChartAnalysis
+    :return: {"hidden_stems", "heavenly_relations", "branch_relations", "wen_chang"}
+    """
+    stems, branches = analysis.stems, analysis.branches
+    return {
+        "hidden_stems": [
+            {f"{POSITIONS[i]}支 {BRANCHES[branches[i]]}": [STEMS[s] for s in hidden]}
+            for i, hidden in enumerate(analysis.hidden_stems)
+        ],
+        "heavenly_relations": [r.render() for r in analysis.heavenly_relations],
+        "branch_relations": [r.render() for r in analysis.branch_relations],
+        "wen_chang": {
+            "day_stem": STEMS[stems[2]],
+            "location": BRANCHES[analysis.wen_chang],
+            "found_positions": [f"{POSITIONS[i]}支" for i in analysis.wen_chang_positions],
+        },
+    }
+
+
+def branch_mask(branches):
+    """
+    計算地支集合的 12 位元遮罩
+    :param branches: 地支編碼序列
+    :return: int
+    """
+    mask = 0
+    for b in branches:
+        mask |= BRANCH_BIT[b]
+    return mask
+
+
+# 六十甲子：干支組合編碼 0-59，甲子為 0
+JIA_ZI = tuple(STEMS[i % 10] + BRANCHES[i % 12] for i in range(60))
+
+
+def pillar_code(stem, branch):
+    """
+    由天干、地支編碼求六十甲子編碼（可為 NumPy 陣列）
+    :param stem: 天干編碼
+    :param branch: 地支編碼
+    :return: 0-59
+    """
+    return (6 * stem - 5 * branch) % 60
+
+
+def encode_bazi(heavenly_stems, earthly_branches):
+    """
+    將天干地支字串轉為編碼
+    :param heavenly_stems: 天干列表
+    :param earthly_branches: 地支列表
+    :return: (天干編碼 tuple, 地支編碼 tuple)
+    """
+    try:
+        stems = tuple(STEM_CODE[stem] for stem in heavenly_stems)
+    except KeyError as e:
+        raise ValueError(f"無效的天干: {e.args[0]}") from None
+    try:
+        branches = tuple(BRANCH_CODE[branch] for branch in earthly_branches)
+    except KeyError as e:
+        raise ValueError(f"無效的地支: {e.args[0]}") from None
+    return stems, branches
+
+
+def evaluate(values, pair_hits, triple_hits, triple_possible, size, positions=None):
+    """
+    對一串天干或地支一次評估所有規則
+    :param values: 天干或地支編碼序列（本命四柱，或再加上大運、流年等）
+    :param pair_hits: 編譯後的雙元表
+    :param triple_hits: 編譯後的三元表
+    :param triple_possible: 雙元組合是否可能構成三元關係
+    :param size: 10（天干）或 12（地支）
+    :param positions: 各值的位置編號，預設為 0, 1, 2, ...
+    :return: (Relation, ...)；每對 (i, j) 先列雙元關係，再列以其開頭的三元關係
+    """
+    hits = []
+    n = len(values)
+    if positions is None:
+        positions = range(n)
+    for i in range(n):
+        a = values[i]
+        pi = positions[i]
+        row = a * size
+        for j in range(i + 1, n):
+            b = values[j]
+            pj = positions[j]
+            for kind, element in pair_hits[row + b]:
+                hits.append(Relation(kind, (pi, pj), (a, b), element))
+            if triple_possible[row + b]:
+                plane = (row + b) * size
+                for k in range(j + 1, n):
+                    c = values[k]
+                    for kind, element in triple_hits[plane + c]:
+                        hits.append(Relation(kind, (pi, pj, positions[k]), (a, b, c), element))
+    return tuple(hits)
+
+
+def analyze_stems(stems, positions=None):
+    """
+    分析天干關係
+    :param stems: 天干編碼 (年, 月, 日, 時)
+    :param positions: 各天干的位置編號
+    :return: (Relation, ...)
+    """
+    return evaluate(stems, STEM_PAIR_HITS, STEM_TRIPLE_HITS, STEM_TRIPLE_POSSIBLE, 10, positions)
+
+
+def analyze_branches(branches, positions=None):
+    """
+    分析地支關係（六合、半三合、拱、刑、沖、害、三合）
+    :param branches: 地支編碼 (年, 月, 日, 時)
+    :param positions: 各地支的位置編號
+    :return: (Relation, ...)
+    """
+    return evaluate(branches, BRANCH_PAIR_HITS, BRANCH_TRIPLE_HITS, BRANCH_TRIPLE_POSSIBLE, 12, positions)
+
+
+def evaluate_last(values, pair_hits, triple_hits, triple_possible, size, positions=None):
+    """
+    只評估涉及最後一個值的關係（前面各值之間的關係已另外算好時使用）
+    :param values: 天干或地支編碼序列
+    :return: (Relation, ...)；參數同 evaluate
+    """
+    hits = []
+    n = len(values)
+    if positions is None:
+        positions = range(n)
+    c = values[-1]
+    pc = positions[-1]
+    for i in range(n - 1):
+        a = values[i]
+        pi = positions[i]
+        row = a * size
+        for j in range(i + 1, n - 1):
+            b = values[j]
+            if triple_possible[row + b]:
+                for kind, element in triple_hits[(row + b) * size + c]:
+                    hits.append(Relation(kind, (pi, positions[j], pc), (a, b, c), element))
+        for kind, element in pair_hits[row + c]:
+            hits.append(Relation(kind, (pi, pc), (a, c), element))
+    return tuple(hits)
+
+
+def evaluation_order(r):
+    """
+    evaluate 的輸出順序：依前兩個位置，雙元關係在前，三元關係依第三個位置；分段算出的關係合併後以此排序
+    :param r: Relation
+    :return: 排序鍵
+    """
+    return r.positions[0], r.positions[1], len(r.positions), r.positions[2:]
+
+
+def analyze_hour_candidates(stems, branches, hours):
+    """
+    時辰不詳時，一次分析同一天的多個候選時柱：年、月、日三柱之間的關係只算一次，
+    每個候選時柱只評估與時柱有關的關係
+    :param stems: 年、月、日干編碼
+    :param branches: 年、月、日支編碼
+    :param hours: 候選時柱 [(時干編碼, 時支編碼), ...]
+    :return: [ChartAnalysis, ...]，與 hours 一一對應，結果與 analyze_codes 相同
+    """
+    stems = tuple(stems)
+    branches = tuple(branches)
+    fixed_stem = analyze_stems(stems)
+    fixed_branch = analyze_branches(branches)
+    hidden = tuple(HIDDEN_STEMS[b] for b in branches)
+    wen_chang = WEN_CHANG[stems[2]]
+    wen_chang_positions = tuple(i for i, b in enumerate(branches) if b == wen_chang)
+
+    results = []
+    for hour_stem, hour_branch in hours:
+        stems4 = stems + (hour_stem,)
+        branches4 = branches + (hour_branch,)
+        stem_relations = fixed_stem + evaluate_last(stems4, STEM_PAIR_HITS, STEM_TRIPLE_HITS, STEM_TRIPLE_POSSIBLE, 10)
+        branch_relations = fixed_branch + evaluate_last(
+            branches4, BRANCH_PAIR_HITS, BRANCH_TRIPLE_HITS, BRANCH_TRIPLE_POSSIBLE, 12
+        )
+        results.append(ChartAnalysis(
+            stems4,
+            branches4,
+            hidden + (HIDDEN_STEMS[hour_branch],),
+            tuple(sorted(stem_relations, key=evaluation_order)),
+            tuple(sorted(branch_relations, key=evaluation_order)),
+            wen_chang,
+            wen_chang_positions + ((3,) if hour_branch == wen_chang else ()),
+        ))
+    return results
+
+
+def group_hour_candidates(analyses):
+    """
+    將候選時柱依時柱帶來的關係分組：關係種類、位置、合化五行都相同（文昌貴人是否落在時支也相同）者為一組
+    :param analyses: analyze_hour_candidates 的結果
+    :return: [[候選序號, ...], ...]，依各組第一個候選的順序排列
+    """
+    groups = {}
+    for i, analysis in enumerate(analyses):
+        key = (
+            tuple((r.kind, r.positions, r.element) for r in analysis.relations if 3 in r.positions),
+            3 in analysis.wen_chang_positions,
+        )
+        groups.setdefault(key, []).append(i)
+    return list(groups.values())
+
+
+def relations_with(stems, branches, extra, extra_position):
+    """
+    在本命四柱之外加入一柱（大運、流年等），只取涉及該柱的關係
+    :param stems: 本命天干編碼
+    :param branches: 本命地支編碼
+    :param extra: 加入柱的六十甲子編碼
+    :param extra_position: 加入柱的位置編號 (LUCK 或 FLOW)
+    :return: (Relation, ...)
+    """
+    positions = tuple(range(len(stems))) + (extra_position,)
+    found = analyze_stems(tuple(stems) + (extra % 10,), positions) + \
+        analyze_branches(tuple(branches) + (extra % 12,), positions)
+    return tuple(r for r in found if extra_position in r.positions)
+
+
+def analyze_with_luck(stems, branches, luck_pillars):
+    """
+    分析本命八字與各步大運之間的關係
+    :param stems: 本命天干編碼
+    :param branches: 本命地支編碼
+    :param luck_pillars: 大運六十甲子編碼序列
+    :return: [(Relation, ...), ...]，與 luck_pillars 一一對應
+    """
+    return [relations_with(stems, branches, code, LUCK) for code in luck_pillars]
+
+
+def analyze_branch_half(branches):
+    """
+    分析八字的地支部分（只依賴四個地支）
+    :param branches: 地支編碼 (年, 月, 日, 時)
+    :return: (藏干, 地支關係, 各地支值出現的位置)；最後一項以地支編碼索引，供查文昌貴人
+    """
+    found = [[] for _ in range(12)]
+    for i, b in enumerate(branches):
+        found[b].append(i)
+    return (
+        tuple(HIDDEN_STEMS[b] for b in branches),
+        analyze_branches(branches),
+        tuple(tuple(positions) for positions in found),
+    )
+
+
+# 分析結果快取：天干、地支兩半各自一個 LRU，大小可用環境變數或 configure_cache 調整
+DEFAULT_CACHE_SIZE = int(os.environ.get("BAZI_ANALYSIS_CACHE_SIZE", 16384))
+
+_stem_cache = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(analyze_stems)
+_branch_cache = lru_cache(maxsize=DEFAULT_CACHE_SIZE)(analyze_branch_half)
+
+# 全部 12^4 種地支組合的預先計算表（選用），以 b0 * 1728 + b1 * 144 + b2 * 12 + b3 索引
+_branch_table = None
+
+
+def precompute_branch_table():
+    """
+    預先計算全部 20736 種地支組合的分析結果
+    :return: 以地支組合索引的 tuple
+    """
+    return tuple(analyze_branch_half(quad) for quad in product(range(12), repeat=4))
+
+
+def configure_cache(maxsize=DEFAULT_CACHE_SIZE, precompute=False):
+    """
+    設定分析結果快取（會清空現有快取）
+    :param maxsize: 天干、地支兩個 LRU 快取各自的容量，None 表示不限
+    :param precompute: 是否預先計算全部地支組合
+    """
+    global _stem_cache, _branch_cache, _branch_table
+    _stem_cache = lru_cache(maxsize=maxsize)(analyze_stems)
+    _branch_cache = lru_cache(maxsize=maxsize)(analyze_branch_half)
+    _branch_table = precompute_branch_table() if precompute else None
+
+
+def cache_info():
+    """
+    取得快取命中統計
+    :return: {"stems": CacheInfo, "branches": CacheInfo, "precomputed_branches": 是否使用預先計算表}
+    """
+    return {
+        "stems": _stem_cache.cache_info(),
+        "branches": _branch_cache.cache_info(),
+        "precomputed_branches": _branch_table is not None,
+    }
+
+
+def analyze_codes(stems, branches):
+    """
+    以編碼分析八字，天干與地支兩半分別查快取後合併
+    :param stems: 天干編碼 (年, 月, 日, 時)
+    :param branches: 地支編碼 (年, 月, 日, 時)
+    :return: ChartAnalysis
+    """
+    stems = tuple(stems)
+    branches = tuple(branches)
+    if _branch_table is not None and len(branches) == 4:
+        b0, b1, b2, b3 = branches
+        hidden, branch_relations, found = _branch_table[b0 * 1728 + b1 * 144 + b2 * 12 + b3]
+    else:
+        hidden, branch_relations, found = _branch_cache(branches)
+    wen_chang = WEN_CHANG[stems[2]]
+    return ChartAnalysis(stems, branches, hidden, _stem_cache(stems), branch_relations, wen_chang, found[wen_chang])
+
+
+metrics.register_cache("analysis.stems", lambda: _stem_cache.cache_info())
+metrics.register_cache("analysis.branches", lambda: _branch_cache.cache_info())
+
+if os.environ.get("BAZI_PRECOMPUTE_BRANCHES"):
+    configure_cache(precompute=True)
+
+
+if __name__ == "__main__":
+    print(f"已寫入規則編譯快照至 {freeze()}")
@@ -167,9 +167,12 @@ class relation:
         :param branch3: 第三个地支
         :return: 三合后的五行 (如果存在三合关系)
         """
-        # 将三个地支排序，确保顺序一致
-        branches = sorted([branch1, branch2, branch3])
-        return relation.branch_three_combine_elements.get(tuple(branches), None)
+        # 三合不分順序，比較地支集合
+        branches = {branch1, branch2, branch3}
+        for group, element in relation.branch_three_combine_elements.items():
+            if set(group) == branches:
+                return element
+        return None
 
     @staticmethod
     def get_half_combine_element(branch1, branch2):
@@ -0,0 +1,140 @@
+# 逐時星曆檔：1900-2100 年每個整點一格，記錄四柱、當前節氣及距下一節氣的秒數
+#
+# 檔案為固定格式，讀取時以 mmap 映射，多個進程共用同一份頁面快取；
+# 查詢只需算出整點序號乘上格寬即可定位，不需 lunar_python 也不需 NumPy（NumPy 只在產生檔案及 slots() 時載入）。
+#
+#   python ephemeris.py            # 產生 ephemeris.bin（約 17 MB）
+#   BAZI_EPHEMERIS=/path/to/ephemeris.bin python main.py --batch ...
+
+import mmap
+import os
+import struct
+import sys
+from datetime import datetime, timedelta
+
+import codes
+import jieqi
+
+DEFAULT_PATH = os.environ.get(
+    "BAZI_EPHEMERIS", os.path.join(os.path.dirname(os.path.abspath(__file__)), "ephemeris.bin")
+)
+EPOCH = datetime(1970, 1, 1)
+
+# 檔頭：魔數、格寬、格數、第一格的秒數、節氣表筆數、節氣表第一筆秒數（用來確認與 jieqi_table.bin 一致）
+_HEADER = struct.Struct("<4sHIqIq")
+_MAGIC = b"EPH1"
+
+# 每格：年、月、日、時柱的六十甲子編碼，整點時的節氣序號（jieqi 表索引），整點距下一節氣的秒數
+SLOT = struct.Struct("<4BHi")
+SLOT_DTYPE = [("pillars", "u1", 4), ("term", "<u2"), ("to_next", "<i4")]  # NumPy 結構陣列格式
+
+
+def build(path=DEFAULT_PATH, first_year=jieqi.FIRST_YEAR, last_year=jieqi.LAST_YEAR):
+    """
+    產生逐時星曆檔
+    :param path: 輸出檔案路徑
+    :param first_year: 起始西元年
+    :param last_year: 結束西元年
+    :return: 格數
+    """
+    import numpy as np
+
+    from batch import bazi_batch
+
+    first_index, seconds = jieqi.jie_qi_seconds()
+    term_seconds = np.asarray(seconds, dtype=np.int64)
+    first = int((datetime(first_year, 1, 1) - EPOCH).total_seconds())
+    last = int((datetime(last_year + 1, 1, 1) - EPOCH).total_seconds())
+    hours = np.arange(first, last, 3600, dtype=np.int64)
+
+    slots = np.empty(len(hours), dtype=SLOT_DTYPE)
+    stems, branches = bazi_batch(hours.astype("datetime64[s]"))
+    slots["pillars"] = codes.pillar_code(stems.astype(np.int16), branches.astype(np.int16))
+    term = np.searchsorted(term_seconds, hours, side="right") - 1
+    slots["term"] = term
+    slots["to_next"] = term_seconds[term + 1] - hours
+
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, SLOT.size, len(slots), first, len(term_seconds), int(term_seconds[0])))
+        f.write(slots.tobytes())
+    return len(slots)
+
+
+class Ephemeris:
+    """
+    以 mmap 讀取的逐時星曆
+    """
+
+    def __init__(self, path=DEFAULT_PATH):
+        with open(path, "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, slot_size, self.count, self.first, term_count, term_first = _HEADER.unpack_from(self._mm, 0)
+        if magic != _MAGIC or slot_size != SLOT.size:
+            raise ValueError(f"不是星曆檔案: {path}")
+        _, seconds = jieqi.jie_qi_seconds()
+        if term_count != len(seconds) or term_first != seconds[0]:
+            raise ValueError(f"星曆檔與節氣表不一致，請重新執行 python ephemeris.py: {path}")
+        self._seconds = seconds
+        self.start = EPOCH + timedelta(seconds=self.first)
+        self.end = self.start + timedelta(hours=self.count)
+
+    def close(self):
+        self._mm.close()
+
+    def slots(self):
+        """
+        以 NumPy 結構陣列檢視全部格子（不複製），供向量化查詢
+        :return: SLOT_DTYPE 陣列
+        """
+        import numpy as np
+
+        return np.frombuffer(self._mm, dtype=SLOT_DTYPE, count=self.count, offset=_HEADER.size)
+
+    def lookup(self, birth_time):
+        """
+        查詢某時刻的四柱與前後節氣
+        :param birth_time: datetime
+        :return: (四柱六十甲子編碼 tuple, 當前節氣表索引, 距當前節氣, 距下一節氣)；超出範圍時回傳 None
+        """
+        t = (birth_time - EPOCH) // timedelta(seconds=1)
+        slot, within = divmod(t - self.first, 3600)
+        if not 0 <= slot < self.count:
+            return None
+        y, m, d, h, term, to_next = SLOT.unpack_from(self._mm, _HEADER.size + slot * SLOT.size)
+        # 節氣可能在這個小時內交接
+        if within >= to_next:
+            term += 1
+        seconds = self._seconds
+        return (y, m, d, h), term, timedelta(seconds=t - seconds[term]), timedelta(seconds=seconds[term + 1] - t)
+
+
+_UNLOADED = object()
+_default = _UNLOADED
+
+
+def default():
+    """
+    取得共用的星曆（首次呼叫時映射 DEFAULT_PATH）。檔案是否存在只檢查一次，之後的呼叫不再存取檔案系統；
+    之後才產生的星曆檔需呼叫 reload() 載入
+    :return: Ephemeris；檔案不存在時回傳 None
+    """
+    global _default
+    if _default is _UNLOADED:
+        _default = Ephemeris(DEFAULT_PATH) if os.path.exists(DEFAULT_PATH) else None
+    return _default
+
+
+def reload():
+    """
+    重新檢查並映射 DEFAULT_PATH（例如執行期間才產生星曆檔）；已取得的舊 Ephemeris 仍可繼續使用
+    :return: Ephemeris；檔案不存在時回傳 None
+    """
+    global _default
+    _default = _UNLOADED
+    return default()
+
+
+if __name__ == "__main__":
+    target = sys.argv[1] if len(sys.argv) > 1 else DEFAULT_PATH
+    count = build(target)
+    print(f"已寫入 {count} 格至 {target}")
@@ -0,0 +1,468 @@
+# 特徵位元索引：每張命盤編碼為固定寬度的位元集合（四柱干支、各種關係及其位置、合化五行、藏干、文昌貴人），
+# 存成磁碟上的 uint64 陣列，以 mmap 讀取，支援 AND / OR / NOT 條件查詢及 Hamming / Jaccard 相似度 top-k。
+#
+# 關係只依兩柱或三柱的干支決定，因此每組柱位各有一張「干支組合 -> 位元」的查找表，
+# 整批命盤以查表後 OR 起來即可編碼，不必逐張分析；查詢時也只掃描位元，不重新分析。
+#
+#   python feature_index.py build --charts charts.jsonl --output corpus.idx
+#   python feature_index.py query corpus.idx 合:丙辛 三合:寅午戌 文昌@時
+#   python feature_index.py similar corpus.idx --pillars 庚午 甲申 壬子 丁未 -k 10
+#
+# 特徵名稱：
+#   年干:甲 / 月支:子           四柱干支
+#   合:丙辛 / 三合:寅午戌        關係（干支順序不拘）
+#   六合@年時                   某種關係出現在某些柱位之間
+#   合化:土 / 化:土             某種關係（或任一關係）合化為某五行
+#   藏干:甲 / 日支藏:甲          藏干
+#   文昌 / 文昌@時              文昌貴人出現（於某柱）
+
+import argparse
+import json
+import os
+import sys
+from itertools import combinations
+
+import numpy as np
+
+import codes
+from batch import bazi_batch
+
+WORD_BITS = 64
+_BLOCK = 1 << 18  # 掃描時每塊列數
+
+
+def _relation_keys():
+    """
+    由編譯後的規則表列出所有可能的關係（種類, 已排序干支編碼）
+    """
+    keys = set()
+    for hits, size in ((codes.STEM_PAIR_HITS, 10), (codes.BRANCH_PAIR_HITS, 12)):
+        for cell, cell_hits in enumerate(hits):
+            for kind, _ in cell_hits:
+                keys.add((kind, tuple(sorted(divmod(cell, size)))))
+    for cell, cell_hits in enumerate(codes.BRANCH_TRIPLE_HITS):
+        a, rest = divmod(cell, 144)
+        for kind, _ in cell_hits:
+            keys.add((kind, tuple(sorted((a,) + divmod(rest, 12)))))
+    return sorted(keys)
+
+
+def _terms(kind, key_codes):
+    names = codes.STEMS if kind == codes.HE else codes.BRANCHES
+    return "".join(names[c] for c in key_codes)
+
+
+def _positions(positions):
+    return "".join(codes.POSITIONS[p] for p in positions)
+
+
+class FeatureSpace:
+    """
+    特徵名稱與位元位置的對應，以及批次編碼用的查找表
+    """
+
+    def __init__(self):
+        names = []
+        for i in range(4):
+            names += [f"{codes.POSITIONS[i]}干:{s}" for s in codes.STEMS]
+        for i in range(4):
+            names += [f"{codes.POSITIONS[i]}支:{b}" for b in codes.BRANCHES]
+        relation_keys = _relation_keys()
+        names += [f"{codes.RELATION_NAMES[kind]}:{_terms(kind, key)}" for kind, key in relation_keys]
+
+        kinds = sorted({kind for kind, _ in relation_keys})
+        stem_kinds = sorted({kind for kind, key in relation_keys if kind == codes.HE})
+        branch_pair_kinds = sorted({kind for kind, key in relation_keys if kind != codes.HE and len(key) == 2})
+        triple_kinds = sorted({kind for kind, key in relation_keys if len(key) == 3})
+        for kind in kinds:
+            combos = combinations(range(4), 3 if kind in triple_kinds else 2)
+            names += [f"{codes.RELATION_NAMES[kind]}@{_positions(p)}" for p in combos]
+
+        element_kinds = sorted({
+            kind
+            for hits in (codes.STEM_PAIR_HITS, codes.BRANCH_PAIR_HITS, codes.BRANCH_TRIPLE_HITS)
+            for cell_hits in hits for kind, element in cell_hits if element
+        })
+        for kind in element_kinds:
+            names += [f"{codes.RELATION_NAMES[kind]}化:{e}" for e in codes.ELEMENTS[1:]]
+        names += [f"化:{e}" for e in codes.ELEMENTS[1:]]
+
+        names += [f"藏干:{s}" for s in codes.STEMS]
+        for i in range(4):
+            names += [f"{codes.POSITIONS[i]}支藏:{s}" for s in codes.STEMS]
+        names += ["文昌"] + [f"文昌@{codes.POSITIONS[i]}" for i in range(4)]
+
+        self.names = tuple(names)
+        self.bit = {name: i for i, name in enumerate(names)}
+        self.width = (len(names) + WORD_BITS - 1) // WORD_BITS  # uint64 字數
+        self.element_kinds = frozenset(element_kinds)
+        self._build_tables()
+
+    def _relation_bits(self, relation):
+        """
+        一個 Relation 對應的特徵位元
+        """
+        name = codes.RELATION_NAMES[relation.kind]
+        bits = [
+            self.bit[f"{name}:{_terms(relation.kind, tuple(sorted(relation.codes)))}"],
+            self.bit[f"{name}@{_positions(relation.positions)}"],
+        ]
+        if relation.element:
+            element = codes.ELEMENTS[relation.element]
+            bits += [self.bit[f"{name}化:{element}"], self.bit[f"化:{element}"]]
+        return bits
+
+    def _words(self, bits):
+        words = np.zeros(self.width, dtype=np.uint64)
+        for b in bits:
+            words[b // WORD_BITS] |= np.uint64(1) << np.uint64(b % WORD_BITS)
+        return words
+
+    def _build_tables(self):
+        """
+        各柱位（及柱位組合）的「干支組合 -> 位元」查找表
+        """
+        self._stem_columns = [
+            np.stack([self._words([self.bit[f"{codes.POSITIONS[i]}干:{s}"]]) for s in codes.STEMS]) for i in range(4)
+        ]
+        self._branch_columns = []
+        for i in range(4):
+            rows = []
+            for b, branch in enumerate(codes.BRANCHES):
+                bits = [self.bit[f"{codes.POSITIONS[i]}支:{branch}"]]
+                for s in codes.HIDDEN_STEMS[b]:
+                    bits += [self.bit[f"藏干:{codes.STEMS[s]}"], self.bit[f"{codes.POSITIONS[i]}支藏:{codes.STEMS[s]}"]]
+                rows.append(self._words(bits))
+            self._branch_columns.append(np.stack(rows))
+
+        def pair_table(size, hits, positions):
+            rows = []
+            for cell in range(size * size):
+                a, b = divmod(cell, size)
+                bits = []
+                for kind, element in hits[cell]:
+                    bits += self._relation_bits(codes.Relation(kind, positions, (a, b), element))
+                rows.append(self._words(bits))
+            return np.stack(rows)
+
+        self._stem_pairs = {p: pair_table(10, codes.STEM_PAIR_HITS, p) for p in combinations(range(4), 2)}
+        self._branch_pairs = {p: pair_table(12, codes.BRANCH_PAIR_HITS, p) for p in combinations(range(4), 2)}
+        self._triples = {}
+        for p in combinations(range(4), 3):
+            rows = []
+            for cell in range(12 ** 3):
+                a, rest = divmod(cell, 144)
+                b, c = divmod(rest, 12)
+                bits = []
+                for kind, element in codes.BRANCH_TRIPLE_HITS[cell]:
+                    bits += self._relation_bits(codes.Relation(kind, p, (a, b, c), element))
+                rows.append(self._words(bits))
+            self._triples[p] = np.stack(rows)
+
+        # 文昌：以 日干 * 12 + 某柱地支 索引
+        self._wen_chang = []
+        for i in range(4):
+            rows = []
+            for cell in range(120):
+                s, b = divmod(cell, 12)
+                bits = [self.bit["文昌"], self.bit[f"文昌@{codes.POSITIONS[i]}"]] if codes.WEN_CHANG[s] == b else []
+                rows.append(self._words(bits))
+            self._wen_chang.append(np.stack(rows))
+
+    def mask(self, names):
+        """
+        將特徵名稱列表轉為位元遮罩
+        :param names: 特徵名稱；關係的干支順序不拘
+        :return: (width,) uint64
+        """
+        return self._words([self.lookup(name) for name in names])
+
+    def lookup(self, name):
+        """
+        查特徵名稱的位元位置（關係的干支順序不拘）
+        :param name: 特徵名稱
+        :return: 位元位置
+        """
+        bit = self.bit.get(name)
+        if bit is None and ":" in name:
+            label, terms = name.split(":", 1)
+            table = codes.STEM_CODE if label == "合" else codes.BRANCH_CODE
+            if all(t in table for t in terms):
+                bit = self.bit.get(f"{label}:{''.join(sorted(terms, key=table.get))}")
+        if bit is None:
+            raise ValueError(f"未知的特徵: {name}")
+        return bit
+
+    def encode_analysis(self, analysis):
+        """
+        將一張命盤的分析結果編碼為位元集合（逐張路徑，供單筆查詢使用）
+        :param analysis: codes.ChartAnalysis
+        :return: (width,) uint64
+        """
+        stems, branches = analysis.stems, analysis.branches
+        bits = [self.bit[f"{codes.POSITIONS[i]}干:{codes.STEMS[s]}"] for i, s in enumerate(stems)]
+        bits += [self.bit[f"{codes.POSITIONS[i]}支:{codes.BRANCHES[b]}"] for i, b in enumerate(branches)]
+        for r in analysis.relations:
+            bits += self._relation_bits(r)
+        for i, hidden in enumerate(analysis.hidden_stems):
+            for s in hidden:
+                bits += [self.bit[f"藏干:{codes.STEMS[s]}"], self.bit[f"{codes.POSITIONS[i]}支藏:{codes.STEMS[s]}"]]
+        if analysis.wen_chang_positions:
+            bits.append(self.bit["文昌"])
+            bits += [self.bit[f"文昌@{codes.POSITIONS[i]}"] for i in analysis.wen_chang_positions]
+        return self._words(bits)
+
+    def encode_batch(self, stems, branches):
+        """
+        批次編碼（查表後 OR）
+        :param stems: 天干編碼 (N, 4)
+        :param branches: 地支編碼 (N, 4)
+        :return: (N, width) uint64
+        """
+        stems = np.asarray(stems, dtype=np.intp)
+        branches = np.asarray(branches, dtype=np.intp)
+        words = np.zeros((len(stems), self.width), dtype=np.uint64)
+        for i in range(4):
+            words |= self._stem_columns[i][stems[:, i]]
+            words |= self._branch_columns[i][branches[:, i]]
+            words |= self._wen_chang[i][stems[:, 2] * 12 + branches[:, i]]
+        for (i, j), table in self._stem_pairs.items():
+            words |= table[stems[:, i] * 10 + stems[:, j]]
+        for (i, j), table in self._branch_pairs.items():
+            words |= table[branches[:, i] * 12 + branches[:, j]]
+        for (i, j, k), table in self._triples.items():
+            words |= table[branches[:, i] * 144 + branches[:, j] * 12 + branches[:, k]]
+        return words
+
+    def decode(self, words):
+        """
+        :param words: (width,) uint64
+        :return: 特徵名稱列表
+        """
+        flat = np.unpackbits(np.asarray(words, dtype="<u8").view(np.uint8), bitorder="little")
+        return [self.names[i] for i in np.flatnonzero(flat[:len(self.names)]).tolist()]
+
+
+_space = None
+
+
+def feature_space():
+    """
+    取得共用的 FeatureSpace（首次呼叫時建表）
+    """
+    global _space
+    if _space is None:
+        _space = FeatureSpace()
+    return _space
+
+
+if hasattr(np, "bitwise_count"):
+    def popcount(words):
+        """
+        :param words: (..., width) uint64
+        :return: 每列的位元數
+        """
+        return np.bitwise_count(words).sum(axis=-1, dtype=np.int64)
+else:
+    _POPCOUNT8 = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+
+    def popcount(words):
+        """
+        :param words: (..., width) uint64
+        :return: 每列的位元數
+        """
+        as_bytes = np.ascontiguousarray(words).view(np.uint8)
+        return _POPCOUNT8[as_bytes].sum(axis=-1, dtype=np.int64)
+
+
+class FeatureIndexWriter:
+    """
+    逐塊寫入特徵索引；索引為一個目錄，內含 bits.bin（N x width 的 uint64）、ids.bin（int64）及 meta.json
+    """
+
+    def __init__(self, path, space=None):
+        self.path = path
+        self.space = space or feature_space()
+        os.makedirs(path, exist_ok=True)
+        self._bits = open(os.path.join(path, "bits.bin"), "wb")
+        self._ids = open(os.path.join(path, "ids.bin"), "wb")
+        self.count = 0
+
+    def add(self, stems, branches, ids=None):
+        """
+        加入一塊命盤
+        :param stems: 天干編碼 (N, 4)
+        :param branches: 地支編碼 (N, 4)
+        :param ids: 命盤編號 (N,) 整數，預設為流水號
+        """
+        words = self.space.encode_batch(stems, branches)
+        if ids is None:
+            ids = np.arange(self.count, self.count + len(words), dtype=np.int64)
+        self._bits.write(words.astype("<u8").tobytes())
+        self._ids.write(np.asarray(ids, dtype="<i8").tobytes())
+        self.count += len(words)
+
+    def close(self):
+        self._bits.close()
+        self._ids.close()
+        with open(os.path.join(self.path, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump({"count": self.count, "width": self.space.width, "features": self.space.names}, f,
+                      ensure_ascii=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class FeatureIndex:
+    """
+    以 mmap 讀取的特徵索引
+    """
+
+    def __init__(self, path, space=None):
+        self.space = space or feature_space()
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            meta = json.load(f)
+        if tuple(meta["features"]) != self.space.names:
+            raise ValueError(f"索引的特徵定義與目前的規則表不一致，請重新建立: {path}")
+        self.count = meta["count"]
+        shape = (self.count, meta["width"])
+        self.bits = np.memmap(os.path.join(path, "bits.bin"), dtype="<u8", mode="r", shape=shape) \
+            if self.count else np.zeros(shape, dtype=np.uint64)
+        self.ids = np.memmap(os.path.join(path, "ids.bin"), dtype="<i8", mode="r", shape=(self.count,)) \
+            if self.count else np.zeros(0, dtype=np.int64)
+
+    def _blocks(self):
+        for start in range(0, self.count, _BLOCK):
+            yield start, np.asarray(self.bits[start:start + _BLOCK])
+
+    def match(self, all_of=(), any_of=(), none_of=()):
+        """
+        條件查詢
+        :param all_of: 必須全部具有的特徵
+        :param any_of: 至少具有其一的特徵（空表示不限）
+        :param none_of: 不得具有的特徵
+        :return: 符合的列號陣列
+        """
+        required = self.space.mask(all_of)
+        optional = self.space.mask(any_of)
+        excluded = self.space.mask(none_of)
+        found = []
+        for start, block in self._blocks():
+            ok = ((block & required) == required).all(axis=1)
+            if any_of:
+                ok &= (block & optional).any(axis=1)
+            if none_of:
+                ok &= ~(block & excluded).any(axis=1)
+            found.append(np.flatnonzero(ok) + start)
+        return np.concatenate(found) if found else np.zeros(0, dtype=np.int64)
+
+    def top_k(self, query, k=10, metric="jaccard"):
+        """
+        找出與查詢位元集合最相似的 k 張命盤
+        :param query: (width,) uint64，例如 FeatureSpace.encode_analysis 的結果
+        :param k: 筆數
+        :param metric: "hamming"（相異位元數，越小越相似）或 "jaccard"（交集 / 聯集，越大越相似）
+        :return: [(列號, 分數), ...]，由最相似排起
+        """
+        if metric not in ("hamming", "jaccard"):
+            raise ValueError(f"未知的相似度: {metric}")
+        query = np.asarray(query, dtype=np.uint64)
+        best_rows = np.zeros(0, dtype=np.int64)
+        best_keys = np.zeros(0, dtype=np.float64)
+        for start, block in self._blocks():
+            if metric == "hamming":
+                scores = popcount(block ^ query).astype(np.float64)
+                keys = scores
+            else:
+                union = popcount(block | query)
+                scores = popcount(block & query) / np.maximum(union, 1)
+                keys = -scores
+            rows = np.arange(start, start + len(block), dtype=np.int64)
+            if len(keys) > k:
+                keep = np.argpartition(keys, k)[:k]
+                rows, keys = rows[keep], keys[keep]
+            best_rows = np.concatenate([best_rows, rows])
+            best_keys = np.concatenate([best_keys, keys])
+            if len(best_keys) > k:
+                keep = np.argpartition(best_keys, k)[:k]
+                best_rows, best_keys = best_rows[keep], best_keys[keep]
+        order = np.lexsort((best_rows, best_keys))
+        sign = 1 if metric == "hamming" else -1
+        return [(int(best_rows[i]), float(sign * best_keys[i])) for i in order]
+
+
+def build_from_charts(stream, path, chunk_size=100000):
+    """
+    由 main.py --batch 的輸出（JSONL，使用 id 與 pillars 欄位）建立索引；id 不是整數時以行號代替
+    :return: 寫入筆數
+    """
+    with FeatureIndexWriter(path) as writer:
+        stems, branches, ids = [], [], []
+        for line_no, line in enumerate(stream, start=1):
+            if not line.strip():
+                continue
+            chart = json.loads(line)
+            pillars = chart["pillars"]
+            stems.append([codes.STEM_CODE[p[0]] for p in pillars])
+            branches.append([codes.BRANCH_CODE[p[1]] for p in pillars])
+            chart_id = chart.get("id")
+            ids.append(chart_id if isinstance(chart_id, int) else line_no)
+            if len(stems) >= chunk_size:
+                writer.add(stems, branches, ids)
+                stems, branches, ids = [], [], []
+        if stems:
+            writer.add(stems, branches, ids)
+    return writer.count
+
+
+def build_from_datetimes(datetimes, path, chunk_size=1000000):
+    """
+    由出生時間陣列建立索引（以 batch.bazi_batch 排盤），id 為陣列中的序號
+    :return: 寫入筆數
+    """
+    datetimes = np.asarray(datetimes, dtype="datetime64[s]").ravel()
+    with FeatureIndexWriter(path) as writer:
+        for start in range(0, len(datetimes), chunk_size):
+            stems, branches = bazi_batch(datetimes[start:start + chunk_size])
+            writer.add(stems, branches)
+    return writer.count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="命盤特徵位元索引")
+    commands = parser.add_subparsers(dest="command", required=True)
+    build = commands.add_parser("build", help="由命盤 JSONL 建立索引")
+    build.add_argument("--charts", required=True, help="main.py --batch 輸出的命盤 JSONL，- 表示標準輸入")
+    build.add_argument("--output", required=True, help="索引目錄")
+    query = commands.add_parser("query", help="條件查詢")
+    query.add_argument("index")
+    query.add_argument("features", nargs="*", help="必須全部具有的特徵")
+    query.add_argument("--any", nargs="*", default=[], help="至少具有其一的特徵")
+    query.add_argument("--none", nargs="*", default=[], help="不得具有的特徵")
+    query.add_argument("--limit", type=int, default=100)
+    similar = commands.add_parser("similar", help="相似命盤 top-k")
+    similar.add_argument("index")
+    similar.add_argument("--pillars", nargs=4, required=True, metavar="干支", help="年柱 月柱 日柱 時柱")
+    similar.add_argument("-k", type=int, default=10)
+    similar.add_argument("--metric", choices=["jaccard", "hamming"], default="jaccard")
+    commands.add_parser("features", help="列出全部特徵名稱")
+    args = parser.parse_args()
+
+    if args.command == "build":
+        stream = sys.stdin if args.charts == "-" else open(args.charts, encoding="utf-8")
+        print(f"已寫入 {build_from_charts(stream, args.output)} 筆", file=sys.stderr)
+    elif args.command == "features":
+        print("\n".join(feature_space().names))
+    elif args.command == "query":
+        index = FeatureIndex(args.index)
+        rows = index.match(args.features, args.any, args.none)
+        print(json.dumps({"count": len(rows), "ids": index.ids[rows[:args.limit]].tolist()}, ensure_ascii=False))
+    else:
+        index = FeatureIndex(args.index)
+        stems, branches = codes.encode_bazi([p[0] for p in args.pillars], [p[1] for p in args.pillars])
+        query_bits = index.space.encode_analysis(codes.analyze_codes(stems, branches))
+        for row, score in index.top_k(query_bits, args.k, args.metric):
+            print(json.dumps({"id": int(index.ids[row]), "score": score}, ensure_ascii=False))
@@ -0,0 +1,178 @@
+# 節氣時刻表：預先計算 1900-2100 年每個節氣的交節時刻，以二分搜尋查找前後節氣
+#
+# 執行 `python jieqi.py` 會用 lunar_python 重新產生 jieqi_table.bin；
+# 查表時完全不需要 lunar_python。
+
+import os
+import struct
+from array import array
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+
+# 二十四節氣名稱，順序與 lunar_python 的 Lunar.JIE_QI 一致（由冬至起算）
+JIE_QI_NAMES = ("冬至", "小寒", "大寒", "立春", "雨水", "惊蛰", "春分", "清明", "谷雨", "立夏", "小满", "芒种",
+                "夏至", "小暑", "大暑", "立秋", "处暑", "白露", "秋分", "寒露", "霜降", "立冬", "小雪", "大雪")
+
+# 節（月令交接）在 JIE_QI_NAMES 中的索引為奇數：小寒、立春、惊蛰 ...
+JIE_NAMES = JIE_QI_NAMES[1::2]
+
+FIRST_YEAR = 1900
+LAST_YEAR = 2100
+
+TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "jieqi_table.bin")
+
+# 檔頭：魔數、起始年、第一筆節氣名稱索引、節氣筆數、正月初一筆數；
+# 其後為節氣時刻 int64 (little-endian) 秒數，再接各年正月初一的 int32 日數（皆自 1970-01-01 起算）
+_HEADER = struct.Struct("<4sHHII")
+_MAGIC = b"JQT2"
+EPOCH = datetime(1970, 1, 1)
+
+
+def _to_little_endian(values):
+    if struct.pack("=i", 1) != struct.pack("<i", 1):
+        values.byteswap()
+    return values
+
+
+def build_table(first_year=FIRST_YEAR, last_year=LAST_YEAR, path=TABLE_PATH):
+    """
+    使用 lunar_python 計算節氣時刻及正月初一日期並寫入二進位表
+    :param first_year: 起始西元年
+    :param last_year: 結束西元年
+    :param path: 輸出檔案路徑
+    :return: 寫入的節氣筆數
+    """
+    from lunar_python import Lunar, LunarYear, Solar
+
+    seconds = array("q")
+    new_year_days = array("i")
+
+    def append(julian_day):
+        ymd_hms = Solar.fromJulianDay(julian_day).toYmdHms()
+        instant = datetime.strptime(ymd_hms, "%Y-%m-%d %H:%M:%S")
+        seconds.append(int((instant - EPOCH).total_seconds()))
+
+    # 每年取 小寒 ~ 冬至 共 24 個；開頭多取前一年的大雪、冬至，結尾多取後一年小寒，
+    # 使範圍內任一時刻都同時有上一個和下一個節氣，也都落在某個「節」之後
+    for year in range(first_year, last_year + 1):
+        julian_days = LunarYear.fromYear(year).getJieQiJulianDays()
+        if year == first_year:
+            append(julian_days[0])  # 前一年大雪
+            append(julian_days[1])  # 前一年冬至
+        for i in range(2, 26):  # 小寒 ~ 冬至
+            append(julian_days[i])
+        if year == last_year:
+            append(julian_days[26])  # 後一年小寒
+
+        new_year = Lunar.fromYmd(year, 1, 1).getSolar()
+        new_year_days.append((datetime(new_year.getYear(), new_year.getMonth(), new_year.getDay()) - EPOCH).days)
+
+    if seconds.itemsize != 8 or new_year_days.itemsize != 4:
+        raise RuntimeError("int64/int32 array not supported on this platform")
+    with open(path, "wb") as f:
+        f.write(_HEADER.pack(_MAGIC, first_year, JIE_QI_NAMES.index("大雪"), len(seconds), len(new_year_days)))
+        f.write(_to_little_endian(seconds).tobytes())
+        f.write(_to_little_endian(new_year_days).tobytes())
+    return len(seconds)
+
+
+def load_table(path=TABLE_PATH):
+    """
+    讀取節氣時刻表
+    :param path: 表格檔案路徑
+    :return: (起始年, 第一筆節氣名稱索引, 節氣時刻秒數陣列, 正月初一日數陣列)
+    """
+    with open(path, "rb") as f:
+        magic, first_year, first_index, count, new_year_count = _HEADER.unpack(f.read(_HEADER.size))
+        if magic != _MAGIC:
+            raise ValueError(f"不是節氣時刻表檔案: {path}")
+        seconds = array("q")
+        seconds.frombytes(f.read(count * 8))
+        new_year_days = array("i")
+        new_year_days.frombytes(f.read(new_year_count * 4))
+    return first_year, first_index, _to_little_endian(seconds), _to_little_endian(new_year_days)
+
+
+# 表格檔案不存在時（例如尚未執行 build_table）查表一律回傳 None，由呼叫端改走 lunar_python；
+# 以腳本執行重新產生表格時不讀取舊檔
+if __name__ != "__main__" and os.path.exists(TABLE_PATH):
+    _first_year, _first_index, _seconds, _new_year_days = load_table()
+else:
+    _first_year, _first_index, _seconds, _new_year_days = FIRST_YEAR, 0, array("q"), array("i")
+
+# 只含「節」的子表，供起運等只看月令交接的計算使用
+_jie_offset = 0 if _first_index % 2 == 1 else 1
+_jie_seconds = _seconds[_jie_offset::2]
+
+
+def jie_qi_seconds():
+    """
+    取得全部節氣時刻（自 1970-01-01 起算的秒數，已排序）
+    :return: (第一筆節氣名稱索引, 秒數陣列)
+    """
+    return _first_index, _seconds
+
+
+def lunar_new_year_days():
+    """
+    取得各年正月初一的日期（自 1970-01-01 起算的日數）
+    :return: (起始西元年, 日數陣列)
+    """
+    return _first_year, _new_year_days
+
+
+def term_name(index):
+    """
+    取得表中第 index 筆的節氣名稱
+    :param index: 表格索引
+    :return: 節氣名稱
+    """
+    return JIE_QI_NAMES[(_first_index + index) % 24]
+
+
+def term_time(index):
+    """
+    取得表中第 index 筆的交節時刻
+    :param index: 表格索引
+    :return: datetime
+    """
+    return EPOCH + timedelta(seconds=_seconds[index])
+
+
+def find_jie_qi(birth_time, jie_only=False):
+    """
+    查找出生時刻的上一個和下一個節氣
+    :param birth_time: 出生時間 (datetime)
+    :param jie_only: 只看「節」（小寒、立春 ...），不看「氣」
+    :return: (當前節氣, 當前節氣開始時間, 下一節氣, 下一節氣開始時間, 距當前節氣, 距下一節氣)；
+             超出表格範圍時回傳 None
+    """
+    t = (birth_time - EPOCH) // timedelta(seconds=1)
+    table = _jie_seconds if jie_only else _seconds
+    i = bisect_right(table, t)
+    if i == 0 or i == len(table):
+        return None
+
+    prev_seconds = table[i - 1]
+    next_seconds = table[i]
+    if jie_only:
+        prev_name = JIE_QI_NAMES[(_first_index + _jie_offset + 2 * (i - 1)) % 24]
+        next_name = JIE_QI_NAMES[(_first_index + _jie_offset + 2 * i) % 24]
+    else:
+        prev_name = JIE_QI_NAMES[(_first_index + i - 1) % 24]
+        next_name = JIE_QI_NAMES[(_first_index + i) % 24]
+
+    return (
+        prev_name,
+        EPOCH + timedelta(seconds=prev_seconds),
+        next_name,
+        EPOCH + timedelta(seconds=next_seconds),
+        timedelta(seconds=t - prev_seconds),
+        timedelta(seconds=next_seconds - t),
+    )
+
+
+if __name__ == "__main__":
+    count = build_table()
+    print(f"已寫入 {count} 筆節氣時刻至 {TABLE_PATH}")
@@ -0,0 +1,99 @@
+# 命盤服務壓力測試：以多條 keep-alive 連線併發送出請求，回報延遲分位數及吞吐量
+#
+#   python server.py --port 8000 &
+#   python loadtest.py --port 8000 --requests 5000 --concurrency 64 --distinct 500
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from urllib.parse import urlencode
+
+
+def make_paths(count, distinct, endpoint, seed=0):
+    """
+    產生請求路徑；只有 distinct 種不同的出生時間，用以模擬集中在熱門日期的流量
+    :param count: 請求總數
+    :param distinct: 不同出生時間的數量
+    :param endpoint: 端點名稱
+    :param seed: 亂數種子
+    :return: 路徑列表
+    """
+    rng = random.Random(seed)
+    births = [
+        {"year": rng.randint(1950, 2020), "month": rng.randint(1, 12), "day": rng.randint(1, 28),
+         "hour": rng.randint(0, 23), "gender": rng.randint(0, 1)}
+        for _ in range(distinct)
+    ]
+    return [f"/{endpoint}?{urlencode(rng.choice(births))}" for _ in range(count)]
+
+
+async def _client(host, port, paths, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for path in paths:
+            start = time.perf_counter()
+            writer.write(f"GET {path} HTTP/1.1\r\nHost: {host}\r\n\r\n".encode("latin-1"))
+            await writer.drain()
+            status_line = await reader.readline()
+            length = 0
+            while True:
+                line = await reader.readline()
+                if line in (b"\r\n", b""):
+                    break
+                name, _, value = line.decode("latin-1").partition(":")
+                if name.lower() == "content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            latencies.append(time.perf_counter() - start)
+            status = int(status_line.split()[1])
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+async def run(host, port, paths, concurrency):
+    """
+    併發執行請求
+    :return: 統計結果 dict
+    """
+    latencies = []
+    statuses = {}
+    shards = [paths[i::concurrency] for i in range(concurrency)]
+    start = time.perf_counter()
+    await asyncio.gather(*(_client(host, port, shard, latencies, statuses) for shard in shards if shard))
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        "requests": len(latencies),
+        "concurrency": concurrency,
+        "seconds": round(elapsed, 3),
+        "throughput_rps": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+        "max_ms": round(latencies[-1] * 1000, 3) if latencies else 0.0,
+        "status": statuses,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="命盤服務壓力測試")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--endpoint", default="chart", choices=["lunar", "luck", "chart"])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--distinct", type=int, default=200, help="不同出生時間的數量")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    paths = make_paths(args.requests, args.distinct, args.endpoint, args.seed)
+    print(json.dumps(asyncio.run(run(args.host, args.port, paths, args.concurrency)), ensure_ascii=False, indent=2))
@@ -1,38 +1,21 @@
 # 輸入八字, 根據 config.py 找出天干地支關係
 
 from config import basic, relation
-from lunar_python import Lunar, Solar
+import codes
+import ephemeris
+import jieqi
+import metrics
 from datetime import datetime, timedelta
+from functools import lru_cache
+import os
 
 
-def solar_to_lunar(year, month, day, hour=0, minute=0, second=0):
+def _lunar_fields(lunar):
     """
-    將國曆轉換為農曆
-    :param year: 西元年
-    :param month: 月
-    :param day: 日
-    :param hour: 時
-    :param minute: 分
-    :param second: 秒
-    :return: 農曆日期字典
+    取出與節氣無關的農曆欄位
+    :param lunar: lunar_python 的 Lunar 物件
+    :return: 欄位字典
     """
-    solar = Solar.fromYmdHms(year, month, day, hour, minute, second)
-    lunar = solar.getLunar()
-
-    
-    ThisJieQi = lunar.getPrevJieQi().getName()  # 當前節氣
-    NextJieQi = lunar.getNextJieQi().getName()  # 下一節氣
-
-    this_jie_qi_starttime = lunar.getJieQiTable()[ThisJieQi].toYmdHms()
-    next_jie_qi_starttime = lunar.getJieQiTable()[NextJieQi].toYmdHms()
-
-    # 计算到下一节气的时间间隔
-    birth_time = datetime(year, month, day, hour)
-    this_jie_qi_time = datetime.strptime(this_jie_qi_starttime, "%Y-%m-%d %H:%M:%S")
-    next_jie_qi_time = datetime.strptime(next_jie_qi_starttime, "%Y-%m-%d %H:%M:%S")
-    time_to_this_jq = birth_time - this_jie_qi_time 
-    time_to_next_jq = next_jie_qi_time - birth_time
-
     return {
         "year": lunar.getYearInChinese(),  # 農曆年
         "month": lunar.getMonthInChinese(),  # 農曆月
@@ -48,14 +31,157 @@ def solar_to_lunar(year, month, day, hour=0, minute=0, second=0):
         "hour_gan": lunar.getTimeGan(),  # 時干
         "hour_zhi": lunar.getTimeZhi(),  # 時支
         "festival": lunar.getFestivals(),  # 節日
-        "this_jie_qi": ThisJieQi,  # 當前節氣
-        "next_jie_qi": NextJieQi,  # 下一節氣
-        "this_jie_qi_starttime" : this_jie_qi_starttime, # 當前節氣開始時間
-        "next_jie_qi_starttime" : next_jie_qi_time,# 下一節氣開始時間
-        "time_to_this_jq" : time_to_this_jq,
-        "time_to_next_jq" : time_to_next_jq,
     }
 
+
+@metrics.instrument("lunar_python")
+def _shichen_fields(year, month, day, shichen):
+    """
+    計算某日某時辰的農曆欄位；年、月、日柱都以日期為準，時柱只看時辰，
+    因此同一日同一時辰內任何時刻的結果都相同
+    :param shichen: 時辰序號 0-12（0 為早子時 0 點，12 為晚子時 23 點）
+    """
+    from lunar_python import Solar
+
+    hour = shichen * 2 - 1 if shichen else 0
+    return _lunar_fields(Solar.fromYmdHms(year, month, day, hour, 0, 0).getLunar())
+
+
+# 時辰快取：同一日同一時辰的出生時間共用一次 lunar_python 計算
+LUNAR_CACHE_SIZE = int(os.environ.get("BAZI_LUNAR_CACHE_SIZE", 65536))
+_shichen_cache = lru_cache(maxsize=LUNAR_CACHE_SIZE)(_shichen_fields)
+metrics.register_cache("lunar", lambda: _shichen_cache.cache_info())
+
+
+def configure_lunar_cache(maxsize=LUNAR_CACHE_SIZE):
+    """
+    設定 solar_to_lunar 的時辰快取容量（會清空現有快取）
+    :param maxsize: 快取筆數，0 表示停用，None 表示不限
+    """
+    global _shichen_cache
+    _shichen_cache = lru_cache(maxsize=maxsize)(_shichen_fields)
+
+
+def lunar_cache_info():
+    """
+    取得時辰快取的命中統計
+    :return: {"hits", "misses", "maxsize", "currsize", "hit_rate"}
+    """
+    info = _shichen_cache.cache_info()
+    total = info.hits + info.misses
+    return {**info._asdict(), "hit_rate": info.hits / total if total else 0.0}
+
+
+def _solar_to_lunar_from_ephemeris(birth_time):
+    """
+    由逐時星曆檔取得四柱及節氣，不經 lunar_python
+    :param birth_time: 出生時間
+    :return: 農曆信息字典（農曆年月日及節日為 None）；星曆檔不存在或超出範圍時回傳 None
+    """
+    table = ephemeris.default()
+    found = table.lookup(birth_time) if table is not None else None
+    if found is None:
+        return None
+    pillars, term, time_to_this_jq, time_to_next_jq = found
+    gan = basic.heavenly_stems
+    zhi = basic.earthly_branches
+    year_code, month_code, day_code, hour_code = pillars
+    return {
+        "year": None,
+        "month": None,
+        "day": None,
+        "hour": zhi[hour_code % 12],
+        "year_gan": gan[year_code % 10],
+        "year_zhi": zhi[year_code % 12],
+        "month_gan": gan[month_code % 10],
+        "month_zhi": zhi[month_code % 12],
+        "day_gan": gan[day_code % 10],
+        "day_zhi": zhi[day_code % 12],
+        "hour_gan": gan[hour_code % 10],
+        "hour_zhi": zhi[hour_code % 12],
+        "festival": None,
+        "this_jie_qi": jieqi.term_name(term),
+        "next_jie_qi": jieqi.term_name(term + 1),
+        "this_jie_qi_starttime": jieqi.term_time(term).strftime("%Y-%m-%d %H:%M:%S"),
+        "next_jie_qi_starttime": jieqi.term_time(term + 1),
+        "time_to_this_jq": time_to_this_jq,
+        "time_to_next_jq": time_to_next_jq,
+    }
+
+
+@metrics.instrument("lunar_python.fallback")
+def _lunar_python_fields(birth_time):
+    """
+    以 lunar_python 計算農曆欄位及前後節氣（超出節氣表範圍時使用）
+    :param birth_time: 出生時間
+    :return: (農曆欄位, 當前節氣, 當前節氣時間, 下一節氣, 下一節氣時間)
+    """
+    from lunar_python import Solar
+
+    lunar = Solar.fromYmdHms(
+        birth_time.year, birth_time.month, birth_time.day, birth_time.hour, birth_time.minute, birth_time.second
+    ).getLunar()
+    info = _lunar_fields(lunar)
+    prev_jie_qi = lunar.getPrevJieQi()  # 當前節氣
+    next_jie_qi = lunar.getNextJieQi()  # 下一節氣
+    this_jie_qi_time = datetime.strptime(prev_jie_qi.getSolar().toYmdHms(), "%Y-%m-%d %H:%M:%S")
+    next_jie_qi_time = datetime.strptime(next_jie_qi.getSolar().toYmdHms(), "%Y-%m-%d %H:%M:%S")
+    return info, prev_jie_qi.getName(), this_jie_qi_time, next_jie_qi.getName(), next_jie_qi_time
+
+
+@metrics.instrument("solar_to_lunar")
+def solar_to_lunar(year, month, day, hour=0, minute=0, second=0, lunar_date=True):
+    """
+    將國曆轉換為農曆
+    :param year: 西元年
+    :param month: 月
+    :param day: 日
+    :param hour: 時
+    :param minute: 分
+    :param second: 秒
+    :param lunar_date: 是否需要農曆年月日及節日；False 時若有逐時星曆檔 (ephemeris.bin)
+                       則直接查表取得四柱及節氣，這幾個欄位為 None
+    :return: 農曆日期字典
+    """
+    birth_time = datetime(year, month, day, hour, minute, second)
+    if not lunar_date:
+        info = _solar_to_lunar_from_ephemeris(birth_time)
+        if info is not None:
+            return info
+
+    # 以預先計算的節氣時刻表二分查找前後節氣，不必重建整年的節氣表
+    span = jieqi.find_jie_qi(birth_time)
+    if span is not None:
+        ThisJieQi, this_jie_qi_time, NextJieQi, next_jie_qi_time, time_to_this_jq, time_to_next_jq = span
+        # 干支、節日等只依日期與時辰，查時辰快取；只有距節氣的時間差逐筆計算
+        info = dict(_shichen_cache(year, month, day, (hour + 1) // 2))
+        info["festival"] = list(info["festival"])
+    else:
+        # 超出節氣表範圍 (1900-2100)，改用 lunar_python 計算
+        info, ThisJieQi, this_jie_qi_time, NextJieQi, next_jie_qi_time = _lunar_python_fields(birth_time)
+        time_to_this_jq = birth_time - this_jie_qi_time
+        time_to_next_jq = next_jie_qi_time - birth_time
+
+    info["this_jie_qi"] = ThisJieQi  # 當前節氣
+    info["next_jie_qi"] = NextJieQi  # 下一節氣
+    info["this_jie_qi_starttime"] = this_jie_qi_time.strftime("%Y-%m-%d %H:%M:%S")  # 當前節氣開始時間
+    info["next_jie_qi_starttime"] = next_jie_qi_time  # 下一節氣開始時間
+    info["time_to_this_jq"] = time_to_this_jq
+    info["time_to_next_jq"] = time_to_next_jq
+    return info
+
+def analyze_chart(heavenly_stems, earthly_branches):
+    """
+    分析八字，回傳結構化結果（整數編碼的關係紀錄，不產生文字）
+    :param heavenly_stems: 天干列表 [年干, 月干, 日干, 時干]
+    :param earthly_branches: 地支列表 [年支, 月支, 日支, 時支]
+    :return: codes.ChartAnalysis
+    """
+    stems, branches = codes.encode_bazi(heavenly_stems, earthly_branches)
+    return codes.analyze_codes(stems, branches)
+
+
+@metrics.instrument("analyze_bazi")
 def analyze_bazi(heavenly_stems, earthly_branches):
     """
     分析八字，找出天干地支的關係
@@ -63,88 +189,7 @@ def analyze_bazi(heavenly_stems, earthly_branches):
     :param earthly_branches: 地支列表 [年支, 月支, 日支, 時支]
     :return: 分析結果
     """
-    positions = ["年", "月", "日", "時"]
-    results = {
-        "hidden_stems": [],
-        "heavenly_relations": [],
-        "branch_relations": [],
-        "wen_chang": {
-            "day_stem": None,
-            "location": None,
-            "found_positions": []
-        }
-    }
-
-    # 找出地支藏干
-    for i, branch in enumerate(earthly_branches):
-        hidden = basic.hidden_stems.get(branch, [])
-        results["hidden_stems"].append({f"{positions[i]}支 {branch}": hidden})
-
-    # 找出天干相合關係並計算相合後的五行
-    for i, stem1 in enumerate(heavenly_stems):
-        for j, stem2 in enumerate(heavenly_stems):
-            if i < j and stem2 in relation.heavenly_relations["合"].get(stem1, []):
-                combined_element = relation.get_combined_element(stem1, stem2)
-                if combined_element:
-                    results["heavenly_relations"].append(
-                        f"{positions[i]}干 {stem1} 合 {positions[j]}干 {stem2} 化為 {combined_element}"
-                    )
-                else:
-                    results["heavenly_relations"].append(
-                        f"{positions[i]}干 {stem1} 合 {positions[j]}干 {stem2}"
-                    )
-
-    # 找出地支關係
-    for i, branch1 in enumerate(earthly_branches):
-        for j, branch2 in enumerate(earthly_branches):
-            if i < j:
-                # 檢查六合關係
-                if branch2 in relation.branch_relations["六合"].get(branch1, []):
-                    element = relation.get_branch_combined_element(branch1, branch2)
-                    if element:
-                        results["branch_relations"].append(
-                            f"{positions[i]}支 {branch1} 六合 {positions[j]}支 {branch2} 化為 {element}"
-                        )
-                    else:
-                        results["branch_relations"].append(
-                            f"{positions[i]}支 {branch1} 六合 {positions[j]}支 {branch2}"
-                        )
-
-                # 檢查半三合關係
-                element = relation.get_half_combine_element(branch1, branch2)
-                if element:
-                    results["branch_relations"].append(
-                        f"{positions[i]}支 {branch1} 半三合 {positions[j]}支 {branch2} 化為 {element}"
-                    )
-
-                # 檢查拱合關係
-                element = relation.get_arch_combine_element(branch1, branch2)
-                if element:
-                    results["branch_relations"].append(
-                        f"{positions[i]}支 {branch1} 拱 {positions[j]}支 {branch2} 化為 {element}"
-                    )
-
-                # 檢查三合關係（需要三個地支）
-                for k, branch3 in enumerate(earthly_branches):
-                    if j < k:
-                        element = relation.get_three_combine_element(branch1, branch2, branch3)
-                        if element:
-                            results["branch_relations"].append(
-                                f"{positions[i]}支 {branch1} {positions[j]}支 {branch2} {positions[k]}支 {branch3} 三合化為 {element}"
-                            )
-
-    # 查找文昌贵人（使用日干）
-    day_stem = heavenly_stems[2]  # 日干
-    wen_chang = relation.get_wen_chang(day_stem)
-    if wen_chang:
-        results["wen_chang"]["day_stem"] = day_stem
-        results["wen_chang"]["location"] = wen_chang
-        # 检查四个地支中是否存在文昌贵人
-        for i, branch in enumerate(earthly_branches):
-            if branch == wen_chang:
-                results["wen_chang"]["found_positions"].append(f"{positions[i]}支")
-
-    return results
+    return codes.render_analysis(analyze_chart(heavenly_stems, earthly_branches))
 
 
 def get_bazi_from_solar_date(lunar_info):
@@ -170,6 +215,7 @@ def get_bazi_from_solar_date(lunar_info):
     
     return heavenly_stems, earthly_branches
 
+@metrics.instrument("get_start_luck")
 def get_start_luck(lunar_info, gender, birth_date):
     """
     計算大運起始時間和年齡
@@ -180,7 +226,6 @@ def get_start_luck(lunar_info, gender, birth_date):
     """
     # 計大運法：3日=1歲,1日=4個月,1時辰=10日
     time_to_next_jq = lunar_info["time_to_next_jq"]
-    print(time_to_next_jq)
     days = time_to_next_jq.days
     hours = time_to_next_jq.seconds // 3600
 
@@ -207,6 +252,7 @@ def get_start_luck(lunar_info, gender, birth_date):
     }
 
 
+@metrics.instrument("get_luck_pillars")
 def get_luck_pillars(luck_info):
     """
     計算大運干支
@@ -240,6 +286,111 @@ def get_luck_pillars(luck_info):
     
     return luck_pillars
 
+@metrics.instrument("compute_chart")
+def compute_chart(year, month, day, hour=0, gender=1, minute=0, lunar_date=True):
+    """
+    計算一個人的完整命盤：農曆信息、八字、大運及八字分析
+    :param year: 西元年
+    :param month: 月
+    :param day: 日
+    :param hour: 時
+    :param gender: 性別 (1:男, 0:女)
+    :param minute: 分
+    :param lunar_date: 是否需要農曆年月日及節日，見 solar_to_lunar；
+                       False 且有星曆檔時完全不載入 lunar_python，適合只跑一張命盤的短命令
+    :return: 命盤字典
+    """
+    # 使用 LunarCalendar 獲取農曆信息
+    lunar_info = solar_to_lunar(year, month, day, hour, minute, lunar_date=lunar_date)
+    birth_date = datetime(year, month, day, hour, minute)
+
+    # 獲取八字
+    heavenly_stems, earthly_branches = get_bazi_from_solar_date(lunar_info)
+
+    # 計算大運信息
+    luck_info = get_start_luck(lunar_info, gender, birth_date)
+
+    # 計算大運干支
+    luck_pillars = get_luck_pillars(luck_info)
+
+    # 分析八字
+    analysis = analyze_bazi(heavenly_stems, earthly_branches)
+
+    return {
+        "birth_date": birth_date,
+        "lunar_info": lunar_info,
+        "heavenly_stems": heavenly_stems,
+        "earthly_branches": earthly_branches,
+        "luck_info": luck_info,
+        "luck_pillars": luck_pillars,
+        "analysis": analysis,
+    }
+
+
+# 時辰不詳時的候選時刻：每個時辰取其起點，子時取 0 點（早子時）
+CANDIDATE_HOURS = (0,) + tuple(range(1, 23, 2))
+
+
+@metrics.instrument("compute_hour_candidates")
+def compute_hour_candidates(year, month, day, gender=1):
+    """
+    出生時辰不詳時，計算當天 12 個時辰的候選命盤。
+    年、月、日柱及其間的關係只算一次，每個時辰只補上時柱及與時柱有關的關係
+    :param year: 西元年
+    :param month: 月
+    :param day: 日
+    :param gender: 性別 (1:男, 0:女)
+    :return: {"candidates": [命盤字典, ...], "groups": [[時辰, ...], ...]}；
+             命盤字典同 compute_chart，另加 "shichen" 欄位；groups 為時柱關係相同的時辰分組
+    """
+    base = solar_to_lunar(year, month, day)
+    gan = basic.heavenly_stems
+    zhi = basic.earthly_branches
+    day_gan = gan.index(base["day_gan"])
+    stems, branches = codes.encode_bazi(
+        [base["year_gan"], base["month_gan"], base["day_gan"]],
+        [base["year_zhi"], base["month_zhi"], base["day_zhi"]],
+    )
+    # 五鼠遁：由日干起時干
+    hours = [(((day_gan % 5) * 2 + hour_zhi) % 10, hour_zhi) for hour_zhi in range(12)]
+    analyses = codes.analyze_hour_candidates(stems, branches, hours)
+
+    candidates = []
+    for hour, (hour_gan, hour_zhi), analysis in zip(CANDIDATE_HOURS, hours, analyses):
+        birth_date = datetime(year, month, day, hour)
+        span = jieqi.find_jie_qi(birth_date)
+        if span is None:
+            lunar_info = solar_to_lunar(year, month, day, hour)
+        else:
+            # 年、月、日柱只依日期；時柱以五鼠遁推得，節氣時間差逐時辰計算
+            lunar_info = dict(base)
+            lunar_info["festival"] = list(base["festival"])
+            lunar_info["hour"] = lunar_info["hour_zhi"] = zhi[hour_zhi]
+            lunar_info["hour_gan"] = gan[hour_gan]
+            this_name, this_time, next_name, next_time, time_to_this_jq, time_to_next_jq = span
+            lunar_info["this_jie_qi"] = this_name
+            lunar_info["next_jie_qi"] = next_name
+            lunar_info["this_jie_qi_starttime"] = this_time.strftime("%Y-%m-%d %H:%M:%S")
+            lunar_info["next_jie_qi_starttime"] = next_time
+            lunar_info["time_to_this_jq"] = time_to_this_jq
+            lunar_info["time_to_next_jq"] = time_to_next_jq
+        heavenly_stems, earthly_branches = get_bazi_from_solar_date(lunar_info)
+        luck_info = get_start_luck(lunar_info, gender, birth_date)
+        candidates.append({
+            "shichen": zhi[hour_zhi],
+            "birth_date": birth_date,
+            "lunar_info": lunar_info,
+            "heavenly_stems": heavenly_stems,
+            "earthly_branches": earthly_branches,
+            "luck_info": luck_info,
+            "luck_pillars": get_luck_pillars(luck_info),
+            "analysis": codes.render_analysis(analysis),
+        })
+
+    groups = [[zhi[hours[i][1]] for i in group] for group in codes.group_hour_candidates(analyses)]
+    return {"candidates": candidates, "groups": groups}
+
+
 def main():
     # 獲取用戶輸入
     print("請輸入出生日期時間（西曆）：")
@@ -250,22 +401,12 @@ def main():
         hour = int(input("時（24小時制）: "))
         gender = int(input("男1 女0: "))
 
-        # 使用 LunarCalendar 獲取農曆信息
-        lunar_info = solar_to_lunar(year, month, day, hour)
-        birth_date = datetime(year, month, day, hour)
+        chart = compute_chart(year, month, day, hour, gender)
+        heavenly_stems, earthly_branches = chart["heavenly_stems"], chart["earthly_branches"]
+        luck_info = chart["luck_info"]
+        luck_pillars = chart["luck_pillars"]
+        analysis = chart["analysis"]
 
-        # 獲取八字
-        heavenly_stems, earthly_branches = get_bazi_from_solar_date(lunar_info)
-        
-        # 計算大運信息
-        luck_info = get_start_luck(lunar_info, gender, birth_date)
-        
-        # 計算大運干支
-        luck_pillars = get_luck_pillars(luck_info)
-        
-        # 分析八字
-        analysis = analyze_bazi(heavenly_stems, earthly_branches)
-        
         # 輸出分析結果
         print("\n八字排盤:")
         print("=" * 40)
@@ -315,4 +456,11 @@ def main():
         print(f"發生錯誤：{str(e)}")
 
 if __name__ == "__main__":
+    import sys
+
+    if len(sys.argv) > 1:
+        # 以 __main__ 執行時，讓 bulk 的 `from main import ...` 取得本模組，不再重新載入一次
+        sys.modules.setdefault("main", sys.modules["__main__"])
+        import bulk
+        sys.exit(bulk.cli(sys.argv[1:]))
     main()
\ No newline at end of file
@@ -0,0 +1,348 @@
+# 分段計時與計數：各步驟的呼叫次數、錯誤次數、累計及最長耗時，快取命中統計，
+# 以及掛在各步驟前後的回呼。可匯出為 JSON 快照或 Prometheus 文字格式。
+#
+# 計時預設關閉，設定環境變數 BAZI_METRICS=1 或呼叫 enable() 開啟（bulk.py 的 --metrics、--profile 會自動開啟）。
+# 只掛在對外的步驟上（solar_to_lunar、analyze_bazi、compute_chart 等），不掛在其內部的熱點函式，
+# 關閉時每次呼叫只多一層函式呼叫。各步驟的時間為含子步驟的總時間，例如 compute_chart 包含 solar_to_lunar。
+#
+#   import metrics
+#   metrics.add_hook("solar_to_lunar", after=lambda stage, args, result, seconds, error: ...)
+#   print(metrics.prometheus())
+#
+# 批次模式另可用 profile_cprofile / SamplingProfiler 做剖析（見 bulk.py 的 --profile）；
+# 剖析及匯出用到的 cProfile、pstats、threading、json 只在使用時載入，不拖慢一般啟動。
+
+import functools
+import os
+import sys
+import time
+from collections import Counter
+
+_enabled = os.environ.get("BAZI_METRICS", "0") in ("1", "true", "yes")
+
+
+class Stage:
+    """
+    單一步驟的統計
+    """
+    __slots__ = ("name", "calls", "errors", "seconds", "max_seconds", "before", "after")
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+        self.before = []  # 回呼 before(stage, args)
+        self.after = []  # 回呼 after(stage, args, result, seconds, error)
+
+    def reset(self):
+        self.calls = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.max_seconds = 0.0
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "seconds": self.seconds,
+            "max_seconds": self.max_seconds,
+        }
+
+
+_stages = {}
+_caches = {}
+
+
+def stage(name):
+    """
+    取得（或建立）某步驟的統計
+    :param name: 步驟名稱
+    :return: Stage
+    """
+    found = _stages.get(name)
+    if found is None:
+        found = _stages[name] = Stage(name)
+    return found
+
+
+def instrument(name):
+    """
+    裝飾器：為函式加上計時、計數及回呼
+    :param name: 步驟名稱
+    """
+    record = stage(name)
+
+    def decorate(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            for hook in record.before:
+                hook(name, args)
+            start = time.perf_counter()
+            try:
+                result = func(*args, **kwargs)
+            except Exception as e:
+                elapsed = time.perf_counter() - start
+                record.calls += 1
+                record.errors += 1
+                record.seconds += elapsed
+                for hook in record.after:
+                    hook(name, args, None, elapsed, e)
+                raise
+            elapsed = time.perf_counter() - start
+            record.calls += 1
+            record.seconds += elapsed
+            if elapsed > record.max_seconds:
+                record.max_seconds = elapsed
+            for hook in record.after:
+                hook(name, args, result, elapsed, None)
+            return result
+
+        return wrapper
+
+    return decorate
+
+
+def add_hook(name, before=None, after=None):
+    """
+    在某步驟前後掛上回呼
+    :param name: 步驟名稱
+    :param before: before(步驟名稱, 參數)
+    :param after: after(步驟名稱, 參數, 結果, 秒數, 例外或 None)
+    """
+    record = stage(name)
+    if before is not None:
+        record.before.append(before)
+    if after is not None:
+        record.after.append(after)
+
+
+def remove_hook(name, hook):
+    """
+    移除 add_hook 加上的回呼
+    """
+    record = stage(name)
+    for hooks in (record.before, record.after):
+        if hook in hooks:
+            hooks.remove(hook)
+
+
+def register_cache(name, info):
+    """
+    登記一個快取，匯出時一併回報命中統計
+    :param name: 快取名稱
+    :param info: 無參數函式，回傳帶 hits、misses 屬性的物件（如 lru_cache 的 cache_info）
+    """
+    _caches[name] = info
+
+
+def enable():
+    global _enabled
+    _enabled = True
+
+
+def disable():
+    global _enabled
+    _enabled = False
+
+
+def enabled():
+    return _enabled
+
+
+def reset():
+    """
+    清除所有步驟的統計（保留回呼）
+    """
+    for record in _stages.values():
+        record.reset()
+
+
+def take_stages():
+    """
+    取出各步驟的統計並歸零，供工作進程回報給主進程
+    :return: {步驟: {"calls", "errors", "seconds", "max_seconds"}}
+    """
+    taken = {name: record.as_dict() for name, record in _stages.items() if record.calls}
+    reset()
+    return taken
+
+
+def merge_stages(stages):
+    """
+    併入其他進程的步驟統計
+    :param stages: take_stages() 的結果
+    """
+    for name, values in stages.items():
+        record = stage(name)
+        record.calls += values["calls"]
+        record.errors += values["errors"]
+        record.seconds += values["seconds"]
+        record.max_seconds = max(record.max_seconds, values["max_seconds"])
+
+
+def snapshot():
+    """
+    取得目前的統計
+    :return: {"enabled", "stages": {步驟: {...}}, "caches": {快取: {"hits", "misses", "currsize", "maxsize"}}}
+    """
+    caches = {}
+    for name, info in _caches.items():
+        current = info()
+        caches[name] = {
+            "hits": current.hits,
+            "misses": current.misses,
+            "currsize": getattr(current, "currsize", None),
+            "maxsize": getattr(current, "maxsize", None),
+        }
+    return {
+        "enabled": _enabled,
+        "stages": {name: record.as_dict() for name, record in _stages.items()},
+        "caches": caches,
+    }
+
+
+def to_json(data=None):
+    """
+    :param data: snapshot() 的結果，預設取目前統計
+    :return: JSON 字串
+    """
+    import json
+
+    return json.dumps(snapshot() if data is None else data, ensure_ascii=False, indent=2)
+
+
+def _metric(lines, name, kind, help_text, samples):
+    lines.append(f"# HELP {name} {help_text}")
+    lines.append(f"# TYPE {name} {kind}")
+    for labels, value in samples:
+        label_text = ",".join(f'{k}="{v}"' for k, v in labels.items())
+        lines.append(f"{name}{{{label_text}}} {value}")
+
+
+def prometheus(data=None):
+    """
+    以 Prometheus 文字格式匯出
+    :param data: snapshot() 的結果，預設取目前統計
+    :return: 文字
+    """
+    data = snapshot() if data is None else data
+    stages = data["stages"]
+    caches = data["caches"]
+    lines = []
+    _metric(lines, "bazi_stage_calls_total", "counter", "Number of calls per stage.",
+            [({"stage": name}, s["calls"]) for name, s in stages.items()])
+    _metric(lines, "bazi_stage_errors_total", "counter", "Number of calls that raised, per stage.",
+            [({"stage": name}, s["errors"]) for name, s in stages.items()])
+    _metric(lines, "bazi_stage_seconds_total", "counter", "Total seconds spent per stage, including sub-stages.",
+            [({"stage": name}, repr(s["seconds"])) for name, s in stages.items()])
+    _metric(lines, "bazi_stage_seconds_max", "gauge", "Slowest single call per stage.",
+            [({"stage": name}, repr(s["max_seconds"])) for name, s in stages.items()])
+    _metric(lines, "bazi_cache_hits_total", "counter", "Cache hits.",
+            [({"cache": name}, c["hits"]) for name, c in caches.items()])
+    _metric(lines, "bazi_cache_misses_total", "counter", "Cache misses.",
+            [({"cache": name}, c["misses"]) for name, c in caches.items()])
+    return "\n".join(lines) + "\n"
+
+
+def write(path, data=None):
+    """
+    寫出統計；副檔名為 .prom 時用 Prometheus 文字格式，否則為 JSON
+    :param path: 檔案路徑
+    :param data: snapshot() 的結果，預設取目前統計
+    """
+    text = prometheus(data) if path.endswith(".prom") else to_json(data) + "\n"
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(text)
+
+
+def profile_cprofile(func, *args, output=None, limit=30, **kwargs):
+    """
+    以 cProfile 執行函式
+    :param func: 要剖析的函式
+    :param output: 若指定，將原始統計存到此路徑（可用 pstats 或 snakeviz 開啟）
+    :param limit: 摘要列出的函式數
+    :return: (函式回傳值, 依累計時間排序的摘要文字)
+    """
+    import cProfile
+    import io
+    import pstats
+
+    profiler = cProfile.Profile()
+    result = profiler.runcall(func, *args, **kwargs)
+    if output:
+        profiler.dump_stats(output)
+    text = io.StringIO()
+    pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(limit)
+    return result, text.getvalue()
+
+
+class SamplingProfiler:
+    """
+    取樣剖析：背景執行緒每隔 interval 秒記錄目標執行緒正在執行的函式，負擔遠低於 cProfile
+    """
+
+    def __init__(self, interval=0.005, thread_id=None):
+        import threading
+
+        self.interval = interval
+        self.thread_id = threading.get_ident() if thread_id is None else thread_id
+        self.samples = 0
+        self.leaf = Counter()  # 取樣時位於最內層的函式
+        self.inclusive = Counter()  # 取樣時出現在呼叫堆疊中的函式
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            seen = set()
+            leaf = True
+            while frame is not None:
+                code = frame.f_code
+                key = f"{os.path.basename(code.co_filename)}:{code.co_name}"
+                if leaf:
+                    self.leaf[key] += 1
+                    leaf = False
+                if key not in seen:
+                    seen.add(key)
+                    self.inclusive[key] += 1
+                frame = frame.f_back
+
+    def start(self):
+        self._stop.clear()
+        import threading
+
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        return self
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def report(self, limit=30):
+        """
+        :param limit: 列出的函式數
+        :return: 依所佔取樣比例排序的摘要文字
+        """
+        total = self.samples or 1
+        lines = [f"{self.samples} samples, interval {self.interval * 1000:g} ms", "", "inclusive:"]
+        lines += [f"{count / total:7.1%}  {key}" for key, count in self.inclusive.most_common(limit)]
+        lines += ["", "leaf:"]
+        lines += [f"{count / total:7.1%}  {key}" for key, count in self.leaf.most_common(limit)]
+        return "\n".join(lines) + "\n"
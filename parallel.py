@@ -0,0 +1,115 @@
+# 多進程批次排盤：將輸入切塊分派到 ProcessPoolExecutor，輸出可保持原順序
+#
+# lunar_python 為純 Python、CPU 密集，多執行緒無法加速，因此改用多進程。
+# 每個工作進程啟動時先匯入 lunar_python 並建好設定表，之後每塊直接計算。
+#
+#   python main.py --batch births.jsonl --workers 32 --chunk-size 2000 --unordered
+
+import os
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, as_completed, wait
+from itertools import islice
+
+import metrics
+
+DEFAULT_CHUNK_SIZE = 1000
+
+
+def init_worker(precompute, collect_metrics=False):
+    """
+    工作進程初始化：預先匯入並暖機，避免第一塊承擔載入成本
+    :param precompute: 是否預先計算全部地支組合
+    :param collect_metrics: 是否開啟分段統計（與主進程一致；以 spawn 啟動的進程不會繼承 metrics.enable()）
+    """
+    import codes
+    import main
+    import metrics
+
+    if collect_metrics:
+        metrics.enable()
+    if precompute:
+        codes.configure_cache(precompute=True)
+    main.compute_chart(2000, 1, 1)
+    metrics.reset()
+
+
+def _process_chunk(chunk, convert=None):
+    """
+    在工作進程中計算一塊命盤
+    :param chunk: [(行號, 原始資料), ...]
+    :param convert: 輸出列轉換函式（見 bulk.chart_rows），預設為 JSON 字典
+    :return: ([(行號, 原始資料, 輸出列或例外), ...], 這一塊的分段統計)
+    """
+    import metrics
+    from bulk import chart_rows, json_row
+
+    results = []
+    for line_no, record, row in chart_rows(chunk, convert or json_row):
+        if isinstance(row, Exception):
+            # 例外不一定能序列化傳回主進程，只保留訊息
+            row = Exception(str(row))
+        results.append((line_no, record, row))
+    return results, metrics.take_stages()
+
+
+def _collect(future):
+    """
+    取出一塊的結果，並把工作進程的分段統計併入主進程
+    """
+    results, stages = future.result()
+    metrics.merge_stages(stages)
+    return results
+
+
+def chunked(iterable, size):
+    """
+    將可迭代物件切成固定大小的塊
+    :param iterable: 任意可迭代物件
+    :param size: 每塊筆數
+    :return: 產生 list 的產生器
+    """
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def parallel_chart_rows(births, workers=None, chunk_size=DEFAULT_CHUNK_SIZE, ordered=True, precompute=True,
+                        convert=None):
+    """
+    以多進程逐塊計算命盤，介面同 bulk.chart_rows
+    :param births: read_births 產生的 (行號, 原始資料)
+    :param workers: 工作進程數，預設為 CPU 核心數
+    :param chunk_size: 每塊筆數
+    :param ordered: 是否依輸入順序輸出；False 時先完成的塊先輸出
+    :param precompute: 工作進程是否預先計算全部地支組合
+    :param convert: 輸出列轉換函式（見 bulk.chart_rows），預設為 JSON 字典
+    :return: 產生 (行號, 原始資料, 輸出列或例外) 的產生器
+    """
+    workers = workers or os.cpu_count() or 1
+    # 同時在途的塊數有上限，讀取速度不會超前太多，記憶體維持有界
+    max_pending = workers * 2
+    chunks = chunked(births, chunk_size)
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker,
+                             initargs=(precompute, metrics.enabled())) as pool:
+        if ordered:
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.submit(_process_chunk, chunk, convert))
+                if len(pending) >= max_pending:
+                    yield from _collect(pending.popleft())
+            while pending:
+                yield from _collect(pending.popleft())
+        else:
+            pending = set()
+            for chunk in chunks:
+                pending.add(pool.submit(_process_chunk, chunk, convert))
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        yield from _collect(future)
+            for future in as_completed(pending):
+                yield from _collect(future)
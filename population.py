@@ -0,0 +1,358 @@
+# 族群統計：在整數編碼的大量命盤上統計關係、合化五行、文昌貴人的出現次數，可依出生年代等時期分組
+#
+# 統計量只保存「充分統計」：八個欄位（四干、四支）兩兩的聯合次數、四支中任三支的聯合次數、
+# 各欄位次數及文昌貴人命中次數。這些都是計數，可直接相加，因此可分塊串流累加，
+# 不同進程或檔案算出的部分結果也能以 merge 合併。各種關係的次數在查詢時由 codes 的規則表推得。
+#
+#   stats = PopulationStats()
+#   for chunk in chunks:                                    # datetime64 陣列
+#       stats.add_datetimes(chunk)                          # 預設以出生年代（每 10 年）分組
+#   stats.relation_count("六合", "卯", "戌")
+#   stats.elements_by_period()                              # {1990: {"火": ..., ...}, ...}
+#   stats.crosstab("日干", "月支")
+
+import argparse
+import json
+import sys
+from itertools import combinations
+
+import numpy as np
+
+import codes
+from batch import bazi_batch
+
+# 欄位：0-3 為年、月、日、時干，4-7 為年、月、日、時支
+FEATURES = tuple(f"{codes.POSITIONS[i]}干" for i in range(4)) + tuple(f"{codes.POSITIONS[i]}支" for i in range(4))
+_SIZES = (10,) * 4 + (12,) * 4
+FEATURE_PAIRS = tuple(combinations(range(8), 2))
+_PAIR_INDEX = {pair: k for k, pair in enumerate(FEATURE_PAIRS)}
+BRANCH_TRIPLES = tuple(combinations(range(4), 3))
+
+# 每格以 a * 12 + b 索引（天干只用到 0-9）
+_CELLS = 144
+
+
+def decade(years):
+    """
+    以出生年代分組
+    :param years: 西元年陣列
+    :return: 年代陣列（1990 表示 1990-1999）
+    """
+    return np.asarray(years) // 10 * 10
+
+
+class PopulationStats:
+    """
+    可合併的族群統計；每個時期各自累計
+    """
+
+    def __init__(self):
+        self.charts = {}  # 時期 -> 命盤數
+        self.marginals = {}  # 時期 -> (8, 12) 各欄位次數
+        self.pairs = {}  # 時期 -> (28, 144) 欄位兩兩聯合次數，順序同 FEATURE_PAIRS
+        self.triples = {}  # 時期 -> (4, 1728) 四支任三支的聯合次數，順序同 BRANCH_TRIPLES
+        self.wen_chang = {}  # 時期 -> (5,) 文昌貴人：[任一位置命中的命盤數, 年支, 月支, 日支, 時支]
+
+    def _period(self, period):
+        if period not in self.charts:
+            self.charts[period] = 0
+            self.marginals[period] = np.zeros((8, 12), dtype=np.int64)
+            self.pairs[period] = np.zeros((len(FEATURE_PAIRS), _CELLS), dtype=np.int64)
+            self.triples[period] = np.zeros((len(BRANCH_TRIPLES), 12 ** 3), dtype=np.int64)
+            self.wen_chang[period] = np.zeros(5, dtype=np.int64)
+
+    def add(self, stems, branches, periods=None):
+        """
+        累加一塊命盤
+        :param stems: 天干編碼 (N, 4)
+        :param branches: 地支編碼 (N, 4)
+        :param periods: 各命盤所屬時期 (N,) 整數陣列，None 表示全部屬於時期 0
+        """
+        stems = np.asarray(stems, dtype=np.int64)
+        branches = np.asarray(branches, dtype=np.int64)
+        n = len(stems)
+        if n == 0:
+            return
+        if periods is None:
+            keys, group = np.zeros(1, dtype=np.int64), np.zeros(n, dtype=np.int64)
+        else:
+            keys, group = np.unique(np.asarray(periods, dtype=np.int64), return_inverse=True)
+            group = group.ravel()
+        p = len(keys)
+        columns = np.concatenate([stems, branches], axis=1)
+
+        charts = np.bincount(group, minlength=p)
+        marginals = np.stack([
+            np.bincount(group * 12 + columns[:, f], minlength=p * 12).reshape(p, 12) for f in range(8)
+        ], axis=1)
+        pairs = np.stack([
+            np.bincount(group * _CELLS + columns[:, f] * 12 + columns[:, g], minlength=p * _CELLS).reshape(p, _CELLS)
+            for f, g in FEATURE_PAIRS
+        ], axis=1)
+        triples = np.stack([
+            np.bincount(
+                group * 1728 + branches[:, i] * 144 + branches[:, j] * 12 + branches[:, k], minlength=p * 1728
+            ).reshape(p, 1728)
+            for i, j, k in BRANCH_TRIPLES
+        ], axis=1)
+        wen_chang = np.frombuffer(codes.WEN_CHANG, dtype=np.uint8).astype(np.int64)[stems[:, 2]]
+        hits = branches == wen_chang[:, None]
+        wen = np.stack(
+            [np.bincount(group, weights=hits.any(axis=1), minlength=p)]
+            + [np.bincount(group, weights=hits[:, i], minlength=p) for i in range(4)],
+            axis=1,
+        ).astype(np.int64)
+
+        for g, period in enumerate(keys.tolist()):
+            self._period(period)
+            self.charts[period] += int(charts[g])
+            self.marginals[period] += marginals[g]
+            self.pairs[period] += pairs[g]
+            self.triples[period] += triples[g]
+            self.wen_chang[period] += wen[g]
+
+    def add_datetimes(self, datetimes, period=decade):
+        """
+        由出生時間累加（內部以 batch.bazi_batch 排盤）
+        :param datetimes: 出生時間陣列
+        :param period: 由西元年陣列算出時期的函式，預設為 decade；None 表示不分時期
+        """
+        datetimes = np.asarray(datetimes, dtype="datetime64[s]").ravel()
+        stems, branches = bazi_batch(datetimes)
+        periods = None
+        if period is not None:
+            periods = period(datetimes.astype("datetime64[Y]").astype(np.int64) + 1970)
+        self.add(stems, branches, periods)
+
+    def merge(self, other):
+        """
+        併入另一份部分結果（例如其他進程或檔案算出的）
+        :param other: PopulationStats
+        :return: self
+        """
+        for period in other.charts:
+            self._period(period)
+            self.charts[period] += other.charts[period]
+            self.marginals[period] += other.marginals[period]
+            self.pairs[period] += other.pairs[period]
+            self.triples[period] += other.triples[period]
+            self.wen_chang[period] += other.wen_chang[period]
+        return self
+
+    def __iadd__(self, other):
+        return self.merge(other)
+
+    def save(self, path):
+        """
+        儲存部分結果（.npz）
+        :param path: 檔案路徑
+        """
+        periods = sorted(self.charts)
+        np.savez_compressed(
+            path,
+            periods=np.array(periods, dtype=np.int64),
+            charts=np.array([self.charts[p] for p in periods], dtype=np.int64),
+            marginals=np.array([self.marginals[p] for p in periods]).reshape(-1, 8, 12),
+            pairs=np.array([self.pairs[p] for p in periods]).reshape(-1, len(FEATURE_PAIRS), _CELLS),
+            triples=np.array([self.triples[p] for p in periods]).reshape(-1, len(BRANCH_TRIPLES), 1728),
+            wen_chang=np.array([self.wen_chang[p] for p in periods]).reshape(-1, 5),
+        )
+
+    @classmethod
+    def load(cls, path):
+        """
+        讀取 save 儲存的部分結果
+        :param path: 檔案路徑
+        :return: PopulationStats
+        """
+        stats = cls()
+        with np.load(path) as data:
+            for i, period in enumerate(data["periods"].tolist()):
+                stats.charts[period] = int(data["charts"][i])
+                stats.marginals[period] = data["marginals"][i].copy()
+                stats.pairs[period] = data["pairs"][i].copy()
+                stats.triples[period] = data["triples"][i].copy()
+                stats.wen_chang[period] = data["wen_chang"][i].copy()
+        return stats
+
+    def _select(self, table, period):
+        if period is None:
+            return sum(table.values()) if table else None
+        return table.get(period)
+
+    def total(self, period=None):
+        """
+        :return: 命盤數
+        """
+        return int(self._select(self.charts, period) or 0)
+
+    def relations(self, period=None):
+        """
+        各種關係的出現次數（同一命盤出現兩次算兩次）
+        :param period: 時期，None 表示全部
+        :return: {(種類, 干支編碼 tuple（已排序）, 五行編碼): 次數}
+        """
+        counts = {}
+        pairs = self._select(self.pairs, period)
+        triples = self._select(self.triples, period)
+        if pairs is None:
+            return counts
+        for (f, g), row in zip(FEATURE_PAIRS, pairs):
+            if f < 4 <= g:
+                continue  # 干支之間沒有關係規則
+            size = _SIZES[f]
+            hits = codes.STEM_PAIR_HITS if size == 10 else codes.BRANCH_PAIR_HITS
+            for cell in np.flatnonzero(row).tolist():
+                a, b = divmod(cell, 12)
+                for kind, element in hits[a * size + b]:
+                    key = (kind, tuple(sorted((a, b))), element)
+                    counts[key] = counts.get(key, 0) + int(row[cell])
+        for row in triples:
+            for cell in np.flatnonzero(row).tolist():
+                for kind, element in codes.BRANCH_TRIPLE_HITS[cell]:
+                    a, rest = divmod(cell, 144)
+                    key = (kind, tuple(sorted((a,) + divmod(rest, 12))), element)
+                    counts[key] = counts.get(key, 0) + int(row[cell])
+        return counts
+
+    def relation_table(self, period=None):
+        """
+        以文字列出各種關係的出現次數，依次數由多到少排列
+        :return: [(關係名稱, 干支, 合化五行或 None, 次數), ...]
+        """
+        rows = []
+        for (kind, key_codes, element), count in self.relations(period).items():
+            names = codes.STEMS if kind == codes.HE else codes.BRANCHES
+            rows.append((codes.RELATION_NAMES[kind], "".join(names[c] for c in key_codes), codes.ELEMENTS[element], count))
+        rows.sort(key=lambda row: (-row[3], row[0], row[1]))
+        return rows
+
+    def relation_count(self, name, *terms, period=None):
+        """
+        查詢某一關係的出現次數
+        :param name: 關係名稱，如 "六合"、"三合"、"沖"
+        :param terms: 干支，如 ("卯", "戌")；順序不拘
+        :param period: 時期，None 表示全部
+        :return: 次數
+        """
+        kind = codes.RELATION_NAMES.index(name)
+        names = codes.STEM_CODE if kind == codes.HE else codes.BRANCH_CODE
+        key_codes = tuple(sorted(names[t] for t in terms))
+        return sum(
+            count for (k, c, _), count in self.relations(period).items() if k == kind and c == key_codes
+        )
+
+    def elements_by_period(self, kinds=None):
+        """
+        各時期合化五行的分布
+        :param kinds: 只計入這些關係種類（如 (codes.HE,)），None 表示全部有合化五行的關係
+        :return: {時期: {五行: 次數}}
+        """
+        result = {}
+        for period in sorted(self.charts):
+            spread = {element: 0 for element in codes.ELEMENTS[1:]}
+            for (kind, _, element), count in self.relations(period).items():
+                if element and (kinds is None or kind in kinds):
+                    spread[codes.ELEMENTS[element]] += count
+            result[period] = spread
+        return result
+
+    def wen_chang_rate(self, period=None):
+        """
+        文昌貴人的命中情形
+        :return: {"charts", "hits", "rate", "positions": {"年支": 次數, ...}}
+        """
+        total = self.total(period)
+        wen = self._select(self.wen_chang, period)
+        if wen is None:
+            wen = np.zeros(5, dtype=np.int64)
+        return {
+            "charts": total,
+            "hits": int(wen[0]),
+            "rate": float(wen[0]) / total if total else 0.0,
+            "positions": {FEATURES[4 + i]: int(wen[1 + i]) for i in range(4)},
+        }
+
+    def histogram(self, feature, period=None):
+        """
+        單一欄位的次數分布
+        :param feature: 欄位名稱，如 "日干"、"月支"
+        :return: {干支: 次數}
+        """
+        f = FEATURES.index(feature)
+        marginals = self._select(self.marginals, period)
+        names = codes.STEMS if f < 4 else codes.BRANCHES
+        return {name: int(marginals[f][i]) if marginals is not None else 0 for i, name in enumerate(names)}
+
+    def crosstab(self, row, column, period=None):
+        """
+        兩個欄位的交叉表
+        :param row: 列欄位名稱，如 "日干"
+        :param column: 欄欄位名稱，如 "月支"
+        :return: (列標籤, 欄標籤, 次數陣列)
+        """
+        f, g = FEATURES.index(row), FEATURES.index(column)
+        if f == g:
+            raise ValueError("交叉表的兩個欄位不可相同")
+        pairs = self._select(self.pairs, period)
+        a, b = min(f, g), max(f, g)
+        table = np.zeros((12, 12), dtype=np.int64) if pairs is None else pairs[_PAIR_INDEX[(a, b)]].reshape(12, 12)
+        table = table[:_SIZES[a], :_SIZES[b]]
+        if f > g:
+            table = table.T
+        labels = lambda k: list(codes.STEMS if k < 4 else codes.BRANCHES)
+        return labels(f), labels(g), table
+
+    def summary(self, top=20):
+        """
+        可 JSON 序列化的摘要
+        """
+        return {
+            "charts": self.total(),
+            "periods": {str(period): count for period, count in sorted(self.charts.items())},
+            "relations": [list(row) for row in self.relation_table()[:top]],
+            "elements_by_period": {str(k): v for k, v in self.elements_by_period().items()},
+            "wen_chang": self.wen_chang_rate(),
+        }
+
+
+def _chart_chunks(stream, chunk_size):
+    """
+    由 main.py --batch 的輸出（JSONL）逐塊讀出命盤
+    :return: 產生 (天干, 地支, 出生年) 陣列的產生器
+    """
+    stems, branches, years = [], [], []
+    for line in stream:
+        if not line.strip():
+            continue
+        chart = json.loads(line)
+        pillars = chart["pillars"]
+        stems.append([codes.STEM_CODE[p[0]] for p in pillars])
+        branches.append([codes.BRANCH_CODE[p[1]] for p in pillars])
+        years.append(int(chart["birth"][:4]))
+        if len(stems) >= chunk_size:
+            yield np.array(stems), np.array(branches), np.array(years)
+            stems, branches, years = [], [], []
+    if stems:
+        yield np.array(stems), np.array(branches), np.array(years)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="族群統計")
+    parser.add_argument("--charts", help="main.py --batch 輸出的命盤 JSONL，- 表示標準輸入")
+    parser.add_argument("--merge", nargs="*", default=[], metavar="NPZ", help="併入先前儲存的部分結果")
+    parser.add_argument("--save", metavar="NPZ", help="儲存部分結果，供之後合併")
+    parser.add_argument("--chunk-size", type=int, default=100000)
+    parser.add_argument("--top", type=int, default=20, help="摘要列出的關係數")
+    args = parser.parse_args()
+
+    stats = PopulationStats()
+    if args.charts:
+        stream = sys.stdin if args.charts == "-" else open(args.charts, encoding="utf-8")
+        for chunk_stems, chunk_branches, chunk_years in _chart_chunks(stream, args.chunk_size):
+            stats.add(chunk_stems, chunk_branches, decade(chunk_years))
+    for path in args.merge:
+        stats.merge(PopulationStats.load(path))
+    if args.save:
+        stats.save(args.save)
+    print(json.dumps(stats.summary(args.top), ensure_ascii=False, indent=2))
@@ -0,0 +1,211 @@
+# 反查索引：由四柱（可部分未知）找出 1900-2100 年間所有符合的出生時段
+#
+# 一天內四柱只會在 0 點（換日柱）、各時辰交界的奇數整點，以及 23 點（晚子時換時干）改變，
+# 因此每天切成 13 個時段：[0,1) [1,3) ... [21,23) [23,24)。以 batch.bazi_batch 算出每段的
+# 六十甲子編碼，再依年、月、日、時柱各建一份倒排表。
+#
+#   index = PillarIndex.build()
+#   index.query("甲子", None, "丙寅", None)      # 年柱甲子、日柱丙寅，月、時柱不拘
+#   index.query(day="甲?", branches_include="申子辰")  # 日干為甲，且四支中有申子辰
+
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import codes
+import jieqi
+from batch import bazi_batch
+
+SECONDS_PER_DAY = 86400
+EPOCH = datetime(1970, 1, 1)
+
+# 每天 13 個時段的起始秒數
+_SEGMENT_OFFSETS = np.array([0] + [h * 3600 for h in range(1, 24, 2)], dtype=np.int64)
+
+PILLAR_NAMES = ("year", "month", "day", "hour")
+
+
+def _to_seconds(value):
+    return int((value - EPOCH).total_seconds())
+
+
+def _parse_pillar(value):
+    """
+    解析單柱條件
+    :param value: None / "?" 表示不拘；"甲子" 指定干支；"甲?" 只指定干；"?子" 只指定支；或 0-59 的整數
+    :return: (六十甲子編碼或 None, 天干編碼或 None, 地支編碼或 None)
+    """
+    if value is None:
+        return None, None, None
+    if isinstance(value, (int, np.integer)):
+        if not 0 <= value < 60:
+            raise ValueError(f"無效的干支編碼: {value}")
+        return int(value), None, None
+    value = value.strip()
+    if value in ("", "?", "??"):
+        return None, None, None
+    if len(value) != 2:
+        raise ValueError(f"無效的干支: {value}")
+    stem, branch = value
+    stem_code = None if stem == "?" else codes.STEM_CODE.get(stem)
+    branch_code = None if branch == "?" else codes.BRANCH_CODE.get(branch)
+    if (stem != "?" and stem_code is None) or (branch != "?" and branch_code is None):
+        raise ValueError(f"無效的干支: {value}")
+    if stem_code is not None and branch_code is not None:
+        if stem_code % 2 != branch_code % 2:
+            raise ValueError(f"不存在的干支組合: {value}")
+        return int(codes.pillar_code(stem_code, branch_code)), None, None
+    return None, stem_code, branch_code
+
+
+def _parse_branches(branches):
+    """
+    解析「四支中必須出現的地支」條件
+    :param branches: 地支字串，例如 "申子辰"；None 或空字串表示不拘
+    :return: 地支位元遮罩，0 表示不拘
+    """
+    if not branches:
+        return 0
+    branch_codes = []
+    for b in branches:
+        if b not in codes.BRANCH_CODE:
+            raise ValueError(f"無效的地支: {b}")
+        branch_codes.append(codes.BRANCH_CODE[b])
+    return codes.branch_mask(branch_codes)
+
+
+class PillarIndex:
+    """
+    四柱倒排索引：每個時段一列，記錄起始時刻與四柱的六十甲子編碼
+    """
+
+    def __init__(self, starts, pillars, end):
+        self.starts = starts  # 各時段起始秒數 (int64, 已排序)
+        self.pillars = pillars  # 各時段四柱編碼 (N, 4) uint8
+        self.end = end  # 最後一段的結束秒數
+        self.ends = np.append(starts[1:], end)
+        stems = pillars % 10
+        branches = pillars % 12
+        self.branch_masks = np.bitwise_or.reduce(np.left_shift(1, branches.astype(np.uint16)), axis=1)
+        # 倒排表：postings[k] 為依第 k 柱編碼排序的時段序號，offsets[k][v] 為編碼 v 的起點
+        self.postings = []
+        self.offsets = []
+        for k in range(4):
+            order = np.argsort(pillars[:, k], kind="stable").astype(np.int32)
+            counts = np.bincount(pillars[:, k], minlength=60)
+            self.postings.append(order)
+            self.offsets.append(np.concatenate(([0], np.cumsum(counts))))
+        self._stems = stems
+        self._branches = branches
+
+    @classmethod
+    def build(cls, first_year=jieqi.FIRST_YEAR, last_year=jieqi.LAST_YEAR):
+        """
+        建立索引
+        :param first_year: 起始西元年
+        :param last_year: 結束西元年
+        :return: PillarIndex
+        """
+        first_day = _to_seconds(datetime(first_year, 1, 1)) // SECONDS_PER_DAY
+        last_day = _to_seconds(datetime(last_year + 1, 1, 1)) // SECONDS_PER_DAY
+        days = np.arange(first_day, last_day, dtype=np.int64)
+        starts = (days[:, None] * SECONDS_PER_DAY + _SEGMENT_OFFSETS[None, :]).ravel()
+        stems, branches = bazi_batch(starts.astype("datetime64[s]"))
+        pillars = codes.pillar_code(stems.astype(np.int16), branches.astype(np.int16)).astype(np.uint8)
+        return cls(starts, pillars, last_day * SECONDS_PER_DAY)
+
+    def save(self, path):
+        """
+        儲存索引（.npz）
+        :param path: 檔案路徑
+        """
+        np.savez_compressed(path, starts=self.starts, pillars=self.pillars, end=np.int64(self.end))
+
+    @classmethod
+    def load(cls, path):
+        """
+        讀取 save 儲存的索引
+        :param path: 檔案路徑
+        :return: PillarIndex
+        """
+        with np.load(path) as data:
+            return cls(data["starts"], data["pillars"], int(data["end"]))
+
+    def _candidates(self, full):
+        """
+        以最具選擇性的完整干支條件取候選時段
+        :param full: [(柱位, 六十甲子編碼), ...]
+        :return: 候選時段序號陣列
+        """
+        if not full:
+            return np.arange(len(self.starts), dtype=np.int32)
+        k, v = min(full, key=lambda kv: self.offsets[kv[0]][kv[1] + 1] - self.offsets[kv[0]][kv[1]])
+        candidates = self.postings[k][self.offsets[k][v]:self.offsets[k][v + 1]]
+        return np.sort(candidates)
+
+    def match(self, year=None, month=None, day=None, hour=None, branches_include=None, start=None, end=None):
+        """
+        找出符合條件的時段序號
+        :param year: 年柱條件（見 _parse_pillar）
+        :param month: 月柱條件
+        :param day: 日柱條件
+        :param hour: 時柱條件
+        :param branches_include: 四支中必須出現的地支，例如 "申子辰"
+        :param start: 起始時間 (datetime)，含
+        :param end: 結束時間 (datetime)，不含
+        :return: 時段序號陣列（已排序）
+        """
+        conditions = [_parse_pillar(value) for value in (year, month, day, hour)]
+        required = _parse_branches(branches_include)
+        full = [(k, code) for k, (code, _, _) in enumerate(conditions) if code is not None]
+        candidates = self._candidates(full)
+
+        if start is not None or end is not None:
+            lo = 0 if start is None else np.searchsorted(self.ends, _to_seconds(start), side="right")
+            hi = len(self.starts) if end is None else np.searchsorted(self.starts, _to_seconds(end), side="left")
+            candidates = candidates[(candidates >= lo) & (candidates < hi)]
+
+        mask = np.ones(len(candidates), dtype=bool)
+        for k, (code, stem, branch) in enumerate(conditions):
+            if code is not None:
+                mask &= self.pillars[candidates, k] == code
+            if stem is not None:
+                mask &= self._stems[candidates, k] == stem
+            if branch is not None:
+                mask &= self._branches[candidates, k] == branch
+        if required:
+            mask &= (self.branch_masks[candidates] & required) == required
+        return candidates[mask]
+
+    def intervals(self, segments, start=None, end=None):
+        """
+        將時段序號合併為連續的時間區間
+        :param segments: match 回傳的時段序號
+        :param start: 若指定，區間起點不早於此時間
+        :param end: 若指定，區間終點不晚於此時間
+        :return: [(開始 datetime, 結束 datetime), ...]，結束不含
+        """
+        if len(segments) == 0:
+            return []
+        # 序號相鄰的時段在時間上也相鄰，合併之
+        breaks = np.flatnonzero(np.diff(segments) != 1) + 1
+        firsts = segments[np.concatenate(([0], breaks))]
+        lasts = segments[np.concatenate((breaks - 1, [len(segments) - 1]))]
+        lo = None if start is None else _to_seconds(start)
+        hi = None if end is None else _to_seconds(end)
+        result = []
+        for a, b in zip(self.starts[firsts].tolist(), self.ends[lasts].tolist()):
+            if lo is not None:
+                a = max(a, lo)
+            if hi is not None:
+                b = min(b, hi)
+            result.append((EPOCH + timedelta(seconds=a), EPOCH + timedelta(seconds=b)))
+        return result
+
+    def query(self, year=None, month=None, day=None, hour=None, branches_include=None, start=None, end=None):
+        """
+        反查符合四柱條件的出生時間區間
+        :return: [(開始 datetime, 結束 datetime), ...]，參數同 match
+        """
+        segments = self.match(year, month, day, hour, branches_include, start, end)
+        return self.intervals(segments, start, end)
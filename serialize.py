@@ -0,0 +1,344 @@
+# 命盤序列化：compute_chart 的結果（solar_to_lunar、get_start_luck、get_luck_pillars、analyze_bazi）
+# 以整數編碼存成緊湊的二進位列格式，或 NumPy .npz 欄式格式，並可還原成原本的字典。
+#
+# 四柱、大運以六十甲子編碼、節氣以 jieqi.JIE_QI_NAMES 序號、時間以自 1970-01-01 起的微秒數儲存；
+# 藏干、關係、文昌等分析結果由四柱決定，不儲存，還原時以 codes 重新產生（走分析快取）。
+#
+#   data = b"".join(encode_chart(chart, key) for key, chart in enumerate(charts))
+#   charts = [chart for key, chart in iter_rows(data)]
+#   save_npz("charts.npz", charts); charts = [chart for key, chart in iter_columns(load_npz("charts.npz"))]
+
+import struct
+from array import array
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import codes
+import jieqi
+
+EPOCH = datetime(1970, 1, 1)
+_US = timedelta(microseconds=1)
+
+# 農曆年月日的中文（與 lunar_python 的 getYearInChinese / getMonthInChinese / getDayInChinese 相同）
+_DIGITS = "〇一二三四五六七八九"
+_LUNAR_MONTHS = ("", "正", "二", "三", "四", "五", "六", "七", "八", "九", "十", "冬", "腊")
+_LEAP = "闰"
+_LUNAR_DAYS = ("",) + tuple(f"初{d}" for d in "一二三四五六七八九十") + tuple(f"十{d}" for d in "一二三四五六七八九") + \
+    ("二十",) + tuple(f"廿{d}" for d in "一二三四五六七八九") + ("三十",)
+_MONTH_CODE = {name: i for i, name in enumerate(_LUNAR_MONTHS) if name}
+_DAY_CODE = {name: i for i, name in enumerate(_LUNAR_DAYS) if name}
+_JIE_QI_CODE = {name: i for i, name in enumerate(jieqi.JIE_QI_NAMES)}
+_GENDERS = ("女", "男")
+_JIA_ZI_CODE = {name: i for i, name in enumerate(codes.JIA_ZI)}
+
+LUCK_PILLARS = 8
+_NO_FESTIVAL = 0xFFFF  # festival 為 None（星曆檔路徑）
+_FESTIVAL_SEP = "\x1f"
+
+# 每列：編號（呼叫端自訂，如輸入行號或使用者編號）、出生時間、四柱、性別、農曆年月日（0 表示無；閏月為負）、當前與下一節氣序號、
+# 當前節氣開始、下一節氣開始、距當前節氣、距下一節氣、起運歲數（年、月、日）、起運時間、大運、節日長度，
+# 之後接節日的 UTF-8 文字
+ROW = struct.Struct(f"<qq4sBhbBBBqqqqHHHq{LUCK_PILLARS}sH")
+MAGIC = b"BZC1"
+
+COLUMNS = (
+    ("key", np.int64), ("birth", np.int64), ("pillars", (np.uint8, 4)), ("gender", np.uint8),
+    ("lunar_year", np.int16), ("lunar_month", np.int8), ("lunar_day", np.uint8),
+    ("this_jie_qi", np.uint8), ("next_jie_qi", np.uint8),
+    ("this_jie_qi_start", np.int64), ("next_jie_qi_start", np.int64),
+    ("time_to_this_jq", np.int64), ("time_to_next_jq", np.int64),
+    ("start_years", np.uint16), ("start_months", np.uint16), ("start_days", np.uint16),
+    ("start_date", np.int64), ("luck_pillars", (np.uint8, LUCK_PILLARS)),
+)
+# 與 ROW 逐位元組對應的結構化型別（最後為節日長度），ColumnWriter 以此直接切出各欄
+ROW_DTYPE = np.dtype(
+    [(name, np.dtype(dtype[0]).newbyteorder("<"), (dtype[1],)) if isinstance(dtype, tuple)
+     else (name, np.dtype(dtype).newbyteorder("<")) for name, dtype in COLUMNS]
+    + [("festival_length", "<u2")]
+)
+assert ROW_DTYPE.itemsize == ROW.size
+
+
+def _micros(value):
+    return (value - EPOCH) // _US
+
+
+def _datetime(micros):
+    return EPOCH + timedelta(microseconds=micros)
+
+
+def _pillar(gan, zhi):
+    return _JIA_ZI_CODE[gan + zhi]
+
+
+def _lunar_codes(lunar_info):
+    year, month, day = lunar_info["year"], lunar_info["month"], lunar_info["day"]
+    if year is None:
+        return 0, 0, 0
+    try:
+        year_code = int("".join(str(_DIGITS.index(d)) for d in year))
+        month_code = -_MONTH_CODE[month[1:]] if month.startswith(_LEAP) else _MONTH_CODE[month]
+        return year_code, month_code, _DAY_CODE[day]
+    except (ValueError, KeyError):
+        raise ValueError(f"無法編碼的農曆日期: {year} {month} {day}")
+
+
+def _fields(chart, key=0):
+    """
+    將命盤字典轉為整數欄位（順序同 COLUMNS）及節日文字
+    """
+    lunar_info = chart["lunar_info"]
+    luck_info = chart["luck_info"]
+    stems, branches = chart["heavenly_stems"], chart["earthly_branches"]
+    if len(chart["luck_pillars"]) != LUCK_PILLARS:
+        raise ValueError(f"大運數必須為 {LUCK_PILLARS}")
+    pillars = bytes(_pillar(s, b) for s, b in zip(stems, branches))
+    luck = bytes(_JIA_ZI_CODE[p] for p in chart["luck_pillars"])
+    year_code, month_code, day_code = _lunar_codes(lunar_info)
+    start_age = luck_info["start_age"]
+    festival = lunar_info["festival"]
+    fields = (
+        key, _micros(chart["birth_date"]), pillars, _GENDERS.index(luck_info["gender"]),
+        year_code, month_code, day_code,
+        _JIE_QI_CODE[lunar_info["this_jie_qi"]], _JIE_QI_CODE[lunar_info["next_jie_qi"]],
+        _micros(datetime.fromisoformat(lunar_info["this_jie_qi_starttime"])),
+        _micros(lunar_info["next_jie_qi_starttime"]),
+        lunar_info["time_to_this_jq"] // _US, lunar_info["time_to_next_jq"] // _US,
+        start_age["years"], start_age["months"], start_age["days"],
+        _micros(luck_info["start_date"]), luck,
+    )
+    return fields, festival
+
+
+def encode_chart(chart, key=0):
+    """
+    將一張命盤編碼為二進位列
+    :param chart: main.compute_chart 的結果
+    :param key: 編號（int64）
+    :return: bytes
+    """
+    fields, festival = _fields(chart, key)
+    if festival is None:
+        return ROW.pack(*fields, _NO_FESTIVAL)
+    text = _FESTIVAL_SEP.join(festival).encode("utf-8")
+    return ROW.pack(*fields, len(text)) + text
+
+
+def _build_chart(fields, festival):
+    """
+    由整數欄位還原命盤字典（格式同 main.compute_chart）
+    """
+    (_, birth, pillars, gender, year_code, month_code, day_code, this_jq, next_jq,
+     this_start, next_start, to_this, to_next, years, months, days, start_date, luck) = fields
+    stems = tuple(p % 10 for p in pillars)
+    branches = tuple(p % 12 for p in pillars)
+    gan = [codes.STEMS[s] for s in stems]
+    zhi = [codes.BRANCHES[b] for b in branches]
+    if year_code:
+        lunar_year = "".join(_DIGITS[int(d)] for d in str(year_code))
+        lunar_month = (_LEAP if month_code < 0 else "") + _LUNAR_MONTHS[abs(month_code)]
+        lunar_day = _LUNAR_DAYS[day_code]
+    else:
+        lunar_year = lunar_month = lunar_day = None
+    lunar_info = {
+        "year": lunar_year,
+        "month": lunar_month,
+        "day": lunar_day,
+        "hour": zhi[3],
+        "year_gan": gan[0],
+        "year_zhi": zhi[0],
+        "month_gan": gan[1],
+        "month_zhi": zhi[1],
+        "day_gan": gan[2],
+        "day_zhi": zhi[2],
+        "hour_gan": gan[3],
+        "hour_zhi": zhi[3],
+        "festival": festival,
+        "this_jie_qi": jieqi.JIE_QI_NAMES[this_jq],
+        "next_jie_qi": jieqi.JIE_QI_NAMES[next_jq],
+        "this_jie_qi_starttime": _datetime(this_start).strftime("%Y-%m-%d %H:%M:%S"),
+        "next_jie_qi_starttime": _datetime(next_start),
+        "time_to_this_jq": timedelta(microseconds=to_this),
+        "time_to_next_jq": timedelta(microseconds=to_next),
+    }
+    luck_info = {
+        "start_age": {"years": years, "months": months, "days": days},
+        "start_date": _datetime(start_date),
+        "gender": _GENDERS[gender],
+        "year_gan": gan[0],
+        "month_gan": gan[1],
+        "month_zhi": zhi[1],
+    }
+    return {
+        "birth_date": _datetime(birth),
+        "lunar_info": lunar_info,
+        "heavenly_stems": gan,
+        "earthly_branches": zhi,
+        "luck_info": luck_info,
+        "luck_pillars": [codes.JIA_ZI[p] for p in luck],
+        "analysis": codes.render_analysis(codes.analyze_codes(stems, branches)),
+    }
+
+
+def _festival(length, text):
+    if length == _NO_FESTIVAL:
+        return None
+    return text.split(_FESTIVAL_SEP) if text else []
+
+
+def decode_chart(data, offset=0):
+    """
+    解碼一列
+    :param data: bytes / memoryview
+    :param offset: 起始位置
+    :return: (編號, 命盤字典, 下一列的起始位置)
+    """
+    *fields, length = ROW.unpack_from(data, offset)
+    offset += ROW.size
+    text = b""
+    if length != _NO_FESTIVAL:
+        text = bytes(data[offset:offset + length])
+        offset += length
+    return fields[0], _build_chart(fields, _festival(length, text.decode("utf-8"))), offset
+
+
+def iter_rows(data):
+    """
+    逐列解碼（data 為多列串接，可帶或不帶 MAGIC 檔頭）
+    :return: 產生 (編號, 命盤字典) 的產生器
+    """
+    offset = len(MAGIC) if data[:len(MAGIC)] == MAGIC else 0
+    while offset < len(data):
+        key, chart, offset = decode_chart(data, offset)
+        yield key, chart
+
+
+def write_rows(charts, output):
+    """
+    將命盤寫成二進位列檔（含 MAGIC 檔頭），編號為流水號
+    :param charts: 命盤字典的可迭代物件
+    :param output: 二進位輸出串流
+    :return: 寫入筆數
+    """
+    output.write(MAGIC)
+    count = 0
+    for chart in charts:
+        output.write(encode_chart(chart, count))
+        count += 1
+    return count
+
+
+class ColumnWriter:
+    """
+    逐筆累加、最後輸出為欄式陣列；可接受命盤字典或 encode_chart 的二進位列。
+    .npz 的每個陣列必須一次寫入，所以整批都留在記憶體中，但以二進位列串接保存（每筆約 100 位元組），
+    可用 max_records 限制筆數
+    """
+
+    def __init__(self, max_records=None):
+        """
+        :param max_records: 筆數上限，超過時 append 丟出 ValueError；None 表示不限
+        """
+        self.max_records = max_records
+        self._rows = bytearray()  # ROW 列串接，節日長度欄不使用
+        self._text = bytearray()  # 節日 UTF-8 文字串接
+        self._offsets = array("q")  # 每筆節日在 _text 中的 (起, 迄)，None 為 (-1, -1)
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, chart, key=None):
+        """
+        :param chart: 命盤字典或 encode_chart 的結果
+        :param key: 編號，預設為流水號（傳入二進位列時沿用其中的編號）
+        """
+        if self.max_records is not None and self._count >= self.max_records:
+            raise ValueError(f".npz 輸出最多 {self.max_records} 筆，請改用 rows 格式或分檔輸出")
+        if isinstance(chart, (bytes, bytearray, memoryview)):
+            row = bytes(chart[:ROW.size])
+            length = ROW.unpack_from(row, 0)[-1]
+            text = None if length == _NO_FESTIVAL else bytes(chart[ROW.size:ROW.size + length])
+        else:
+            fields, festival = _fields(chart, self._count if key is None else key)
+            text = None if festival is None else _FESTIVAL_SEP.join(festival).encode("utf-8")
+            row = ROW.pack(*fields, _NO_FESTIVAL if text is None else len(text))
+        self._rows += row
+        if text is None:
+            self._offsets.extend((-1, -1))
+        else:
+            self._offsets.extend((len(self._text), len(self._text) + len(text)))
+            self._text += text
+        self._count += 1
+
+    def columns(self):
+        """
+        :return: {欄位名稱: 陣列}；節日以 festival_text（UTF-8）與 festival_offsets 表示，None 的 offsets 為 -1
+        """
+        n = self._count
+        table = np.frombuffer(self._rows, dtype=ROW_DTYPE)
+        result = {}
+        for name, dtype in COLUMNS:
+            result[name] = table[name].astype(dtype[0] if isinstance(dtype, tuple) else dtype)
+        result["festival_text"] = np.frombuffer(self._text, dtype=np.uint8).copy()
+        result["festival_offsets"] = np.frombuffer(self._offsets.tobytes(), dtype=np.int64).reshape(n, 2).copy()
+        return result
+
+    def save(self, path):
+        """
+        儲存為 .npz
+        :param path: 檔案路徑或二進位串流
+        """
+        np.savez_compressed(path, **self.columns())
+
+
+def to_columns(charts):
+    """
+    :param charts: 命盤字典的可迭代物件
+    :return: 欄式陣列字典（見 ColumnWriter.columns）
+    """
+    writer = ColumnWriter()
+    for chart in charts:
+        writer.append(chart)
+    return writer.columns()
+
+
+def save_npz(path, charts):
+    """
+    將命盤存成欄式 .npz
+    :return: 寫入筆數
+    """
+    writer = ColumnWriter()
+    for chart in charts:
+        writer.append(chart)
+    writer.save(path)
+    return len(writer)
+
+
+def load_npz(path):
+    """
+    讀取 save_npz 的檔案
+    :return: 欄式陣列字典
+    """
+    with np.load(path) as data:
+        return {name: data[name] for name in data.files}
+
+
+def iter_columns(columns):
+    """
+    由欄式陣列逐筆還原命盤字典
+    :param columns: to_columns / load_npz 的結果
+    :return: 產生 (編號, 命盤字典) 的產生器
+    """
+    names = [name for name, _ in COLUMNS]
+    lists = {name: columns[name].tolist() for name in names}
+    text = columns["festival_text"].tobytes()
+    offsets = columns["festival_offsets"].tolist()
+    for i in range(len(offsets)):
+        fields = [lists[name][i] for name in names]
+        fields[2] = bytes(fields[2])
+        fields[-1] = bytes(fields[-1])
+        start, end = offsets[i]
+        festival = None if start < 0 else _festival(end - start, text[start:end].decode("utf-8"))
+        yield fields[0], _build_chart(fields, festival)
@@ -0,0 +1,248 @@
+# 命盤 HTTP 服務：以 asyncio 提供 JSON API，只用標準函式庫
+#
+#   python server.py --port 8000 --workers 4
+#
+#   GET  /lunar?year=1990&month=8&day=15&hour=14          農曆及節氣 (solar_to_lunar)
+#   GET  /luck?year=1990&month=8&day=15&hour=14&gender=1  起運及大運干支
+#   GET  /analyze?stems=庚甲壬丁&branches=午申子未          八字分析 (analyze_bazi)
+#   GET  /chart?year=1990&month=8&day=15&hour=14&gender=1 完整命盤
+#   GET  /stats                                            快取及合併請求統計
+#
+# 參數也可用 POST 的 JSON body 傳入。相同參數的請求若仍在計算中會合併為一次計算，
+# 已完成的結果存在有上限的 LRU；lunar_python 的計算交給進程池，不阻塞事件迴圈。
+
+import argparse
+import asyncio
+import json
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from urllib.parse import parse_qsl, urlsplit
+
+import main
+from bulk import chart_to_json, parse_birth
+from parallel import init_worker
+
+DEFAULT_CACHE_SIZE = 100000
+MAX_BODY = 1 << 16
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 500: "Internal Server Error"}
+
+
+def _json_safe(value):
+    """
+    將 datetime / timedelta 轉為字串與秒數，其餘原樣
+    """
+    if isinstance(value, dict):
+        return {k: _json_safe(v) for k, v in value.items()}
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M:%S")
+    if isinstance(value, timedelta):
+        return value.total_seconds()
+    return value
+
+
+def compute(endpoint, params):
+    """
+    計算單一請求的結果（在工作進程中執行）
+    :param endpoint: "lunar"、"luck" 或 "chart"
+    :param params: 正規化後的參數 tuple
+    :return: 可 JSON 序列化的 dict
+    """
+    year, month, day, hour, gender, minute = params
+    if endpoint == "lunar":
+        return _json_safe(main.solar_to_lunar(year, month, day, hour, minute))
+    chart = main.compute_chart(year, month, day, hour, gender, minute)
+    if endpoint == "luck":
+        luck_info = chart["luck_info"]
+        return {
+            "gender": luck_info["gender"],
+            "start_age": luck_info["start_age"],
+            "start_date": luck_info["start_date"].strftime("%Y-%m-%d"),
+            "pillars": chart["luck_pillars"],
+        }
+    return chart_to_json(chart)
+
+
+class ChartService:
+    """
+    合併相同的在途請求，並以 LRU 快取已完成的結果
+    """
+
+    def __init__(self, executor, cache_size=DEFAULT_CACHE_SIZE):
+        self.executor = executor
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.in_flight = {}
+        self.stats = {"requests": 0, "cache_hits": 0, "coalesced": 0, "computed": 0, "errors": 0}
+
+    async def get(self, endpoint, params):
+        """
+        取得計算結果：先查快取，再看是否已有相同請求在計算，最後才送進程池
+        :param endpoint: 端點名稱
+        :param params: 正規化後的參數 tuple
+        :return: 結果 dict
+        """
+        self.stats["requests"] += 1
+        key = (endpoint, params)
+        result = self.cache.get(key)
+        if result is not None:
+            self.cache.move_to_end(key)
+            self.stats["cache_hits"] += 1
+            return result
+
+        future = self.in_flight.get(key)
+        if future is not None:
+            self.stats["coalesced"] += 1
+            return await asyncio.shield(future)
+
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self.executor, compute, endpoint, params)
+        self.in_flight[key] = future
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            del self.in_flight[key]
+        self.stats["computed"] += 1
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+        return result
+
+    async def handle(self, path, params):
+        """
+        依路徑分派請求
+        :param path: URL 路徑
+        :param params: 查詢參數 dict
+        :return: (狀態碼, 回應 dict)
+        """
+        endpoint = path.strip("/")
+        if endpoint in ("lunar", "luck", "chart"):
+            return 200, await self.get(endpoint, parse_birth(params))
+        if endpoint == "analyze":
+            stems, branches = params.get("stems", ""), params.get("branches", "")
+            if len(stems) != 4 or len(branches) != 4:
+                raise ValueError("stems 和 branches 需各為 4 個字")
+            self.stats["requests"] += 1
+            return 200, main.analyze_bazi(list(stems), list(branches))
+        if endpoint == "stats":
+            return 200, {**self.stats, "cache_size": len(self.cache), "in_flight": len(self.in_flight)}
+        return 404, {"error": f"未知的路徑: {path}"}
+
+
+async def _read_request(reader):
+    """
+    讀取一個 HTTP/1.1 請求
+    :return: (方法, 路徑, 參數 dict, 是否保持連線)；連線關閉時回傳 None
+    """
+    request_line = await reader.readline()
+    if not request_line:
+        return None
+    # 請求行以 UTF-8 解碼，未經百分比編碼的中文參數（如 stems=庚甲壬丁）也能正確解析；
+    # 只以空白字元切開，不能用無參數的 split()（會把 \x85、\u3000 等也當成分隔）
+    try:
+        parts = request_line.decode("utf-8").rstrip("\r\n").split(" ", 2)
+    except UnicodeDecodeError:
+        raise ValueError("malformed request line") from None
+    if len(parts) != 3:
+        raise ValueError("malformed request line")
+    method, target, version = parts
+    headers = {}
+    while True:
+        line = await reader.readline()
+        if line in (b"\r\n", b"\n", b""):
+            break
+        name, _, value = line.decode("latin-1").partition(":")
+        headers[name.strip().lower()] = value.strip()
+
+    url = urlsplit(target)
+    params = dict(parse_qsl(url.query))
+    length = int(headers.get("content-length", 0))
+    if length > MAX_BODY:
+        raise ValueError("請求內容過大")
+    if length:
+        body = await reader.readexactly(length)
+        try:
+            payload = json.loads(body.decode("utf-8"))
+        except (UnicodeDecodeError, json.JSONDecodeError) as e:
+            raise ValueError(f"無效的 JSON 內容: {e}") from None
+        if not isinstance(payload, dict):
+            raise ValueError("JSON 內容必須是物件")
+        params.update(payload)
+    keep_alive = headers.get("connection", "").lower() != "close" and version == "HTTP/1.1"
+    return method, url.path, params, keep_alive
+
+
+def _response(status, payload, keep_alive):
+    body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+    head = (
+        f"HTTP/1.1 {status} {REASONS[status]}\r\n"
+        f"Content-Type: application/json; charset=utf-8\r\n"
+        f"Content-Length: {len(body)}\r\n"
+        f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+    )
+    return head.encode("latin-1") + body
+
+
+def make_handler(service):
+    async def handle_connection(reader, writer):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader)
+                except (ValueError, UnicodeDecodeError, json.JSONDecodeError, asyncio.IncompleteReadError) as e:
+                    writer.write(_response(400, {"error": str(e)}, False))
+                    break
+                if request is None:
+                    break
+                method, path, params, keep_alive = request
+                if method not in ("GET", "POST"):
+                    status, payload = 405, {"error": f"不支援的方法: {method}"}
+                else:
+                    try:
+                        status, payload = await service.handle(path, params)
+                    except (ValueError, TypeError, KeyError) as e:
+                        service.stats["errors"] += 1
+                        status, payload = 400, {"error": str(e)}
+                    except Exception as e:
+                        service.stats["errors"] += 1
+                        status, payload = 500, {"error": str(e)}
+                writer.write(_response(status, payload, keep_alive))
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    return handle_connection
+
+
+async def serve(host="127.0.0.1", port=8000, workers=None, cache_size=DEFAULT_CACHE_SIZE):
+    """
+    啟動 HTTP 服務
+    :param host: 綁定位址
+    :param port: 連接埠
+    :param workers: 工作進程數，預設為 CPU 核心數
+    :param cache_size: 結果 LRU 快取容量
+    """
+    with ProcessPoolExecutor(max_workers=workers, initializer=init_worker, initargs=(True,)) as executor:
+        service = ChartService(executor, cache_size)
+        server = await asyncio.start_server(make_handler(service), host, port)
+        print(f"命盤服務啟動於 http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="八字命盤 HTTP 服務")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int, default=None, help="工作進程數，預設為 CPU 核心數")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE, help="結果快取筆數")
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.host, args.port, args.workers, args.cache_size))
+    except KeyboardInterrupt:
+        pass
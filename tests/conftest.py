@@ -0,0 +1,25 @@
+# 測試共用設定：各模組皆為頂層模組，將專案根目錄加入匯入路徑
+#
+#   python -m pytest -q
+
+import os
+import random
+import sys
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+
+def random_births(count, seed, first_year=1950, last_year=2030):
+    """
+    以固定亂數種子產生出生時間（含 23 點晚子時與月底日期）
+    :return: [datetime, ...]
+    """
+    rng = random.Random(seed)
+    return [
+        datetime(rng.randint(first_year, last_year), rng.randint(1, 12), rng.randint(1, 28),
+                 rng.choice((0, 23, rng.randint(0, 23))), rng.randint(0, 59))
+        for _ in range(count)
+    ]
@@ -0,0 +1,63 @@
+# almanac：分組查表的每日結果與逐人逐日直接分析的差分測試
+
+import io
+import json
+import random
+from datetime import date, datetime, timedelta
+
+import numpy as np
+
+import codes
+from almanac import AlmanacEngine, day_code, write_jsonl
+from batch import bazi_batch
+
+
+def _users(count, seed):
+    rng = random.Random(seed)
+    users = []
+    for i in range(count):
+        stems = [codes.STEMS[rng.randrange(10)] for _ in range(4)]
+        branches = [codes.BRANCHES[rng.randrange(12)] for _ in range(4)]
+        users.append((f"u{i}", stems, branches))
+    # 本命四干（或四支）相同的使用者共用一組
+    users.append(("same", users[0][1], users[1][2]))
+    return users
+
+
+def test_day_code_matches_bazi_batch():
+    days = [date(1990, 1, 1) + timedelta(days=d) for d in range(0, 20000, 37)]
+    stems, branches = bazi_batch(np.array([datetime(d.year, d.month, d.day, 12) for d in days], dtype="datetime64[s]"))
+    assert [day_code(d) for d in days] == [codes.pillar_code(s, b) for s, b in zip(stems[:, 2], branches[:, 2])]
+
+
+def test_rows_match_relations_with():
+    users = _users(30, seed=8)
+    engine = AlmanacEngine()
+    for user_id, stems, branches in users:
+        engine.add(user_id, stems, branches)
+    assert engine.stats()["stem_groups"] == 30
+    start = date(2026, 1, 1)
+    rows = {(user_id, day): (stem_id, branch_id)
+            for user_id, day, _, stem_id, branch_id in engine.rows(start, 60, skip_empty=False)}
+    assert len(rows) == len(users) * 60
+    for user_id, stems, branches in users:
+        natal_stems, natal_branches = codes.encode_bazi(stems, branches)
+        for offset in range(60):
+            day = start + timedelta(days=offset)
+            stem_id, branch_id = rows[(user_id, day)]
+            expected = codes.relations_with(natal_stems, natal_branches, day_code(day), codes.FLOW)
+            assert engine.entries[stem_id] + engine.entries[branch_id] == expected
+
+
+def test_write_jsonl_skips_empty_days():
+    users = _users(10, seed=9)
+    engine = AlmanacEngine()
+    for user_id, stems, branches in users:
+        engine.add(user_id, stems, branches)
+    output = io.StringIO()
+    count = write_jsonl(engine, date(2026, 1, 1), 30, output)
+    lines = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert len(lines) == count
+    assert all(line["heavenly"] or line["branch"] for line in lines)
+    expected = sum(1 for _, _, _, s, b in engine.rows(date(2026, 1, 1), 30, skip_empty=False) if s or b)
+    assert count == expected
@@ -0,0 +1,32 @@
+# batch.bazi_batch 與逐筆 solar_to_lunar（lunar_python）的差分測試
+
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import main
+from batch import bazi_batch, decode_batch
+from conftest import random_births
+
+
+def test_bazi_batch_matches_solar_to_lunar():
+    births = random_births(200, seed=1)
+    stems, branches = bazi_batch(np.array(births, dtype="datetime64[s]"))
+    for birth, pillars in zip(births, decode_batch(stems, branches)):
+        info = main.solar_to_lunar(birth.year, birth.month, birth.day, birth.hour, birth.minute)
+        assert pillars == main.get_bazi_from_solar_date(info), birth
+
+
+def test_bazi_batch_around_jie_and_new_year():
+    # 2024 年立春（2/4）、正月初一（2/10）前後逐日、逐時辰比對
+    births = [datetime(2024, 2, day, hour) for day in range(2, 13) for hour in (0, 1, 11, 22, 23)]
+    stems, branches = bazi_batch(births)
+    for birth, pillars in zip(births, decode_batch(stems, branches)):
+        info = main.solar_to_lunar(birth.year, birth.month, birth.day, birth.hour)
+        assert pillars == main.get_bazi_from_solar_date(info), birth
+
+
+def test_bazi_batch_out_of_range():
+    with pytest.raises(ValueError):
+        bazi_batch([datetime(1899, 6, 1)])
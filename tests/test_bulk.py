@@ -0,0 +1,32 @@
+# bulk：批次命令列（python main.py --batch）的輸出與錯誤處理
+
+import io
+import json
+import os
+import subprocess
+import sys
+
+import main
+from bulk import chart_to_json, run_batch
+from conftest import ROOT
+
+
+def test_run_batch():
+    stream = io.StringIO('{"id": 1, "year": 1990, "month": 8, "day": 15, "hour": 14}\n\n{"year": 1990}\n')
+    output, errors = io.StringIO(), io.StringIO()
+    assert run_batch(stream, output, errors) == (1, 1)
+    row = json.loads(output.getvalue())
+    assert row == {"id": 1, **json.loads(json.dumps(chart_to_json(main.compute_chart(1990, 8, 15, 14)),
+                                                    ensure_ascii=False))}
+    assert json.loads(errors.getvalue())["line"] == 3
+
+
+def test_main_batch_command(tmp_path):
+    births = tmp_path / "births.csv"
+    births.write_text("id,year,month,day,hour,gender\n7,1990,8,15,14,女\n", encoding="utf-8")
+    output = tmp_path / "charts.jsonl"
+    subprocess.run([sys.executable, os.path.join(ROOT, "main.py"), "--batch", str(births), "--output", str(output)],
+                   cwd=str(tmp_path), check=True, capture_output=True)
+    row = json.loads(output.read_text(encoding="utf-8"))
+    assert row["id"] == "7"
+    assert row["gender"] == chart_to_json(main.compute_chart(1990, 8, 15, 14, 0))["gender"]
@@ -0,0 +1,68 @@
+# codes：分段評估（evaluate_last、候選時柱、預先計算表、規則快照）與一次完整評估的差分測試
+
+import random
+
+import pytest
+
+import codes
+import main
+
+STEM_ARGS = (codes.STEM_PAIR_HITS, codes.STEM_TRIPLE_HITS, codes.STEM_TRIPLE_POSSIBLE, 10)
+BRANCH_ARGS = (codes.BRANCH_PAIR_HITS, codes.BRANCH_TRIPLE_HITS, codes.BRANCH_TRIPLE_POSSIBLE, 12)
+
+
+@pytest.mark.parametrize("args", [STEM_ARGS, BRANCH_ARGS], ids=["stems", "branches"])
+def test_evaluate_last_composes_to_evaluate(args):
+    rng = random.Random(2)
+    size = args[-1]
+    for _ in range(500):
+        n = rng.randint(2, 6)
+        values = tuple(rng.randrange(size) for _ in range(n))
+        positions = tuple(sorted(rng.sample(range(12), n)))
+        expected = codes.evaluate(values, *args, positions)
+        head = codes.evaluate(values[:-1], *args, positions[:-1])
+        last = codes.evaluate_last(values, *args, positions)
+        assert all(positions[-1] in r.positions for r in last)
+        assert tuple(sorted(head + last, key=codes.evaluation_order)) == expected
+
+
+def test_analyze_hour_candidates_matches_analyze_codes():
+    rng = random.Random(3)
+    for _ in range(50):
+        stems = tuple(rng.randrange(10) for _ in range(3))
+        branches = tuple(rng.randrange(12) for _ in range(3))
+        hours = [(rng.randrange(10), b) for b in range(12)]
+        for (hour_stem, hour_branch), analysis in zip(hours, codes.analyze_hour_candidates(stems, branches, hours)):
+            expected = codes.analyze_codes(stems + (hour_stem,), branches + (hour_branch,))
+            assert codes.render_analysis(analysis) == codes.render_analysis(expected)
+            assert analysis.relations == expected.relations
+
+
+def test_precomputed_branch_table_matches_cache():
+    rng = random.Random(4)
+    charts = [(tuple(rng.randrange(10) for _ in range(4)), tuple(rng.randrange(12) for _ in range(4)))
+              for _ in range(300)]
+    try:
+        codes.configure_cache(maxsize=0)
+        expected = [codes.render_analysis(codes.analyze_codes(s, b)) for s, b in charts]
+        codes.configure_cache(precompute=True)
+        assert [codes.render_analysis(codes.analyze_codes(s, b)) for s, b in charts] == expected
+    finally:
+        codes.configure_cache()
+
+
+def test_analyze_bazi_text():
+    result = main.analyze_bazi(["庚", "甲", "壬", "丁"], ["午", "申", "子", "未"])
+    assert "日干 壬 合 時干 丁 化為 木" in result["heavenly_relations"]
+    assert "年支 午 沖 日支 子" in result["branch_relations"]
+    assert "年支 午 六合 時支 未 化為 火" in result["branch_relations"]
+    with pytest.raises(ValueError, match="無效的地支"):
+        main.analyze_bazi(["庚", "甲", "壬", "丁"], ["午", "申", "子", "X"])
+
+
+def test_rules_snapshot_round_trip(tmp_path):
+    path = str(tmp_path / "codes_tables.bin")
+    codes.freeze(path, codes._COMPILED)
+    assert codes.load_snapshot(path) == codes.compile_rules()
+    (tmp_path / "codes_tables.bin").write_bytes(b"broken")
+    assert codes.load_snapshot(path) is None
@@ -0,0 +1,64 @@
+# ephemeris：逐時星曆查表與 lunar_python 路徑的差分測試（以一年的小星曆檔，不需事先產生 ephemeris.bin）
+
+import random
+from datetime import datetime, timedelta
+
+import pytest
+
+import ephemeris
+import jieqi
+import main
+
+FIELDS = ("year_gan", "year_zhi", "month_gan", "month_zhi", "day_gan", "day_zhi", "hour_gan", "hour_zhi",
+          "this_jie_qi", "next_jie_qi", "this_jie_qi_starttime", "next_jie_qi_starttime",
+          "time_to_this_jq", "time_to_next_jq")
+
+
+@pytest.fixture(scope="module")
+def table(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("ephemeris") / "ephemeris.bin")
+    ephemeris.build(path, 2000, 2000)
+    table = ephemeris.Ephemeris(path)
+    yield table
+    table.close()
+
+
+@pytest.fixture
+def use_table(table, monkeypatch):
+    monkeypatch.setattr(ephemeris, "_default", table)
+    return table
+
+
+def test_ephemeris_matches_lunar_python(use_table):
+    rng = random.Random(5)
+    start = datetime(2000, 1, 1)
+    births = [start + timedelta(seconds=rng.randrange(366 * 86400)) for _ in range(200)]
+    # 節氣交接所在的小時內，交節前後各一分鐘
+    for month in (2, 6, 12):
+        moment = jieqi.find_jie_qi(datetime(2000, month, 10))[1]
+        births += [moment - timedelta(minutes=1), moment + timedelta(minutes=1)]
+    for birth in births:
+        args = (birth.year, birth.month, birth.day, birth.hour, birth.minute, birth.second)
+        fast = main.solar_to_lunar(*args, lunar_date=False)
+        slow = main.solar_to_lunar(*args)
+        assert fast["year"] is None and fast["festival"] is None
+        assert {k: fast[k] for k in FIELDS} == {k: slow[k] for k in FIELDS}, birth
+
+
+def test_lookup_out_of_range(table):
+    assert table.lookup(datetime(1999, 12, 31, 23)) is None
+    assert table.lookup(datetime(2001, 1, 1)) is None
+    assert table.lookup(datetime(2000, 12, 31, 23, 59)) is not None
+
+
+def test_missing_file_is_checked_once(monkeypatch, tmp_path):
+    calls = []
+    exists = ephemeris.os.path.exists
+    monkeypatch.setattr(ephemeris, "DEFAULT_PATH", str(tmp_path / "missing.bin"))
+    monkeypatch.setattr(ephemeris.os.path, "exists", lambda path: calls.append(path) or exists(path))
+    monkeypatch.setattr(ephemeris, "_default", ephemeris._UNLOADED)
+    assert ephemeris.default() is None
+    assert ephemeris.default() is None
+    assert len(calls) == 1
+    assert ephemeris.reload() is None
+    assert len(calls) == 2
@@ -0,0 +1,62 @@
+# feature_index：查表批次編碼與逐張分析編碼、位元查詢與逐列比對的差分測試
+
+import numpy as np
+import pytest
+
+import codes
+from batch import bazi_batch
+from feature_index import FeatureIndex, build_from_datetimes, feature_space
+
+
+@pytest.fixture(scope="module")
+def corpus(tmp_path_factory):
+    rng = np.random.default_rng(13)
+    lo = np.datetime64("1950-01-01T00:00:00", "s").astype(np.int64)
+    hi = np.datetime64("2020-01-01T00:00:00", "s").astype(np.int64)
+    datetimes = rng.integers(lo, hi, size=1500).astype("datetime64[s]")
+    path = str(tmp_path_factory.mktemp("features") / "corpus.idx")
+    build_from_datetimes(datetimes, path, chunk_size=400)
+    stems, branches = bazi_batch(datetimes)
+    return FeatureIndex(path), stems, branches
+
+
+def test_encode_batch_matches_encode_analysis(corpus):
+    _, stems, branches = corpus
+    space = feature_space()
+    words = space.encode_batch(stems, branches)
+    for row, s, b in zip(words, stems.tolist(), branches.tolist()):
+        assert np.array_equal(row, space.encode_analysis(codes.analyze_codes(s, b)))
+
+
+def test_match_matches_decoded_features(corpus):
+    index, _, _ = corpus
+    space = feature_space()
+    decoded = [set(space.decode(row)) for row in index.bits]
+    all_of, any_of, none_of = ["日干:甲"], ["沖@年日", "半三合:子辰", "文昌"], ["合化:土"]
+    expected = [i for i, names in enumerate(decoded)
+                if set(all_of) <= names and names & set(any_of) and not names & set(none_of)]
+    assert index.match(all_of, any_of, none_of).tolist() == expected
+    assert index.match(["合:辛丙"]).tolist() == [i for i, names in enumerate(decoded) if "合:丙辛" in names]
+
+
+@pytest.mark.parametrize("metric", ["hamming", "jaccard"])
+def test_top_k_matches_brute_force(corpus, metric):
+    index, stems, branches = corpus
+    space = feature_space()
+    query = space.encode_analysis(codes.analyze_codes((6, 0, 8, 3), (6, 8, 0, 7)))
+    rows = [set(space.decode(row)) for row in index.bits]
+    target = set(space.decode(query))
+    if metric == "hamming":
+        scores = [float(len(names ^ target)) for names in rows]
+        order = sorted(range(len(rows)), key=lambda i: (scores[i], i))
+    else:
+        scores = [len(names & target) / len(names | target) for names in rows]
+        order = sorted(range(len(rows)), key=lambda i: (-scores[i], i))
+    found = index.top_k(query, k=10, metric=metric)
+    assert [i for i, _ in found] == order[:10]
+    assert [score for _, score in found] == pytest.approx([scores[i] for i in order[:10]])
+
+
+def test_unknown_feature():
+    with pytest.raises(ValueError, match="未知的特徵"):
+        feature_space().lookup("合:甲甲")
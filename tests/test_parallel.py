@@ -0,0 +1,35 @@
+# parallel：多進程批次結果與單進程 chart_rows 的差分測試
+
+import json
+
+from bulk import chart_rows, json_row, read_births
+from conftest import random_births
+from parallel import chunked, parallel_chart_rows
+
+
+def _lines(count, seed):
+    lines = [json.dumps({"id": i, "year": b.year, "month": b.month, "day": b.day, "hour": b.hour,
+                         "minute": b.minute, "gender": i % 2})
+             for i, b in enumerate(random_births(count, seed))]
+    lines.insert(3, "{broken")
+    lines.insert(7, json.dumps({"id": "x", "year": 1990, "month": 13, "day": 1}))
+    return lines
+
+
+def _normalize(results):
+    return [(line_no, str(row) if isinstance(row, Exception) else row) for line_no, _, row in results]
+
+
+def test_parallel_matches_chart_rows():
+    lines = _lines(30, seed=15)
+    expected = _normalize(chart_rows(read_births(lines), json_row))
+    ordered = _normalize(parallel_chart_rows(read_births(lines), workers=2, chunk_size=4, precompute=False))
+    assert ordered == expected
+    unordered = _normalize(parallel_chart_rows(read_births(lines), workers=2, chunk_size=4, ordered=False,
+                                               precompute=False))
+    assert sorted(unordered, key=lambda row: row[0]) == expected
+
+
+def test_chunked():
+    assert list(chunked(range(7), 3)) == [[0, 1, 2], [3, 4, 5], [6]]
+    assert list(chunked([], 3)) == []
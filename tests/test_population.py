@@ -0,0 +1,64 @@
+# population：由充分統計推得的關係次數與逐張分析加總的差分測試
+
+from collections import Counter
+
+import numpy as np
+
+import codes
+from batch import bazi_batch
+from population import PopulationStats
+
+
+def _charts(count, seed):
+    rng = np.random.default_rng(seed)
+    lo = np.datetime64("1950-01-01T00:00:00", "s").astype(np.int64)
+    hi = np.datetime64("2020-01-01T00:00:00", "s").astype(np.int64)
+    datetimes = rng.integers(lo, hi, size=count).astype("datetime64[s]")
+    stems, branches = bazi_batch(datetimes)
+    return datetimes, stems, branches
+
+
+def _expected_relations(stems, branches):
+    counts = Counter()
+    for s, b in zip(stems.tolist(), branches.tolist()):
+        for r in codes.analyze_codes(s, b).relations:
+            counts[(r.kind, tuple(sorted(r.codes)), r.element)] += 1
+    return dict(counts)
+
+
+def test_relations_match_per_chart_analysis():
+    datetimes, stems, branches = _charts(2000, seed=10)
+    stats = PopulationStats()
+    stats.add_datetimes(datetimes)
+    assert stats.relations() == _expected_relations(stems, branches)
+    years = datetimes.astype("datetime64[Y]").astype(np.int64) + 1970
+    in_1990s = (years >= 1990) & (years < 2000)
+    assert stats.relations(1990) == _expected_relations(stems[in_1990s], branches[in_1990s])
+    assert stats.total(1990) == int(in_1990s.sum())
+
+
+def test_histogram_crosstab_and_wen_chang():
+    datetimes, stems, branches = _charts(1000, seed=11)
+    stats = PopulationStats()
+    stats.add(stems, branches)
+    day_stems = Counter(codes.STEMS[s] for s in stems[:, 2].tolist())
+    assert stats.histogram("日干") == {s: day_stems.get(s, 0) for s in codes.STEMS}
+    rows, columns, table = stats.crosstab("月支", "日干")
+    assert table.shape == (12, 10)
+    assert int(table[3, 4]) == int(((branches[:, 1] == 3) & (stems[:, 2] == 4)).sum())
+    hits = [codes.WEN_CHANG[s[2]] in b for s, b in zip(stems.tolist(), branches.tolist())]
+    assert stats.wen_chang_rate()["hits"] == sum(hits)
+
+
+def test_merge_and_save_round_trip(tmp_path):
+    datetimes, _, _ = _charts(1500, seed=12)
+    whole = PopulationStats()
+    whole.add_datetimes(datetimes)
+    first, second = PopulationStats(), PopulationStats()
+    first.add_datetimes(datetimes[:700])
+    second.add_datetimes(datetimes[700:])
+    path = str(tmp_path / "part.npz")
+    second.save(path)
+    first += PopulationStats.load(path)
+    assert first.summary() == whole.summary()
+    assert first.relations() == whole.relations()
@@ -0,0 +1,65 @@
+# reverse_index：反查結果與 bazi_batch 逐時刻排盤的差分測試
+
+import random
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+import codes
+from batch import bazi_batch
+from reverse_index import PillarIndex
+
+START = datetime(2000, 1, 1)
+END = datetime(2002, 1, 1)
+
+
+@pytest.fixture(scope="module")
+def index():
+    return PillarIndex.build(2000, 2001)
+
+
+def _pillars(times):
+    stems, branches = bazi_batch(np.array(times, dtype="datetime64[s]"))
+    return codes.pillar_code(stems.astype(int), branches.astype(int)), branches
+
+
+def _matches(pillar, branch_row, year, day, branches_include):
+    return (pillar[0] == year and pillar[2] % 10 == day
+            and all(codes.BRANCH_CODE[b] in branch_row.tolist() for b in branches_include))
+
+
+def test_query_matches_bazi_batch(index):
+    rng = random.Random(7)
+    seconds = int((END - START).total_seconds())
+    times = [START + timedelta(seconds=rng.randrange(seconds)) for _ in range(3000)]
+    pillars, branches = _pillars(times)
+    for year, day, include in ((16, 0, ""), (17, 4, "子"), (16, 2, "申子")):
+        intervals = index.query(year=codes.JIA_ZI[year], day=f"{codes.STEMS[day]}?", branches_include=include)
+        assert intervals
+        for t, pillar, branch_row in zip(times, pillars, branches):
+            inside = any(a <= t < b for a, b in intervals)
+            assert inside == _matches(pillar, branch_row, year, day, include), t
+        # 區間內各處都符合
+        probes = [a + (b - a) * rng.random() for a, b in intervals]
+        probe_pillars, probe_branches = _pillars(probes)
+        assert all(_matches(p, b, year, day, include) for p, b in zip(probe_pillars, probe_branches))
+
+
+def test_match_time_range_and_save(index, tmp_path):
+    start, end = datetime(2001, 3, 1), datetime(2001, 4, 1)
+    intervals = index.query(hour="?子", start=start, end=end)
+    assert all(start <= a < b <= end for a, b in intervals)
+    path = str(tmp_path / "index.npz")
+    index.save(path)
+    loaded = PillarIndex.load(path)
+    assert loaded.query(hour="?子", start=start, end=end) == intervals
+
+
+def test_invalid_conditions(index):
+    with pytest.raises(ValueError, match="無效的地支: 甲"):
+        index.match(branches_include="甲")
+    with pytest.raises(ValueError):
+        index.match(year="甲丑")
+    with pytest.raises(ValueError):
+        index.match(day=60)
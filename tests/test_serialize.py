@@ -0,0 +1,54 @@
+# serialize：二進位列與 .npz 欄式格式的還原結果須與原命盤完全相同
+
+import io
+
+import pytest
+
+import main
+import serialize
+from conftest import random_births
+
+
+@pytest.fixture(scope="module")
+def charts():
+    births = random_births(40, seed=14)
+    result = [main.compute_chart(b.year, b.month, b.day, b.hour, i % 2, b.minute) for i, b in enumerate(births)]
+    # 星曆檔路徑（農曆年月日及節日為 None）及超出節氣表範圍（lunar_python 路徑）
+    result.append(main.compute_chart(1990, 8, 15, 14, 1, 30, lunar_date=False))
+    result.append(main.compute_chart(1890, 3, 2, 23, 0, 5))
+    return result
+
+
+def test_row_round_trip(charts):
+    output = io.BytesIO()
+    assert serialize.write_rows(charts, output) == len(charts)
+    decoded = list(serialize.iter_rows(output.getvalue()))
+    assert [key for key, _ in decoded] == list(range(len(charts)))
+    assert [chart for _, chart in decoded] == charts
+
+
+def test_npz_round_trip(charts, tmp_path):
+    path = str(tmp_path / "charts.npz")
+    assert serialize.save_npz(path, charts) == len(charts)
+    decoded = list(serialize.iter_columns(serialize.load_npz(path)))
+    assert [chart for _, chart in decoded] == charts
+
+
+def test_column_writer_accepts_rows(charts):
+    from_dicts = serialize.ColumnWriter()
+    from_rows = serialize.ColumnWriter()
+    for key, chart in enumerate(charts):
+        from_dicts.append(chart, key + 100)
+        from_rows.append(serialize.encode_chart(chart, key + 100))
+    a, b = from_dicts.columns(), from_rows.columns()
+    assert a.keys() == b.keys()
+    assert all((a[name] == b[name]).all() for name in a)
+    assert [key for key, _ in serialize.iter_columns(a)] == list(range(100, 100 + len(charts)))
+
+
+def test_column_writer_limit(charts):
+    writer = serialize.ColumnWriter(max_records=2)
+    writer.append(charts[0])
+    writer.append(charts[1])
+    with pytest.raises(ValueError):
+        writer.append(charts[2])
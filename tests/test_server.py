@@ -0,0 +1,94 @@
+# server：請求解析、合併相同的在途請求與快取，以及實際連線的端到端測試
+
+import asyncio
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+import main
+import server
+from bulk import chart_to_json
+
+
+def _read(data):
+    async def read():
+        reader = asyncio.StreamReader()
+        reader.feed_data(data)
+        reader.feed_eof()
+        return await server._read_request(reader)
+
+    return asyncio.run(read())
+
+
+def test_read_request_utf8_query():
+    request = _read("GET /analyze?stems=庚甲壬丁&branches=午申子未 HTTP/1.1\r\nHost: x\r\n\r\n".encode("utf-8"))
+    assert request == ("GET", "/analyze", {"stems": "庚甲壬丁", "branches": "午申子未"}, True)
+    request = _read(b"GET /lunar?year=1990&month=8&day=15 HTTP/1.0\r\n\r\n")
+    assert request == ("GET", "/lunar", {"year": "1990", "month": "8", "day": "15"}, False)
+
+
+def test_read_request_json_body():
+    body = json.dumps({"year": 1990, "month": 8, "day": 15}).encode("utf-8")
+    request = _read(b"POST /chart HTTP/1.1\r\nContent-Length: %d\r\nConnection: close\r\n\r\n%s" % (len(body), body))
+    assert request == ("POST", "/chart", {"year": 1990, "month": 8, "day": 15}, False)
+
+
+@pytest.mark.parametrize("data", [
+    b"GET /lunar?year=\xff HTTP/1.1\r\n\r\n",
+    b"GET /lunar\r\n\r\n",
+    b"POST /chart HTTP/1.1\r\nContent-Length: 2\r\n\r\n[]",
+    b"POST /chart HTTP/1.1\r\nContent-Length: 3\r\n\r\n{x}",
+])
+def test_read_request_malformed(data):
+    with pytest.raises(ValueError):
+        _read(data)
+
+
+def test_service_coalesces_and_caches():
+    params = (1990, 8, 15, 14, 1, 0)
+
+    async def run(service):
+        first = await asyncio.gather(service.get("chart", params), service.get("chart", params))
+        second = await service.get("chart", params)
+        return first, second
+
+    with ThreadPoolExecutor(2) as executor:
+        service = server.ChartService(executor, cache_size=10)
+        (a, b), c = asyncio.run(run(service))
+    assert a == b == c == chart_to_json(main.compute_chart(*params))
+    assert service.stats["computed"] == 1
+    assert service.stats["coalesced"] == 1
+    assert service.stats["cache_hits"] == 1
+
+
+def test_end_to_end():
+    async def request(port, data):
+        reader, writer = await asyncio.open_connection("127.0.0.1", port)
+        writer.write(data)
+        await writer.drain()
+        response = await reader.read()
+        writer.close()
+        head, _, body = response.partition(b"\r\n\r\n")
+        return int(head.split()[1]), json.loads(body.decode("utf-8"))
+
+    async def run():
+        with ThreadPoolExecutor(1) as executor:
+            service = server.ChartService(executor)
+            listener = await asyncio.start_server(server.make_handler(service), "127.0.0.1", 0)
+            port = listener.sockets[0].getsockname()[1]
+            try:
+                return [
+                    await request(port, "GET /analyze?stems=庚甲壬丁&branches=午申子未 HTTP/1.1\r\n"
+                                        "Connection: close\r\n\r\n".encode("utf-8")),
+                    await request(port, b"GET /nothing HTTP/1.1\r\nConnection: close\r\n\r\n"),
+                    await request(port, b"GET /lunar?year=\xff HTTP/1.1\r\n\r\n"),
+                ]
+            finally:
+                listener.close()
+                await listener.wait_closed()
+
+    analyze, missing, malformed = asyncio.run(run())
+    assert analyze == (200, main.analyze_bazi(list("庚甲壬丁"), list("午申子未")))
+    assert missing[0] == 404
+    assert malformed[0] == 400
@@ -0,0 +1,57 @@
+# timeline：分段算出的流年/流月關係與本命、大運、流年一次完整評估的差分測試
+
+import random
+from datetime import datetime
+
+import numpy as np
+import pytest
+
+import codes
+import main
+import timeline
+from batch import bazi_batch
+
+POSITIONS = (0, 1, 2, 3, codes.LUCK, codes.FLOW)
+
+
+def _full(stems, branches, flow, luck):
+    if luck is None:
+        positions = POSITIONS[:4] + (codes.FLOW,)
+        stems, branches = stems + (flow % 10,), branches + (flow % 12,)
+    else:
+        positions = POSITIONS
+        stems, branches = stems + (luck % 10, flow % 10), branches + (luck % 12, flow % 12)
+    found = codes.analyze_stems(stems, positions) + codes.analyze_branches(branches, positions)
+    return tuple(r for r in found if codes.FLOW in r.positions)
+
+
+def test_flow_relations_matches_full_evaluation():
+    rng = random.Random(6)
+    for _ in range(300):
+        stems = tuple(rng.randrange(10) for _ in range(4))
+        branches = tuple(rng.randrange(12) for _ in range(4))
+        flow = rng.randrange(60)
+        luck = rng.choice((None, rng.randrange(60)))
+        assert timeline.flow_relations(stems, branches, flow, luck) == _full(stems, branches, flow, luck)
+
+
+def test_flow_timeline_entries():
+    chart = main.compute_chart(1990, 8, 15, 14, 1)
+    stems, branches = codes.encode_bazi(chart["heavenly_stems"], chart["earthly_branches"])
+    entries = list(timeline.flow_timeline(chart, start=datetime(1980, 1, 1), years=40, monthly=True))
+    assert entries[0]["start"] == chart["birth_date"]
+    assert [e["start"] for e in entries] == sorted(e["start"] for e in entries)
+    assert sum(e["kind"] == "年" for e in entries) in (40, 41)
+    months = [e for e in entries if e["kind"] == "月"]
+    month_stems, month_branches = bazi_batch(np.array([e["start"] for e in months], dtype="datetime64[s]"))
+    for entry, s, b in zip(months, month_stems[:, 1].tolist(), month_branches[:, 1].tolist()):
+        assert entry["code"] == codes.pillar_code(s, b)
+    for entry in entries:
+        luck = None if entry["luck"] is None else codes.JIA_ZI.index(entry["luck"])
+        assert entry["relations"] == _full(stems, branches, entry["code"], luck)
+
+
+def test_flow_timeline_range_error_is_eager():
+    chart = main.compute_chart(1990, 8, 15, 14, 1)
+    with pytest.raises(ValueError, match="節氣表範圍"):
+        timeline.flow_timeline(chart, years=200)
@@ -0,0 +1,90 @@
+# zeri：最佳優先搜尋的結果與逐時辰窮舉掃描的差分測試
+
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+
+import codes
+import zeri
+from batch import bazi_batch
+
+USERS = [
+    ("me", ["庚", "辛", "甲", "辛"], ["午", "巳", "子", "未"]),
+    ("you", ["丙", "庚", "癸", "丁"], ["寅", "子", "卯", "巳"]),
+]
+START, END = date(2026, 1, 20), date(2026, 3, 10)  # 跨小寒、立春、正月初一、驚蟄
+
+
+def _search(require, forbid, prefer):
+    search = zeri.DateSearch(require=require, forbid=forbid, prefer=prefer)
+    for user_id, stems, branches in USERS:
+        search.add(user_id, stems, branches)
+    return search
+
+
+def _exhaustive(search, by):
+    """
+    逐日（或逐時辰）以 bazi_batch 排盤，對每位使用者一次評估本命與擇日全部柱的關係
+    """
+    if by == "hour":
+        days = (END - START).days
+        starts = [datetime.combine(START, datetime.min.time()) + timedelta(days=d, hours=h)
+                  for d in range(days) for h in zeri._SHICHEN_HOURS]
+        width = 4
+    else:
+        starts = [datetime.combine(START, datetime.min.time()) + timedelta(days=d) for d in range((END - START).days)]
+        width = 3
+    stems, branches = bazi_batch(np.array(starts, dtype="datetime64[s]"))
+    positions = zeri._NATAL_POSITIONS + zeri._CANDIDATE_POSITIONS[:width]
+    found = []
+    for moment, s, b in zip(starts, stems[:, :width].tolist(), branches[:, :width].tolist()):
+        score = 0
+        for _, natal_stems, natal_branches in USERS:
+            natal_stems, natal_branches = codes.encode_bazi(natal_stems, natal_branches)
+            relations = zeri._relevant(codes.analyze_stems(natal_stems + tuple(s), positions)
+                                       + codes.analyze_branches(natal_branches + tuple(b), positions))
+            matched = [c for c in search.require + search.forbid + search.prefer
+                       if any(c.matches(r) for r in relations)]
+            if any(c in matched for c in search.forbid) or not all(c in matched for c in search.require):
+                break
+            score += sum(c.weight for c in search.prefer if c in matched)
+        else:
+            found.append((-score, moment, tuple(codes.pillar_code(x, y) for x, y in zip(s, b))))
+    return [(moment, -negative, pillars) for negative, moment, pillars in sorted(found)]
+
+
+@pytest.mark.parametrize("by", ["hour", "day"])
+@pytest.mark.parametrize("require, forbid, prefer", [
+    ((), ("沖",), ("三合:*-日=2", "六合", "合:日-日=3", "害=-1")),
+    (("合",), ("刑:日-*",), ("半三合:*-日",)),
+])
+def test_date_search_matches_exhaustive_scan(by, require, forbid, prefer):
+    search = _search(require, forbid, prefer)
+    found = [(m["start"], m["score"], m["codes"]) for m in search.run(START, END, by=by)]
+    assert found
+    assert found == _exhaustive(search, by)
+
+
+def test_date_search_limit_and_min_score():
+    search = _search((), ("沖",), ("三合:*-日=2", "六合", "合:日-日=3"))
+    expected = _exhaustive(search, "hour")
+    top = [(m["start"], m["score"], m["codes"]) for m in search.run(START, END, limit=5)]
+    assert top == expected[:5]
+    best = expected[0][1]
+    assert all(m["score"] >= best for m in search.run(START, END, min_score=best))
+
+
+def test_hour_code_matches_bazi_batch():
+    moments = [datetime(2026, 2, 1) + timedelta(days=d, hours=h) for d in range(10) for h in zeri._SHICHEN_HOURS]
+    stems, branches = bazi_batch(np.array(moments, dtype="datetime64[s]"))
+    for moment, s, b in zip(moments, stems.tolist(), branches.tolist()):
+        shichen = zeri._SHICHEN_HOURS.index(moment.hour)
+        assert zeri.hour_code(codes.pillar_code(s[2], b[2]), shichen) == codes.pillar_code(s[3], b[3])
+
+
+def test_invalid_condition():
+    with pytest.raises(ValueError):
+        zeri.Condition.parse("六合:X-日")
+    with pytest.raises(ValueError):
+        zeri.Condition.parse("不存在")
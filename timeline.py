@@ -0,0 +1,184 @@
+# 流年、流月：逐年逐月產生干支，並與本命八字及當時大運交叉分析
+#
+# 流年以立春、流月以各「節」交節當日為界（與月柱的算法一致），從出生（或指定的起始時間）所在的流年、流月開始，
+# 第一筆的起始時間即為出生時間。干支每 60 個單位循環一次：流年/流月與本命的關係只依干支編碼算一次，
+# 每個大運只另外算與大運有關的部分，再合併兩者。
+#
+#   chart = main.compute_chart(1990, 8, 15, 14, 1)
+#   for flow in flow_timeline(chart, years=80, monthly=True):
+#       print(flow["start"], flow["kind"], flow["pillar"], [r.render() for r in flow["relations"]])
+
+from bisect import bisect_right
+from datetime import datetime, timedelta
+
+import codes
+import jieqi
+from batch import month_table
+
+EPOCH = datetime(1970, 1, 1)
+
+
+def _add_years(value, years):
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:  # 2 月 29 日
+        return value.replace(year=value.year + years, day=28)
+
+
+def _flow_starts():
+    """
+    整理每個「節」的交節日期及對應的流月、流年干支
+    :return: [(交節日期, 流月編碼, 流年編碼或 None), ...]；只有立春那筆帶流年編碼
+    """
+    jie_days, month_gan, month_zhi = month_table()
+    starts = []
+    for day, gan, zhi in zip(jie_days.tolist(), month_gan.tolist(), month_zhi.tolist()):
+        start = EPOCH + timedelta(days=day)
+        year_code = (start.year - 4) % 60 if zhi == 2 else None  # 寅月即立春
+        starts.append((start, codes.pillar_code(gan, zhi), year_code))
+    return starts
+
+
+_starts = _flow_starts()
+_start_dates = [start for start, _, _ in _starts]
+
+
+def natal_flow_relations(natal_stems, natal_branches, flow):
+    """
+    分析一個流年/流月干支與本命八字之間的關係（不含大運），結果只取決於流年/流月干支，可依其編碼快取
+    :param natal_stems: 本命天干編碼 (年, 月, 日, 時)
+    :param natal_branches: 本命地支編碼 (年, 月, 日, 時)
+    :param flow: 流年或流月的六十甲子編碼
+    :return: 涉及流年/流月的 (Relation, ...)
+    """
+    positions = (0, 1, 2, 3, codes.FLOW)
+    stems = tuple(natal_stems) + (flow % 10,)
+    branches = tuple(natal_branches) + (flow % 12,)
+    found = codes.analyze_stems(stems, positions) + codes.analyze_branches(branches, positions)
+    return tuple(r for r in found if codes.FLOW in r.positions)
+
+
+def _luck_flow(natal, luck, flow, pair_hits, triple_hits, triple_possible, size):
+    # 同時涉及大運及流年/流月的關係：大運與流年/流月的雙元關係，以及本命一柱、大運、流年/流月的三元關係
+    hits = []
+    for i, a in enumerate(natal):
+        row = a * size
+        if triple_possible[row + luck]:
+            for kind, element in triple_hits[(row + luck) * size + flow]:
+                hits.append(codes.Relation(kind, (i, codes.LUCK, codes.FLOW), (a, luck, flow), element))
+    for kind, element in pair_hits[luck * size + flow]:
+        hits.append(codes.Relation(kind, (codes.LUCK, codes.FLOW), (luck, flow), element))
+    return hits
+
+
+def luck_flow_relations(natal_stems, natal_branches, flow, luck):
+    """
+    分析同時涉及大運及流年/流月的關係（與 natal_flow_relations 合起來即為全部關係）
+    :param natal_stems: 本命天干編碼 (年, 月, 日, 時)
+    :param natal_branches: 本命地支編碼 (年, 月, 日, 時)
+    :param flow: 流年或流月的六十甲子編碼
+    :param luck: 當時大運的六十甲子編碼
+    :return: [Relation, ...]
+    """
+    return (_luck_flow(natal_stems, luck % 10, flow % 10, codes.STEM_PAIR_HITS, codes.STEM_TRIPLE_HITS,
+                       codes.STEM_TRIPLE_POSSIBLE, 10)
+            + _luck_flow(natal_branches, luck % 12, flow % 12, codes.BRANCH_PAIR_HITS, codes.BRANCH_TRIPLE_HITS,
+                         codes.BRANCH_TRIPLE_POSSIBLE, 12))
+
+
+def _combine(natal, luck):
+    # 依 evaluate 的順序合併，天干關係在地支關係之前
+    if not luck:
+        return natal
+    stems = sorted([r for r in natal if r.is_stem] + [r for r in luck if r.is_stem], key=codes.evaluation_order)
+    branches = sorted([r for r in natal if not r.is_stem] + [r for r in luck if not r.is_stem],
+                      key=codes.evaluation_order)
+    return tuple(stems + branches)
+
+
+def flow_relations(natal_stems, natal_branches, flow, luck=None):
+    """
+    分析一個流年/流月干支與本命八字、大運之間的關係
+    :param natal_stems: 本命天干編碼 (年, 月, 日, 時)
+    :param natal_branches: 本命地支編碼 (年, 月, 日, 時)
+    :param flow: 流年或流月的六十甲子編碼
+    :param luck: 當時大運的六十甲子編碼，未起運時為 None
+    :return: 涉及流年/流月的 (Relation, ...)；位置 codes.LUCK 為大運、codes.FLOW 為流年/流月
+    """
+    natal = natal_flow_relations(natal_stems, natal_branches, flow)
+    if luck is None:
+        return natal
+    return _combine(natal, luck_flow_relations(natal_stems, natal_branches, flow, luck))
+
+
+def flow_timeline(chart, start=None, years=100, monthly=False, memo=None):
+    """
+    逐一產生流年（及流月），每筆附上與本命、大運的關係
+    :param chart: main.compute_chart 的結果
+    :param start: 起始時間，預設為出生時間，早於出生時間時以出生時間為準；第一筆的 start 即為此時間
+    :param years: 產生幾年
+    :param monthly: 是否同時產生流月
+    :param memo: 流年/流月與本命關係的快取 dict，以流年/流月編碼為鍵，同一張命盤可跨多次呼叫共用
+    :return: 產生 {"kind", "start", "pillar", "code", "luck", "relations"} 的產生器；
+             kind 為 "年" 或 "月"，同一天的流年排在流月之前
+    :raises ValueError: 起始時間至 years 年後超出節氣表範圍（jieqi.FIRST_YEAR-jieqi.LAST_YEAR）時，呼叫當下即丟出
+    """
+    natal_stems, natal_branches = codes.encode_bazi(chart["heavenly_stems"], chart["earthly_branches"])
+    luck_codes = [codes.JIA_ZI.index(pillar) for pillar in chart["luck_pillars"]]
+    luck_start = chart["luck_info"]["start_date"]
+    luck_bounds = [_add_years(luck_start, 10 * i) for i in range(len(luck_codes) + 1)]
+
+    birth = chart["birth_date"]
+    start = max(start or birth, birth)
+    end = _add_years(start, years)
+    if not _starts or start < _starts[0][0] or end > _starts[-1][0]:
+        raise ValueError(f"流年範圍超出節氣表範圍 ({jieqi.FIRST_YEAR}-{jieqi.LAST_YEAR})，請減少 years")
+    memo = {} if memo is None else memo
+    combined = {}  # (流年/流月編碼, 大運編碼) -> 合併後的關係
+
+    def active_luck(moment):
+        for i, code in enumerate(luck_codes):
+            if luck_bounds[i] <= moment < luck_bounds[i + 1]:
+                return code
+        return None
+
+    def entry(kind, moment, code):
+        luck = active_luck(moment)
+        key = (code, luck)
+        relations = combined.get(key)
+        if relations is None:
+            natal = memo.get(code)
+            if natal is None:
+                natal = memo[code] = natal_flow_relations(natal_stems, natal_branches, code)
+            relations = combined[key] = natal if luck is None else _combine(
+                natal, luck_flow_relations(natal_stems, natal_branches, code, luck))
+        return {
+            "kind": kind,
+            "start": moment,
+            "pillar": codes.JIA_ZI[code],
+            "code": code,
+            "luck": None if luck is None else codes.JIA_ZI[luck],
+            "relations": relations,
+        }
+
+    def entries():
+        # 起始時間所在的流月（j）及流年（i，立春）；兩者的第一筆都從起始時間算起
+        if start >= end:
+            return
+        j = max(bisect_right(_start_dates, start) - 1, 0)
+        i = j
+        while i > 0 and _starts[i][2] is None:
+            i -= 1
+        if _starts[i][2] is not None:
+            yield entry("年", max(_starts[i][0], start), _starts[i][2])
+        if monthly:
+            yield entry("月", max(_starts[j][0], start), _starts[j][1])
+        for moment, month_code, year_code in _starts[j + 1:]:
+            if moment >= end:
+                return
+            if year_code is not None:
+                yield entry("年", moment, year_code)
+            if monthly:
+                yield entry("月", moment, month_code)
+
+    return entries()
@@ -0,0 +1,458 @@
+# 擇日：在日期範圍內找出與一或多人本命八字形成指定關係的日子或時辰，依分數由高到低逐筆產生
+#
+# 年柱在正月初一、月柱在各「節」交節當日才改變，因此先把日期範圍切成年、月柱不變的區段；
+# 日柱每 60 日、日干每 10 日、日支每 12 日循環，時柱由日干與時辰決定，分析結果以干支編碼為鍵快取，
+# 重複出現的組合只算一次。補上日柱、時柱只會增加關係，所以「不可有」的條件在區段或日的層級已出現時
+# 整段略過；尚未能判定的偏好條件以可能的最高分估計，做最佳優先搜尋，結果依（分數高到低, 時間先後）產生，
+# 只取前幾名時不必逐時辰掃完整個範圍。
+#
+#   search = DateSearch(require=["六合:日-日"], forbid=["沖"], prefer=["三合:*-日=2", "合:日-日"])
+#   search.add("me", ["庚", "辛", "甲", "辛"], ["午", "巳", "子", "未"])
+#   for match in search.run(date(2026, 1, 1), date(2028, 1, 1), limit=10):
+#       print(match["start"], match["pillars"], match["score"], render_matches(match))
+#
+#   python zeri.py --charts charts.jsonl --start 2026-01-01 --end 2028-01-01 --require 六合:日-日 --forbid 沖 --limit 20
+#   python zeri.py --pillars 庚午,辛巳,甲子,辛未 --start 2026-01-01 --end 2026-07-01 --prefer 六合:日-日 --by day
+
+import argparse
+import heapq
+import json
+import sys
+from bisect import bisect_right
+from datetime import date, datetime, timedelta
+from itertools import count
+
+import codes
+import jieqi
+from batch import month_table
+
+EPOCH = date(1970, 1, 1)
+
+# 日柱：1970-01-01 為辛巳（六十甲子第 17），同 almanac.day_code
+_DAY_CODE_OFFSET = 17
+
+# 擇日四柱在 Relation.positions 中的編號為 CANDIDATE + 0..3，本命四柱為 0..3
+CANDIDATE = 10
+_NATAL_POSITIONS = (0, 1, 2, 3)
+_CANDIDATE_POSITIONS = tuple(CANDIDATE + i for i in range(4))
+
+# 每天 13 個時段（與 reverse_index 相同）：早子時 [0,1)、丑至亥時各兩小時、晚子時 [23,24)
+_SHICHEN_HOURS = (0,) + tuple(range(1, 23, 2)) + (23,)
+_SHICHEN_ENDS = _SHICHEN_HOURS[1:] + (24,)
+
+# 只涉及兩個干支的關係：擇日某柱確定後即可判定與本命是否成立
+PAIR_KINDS = frozenset(kind for kind, _, arity, _, _ in codes.RULES if arity == 2)
+
+_STEM_TABLES = (codes.STEM_PAIR_HITS, codes.STEM_TRIPLE_HITS, codes.STEM_TRIPLE_POSSIBLE, 10)
+_BRANCH_TABLES = (codes.BRANCH_PAIR_HITS, codes.BRANCH_TRIPLE_HITS, codes.BRANCH_TRIPLE_POSSIBLE, 12)
+
+# 搜尋層級：已知的擇日柱數
+_MONTH, _DAY, _HOUR = 2, 3, 4
+
+
+class Condition:
+    """
+    擇日條件：某種關係出現在擇日的某柱與本命的某柱之間
+    """
+    __slots__ = ("kind", "pillar", "natal", "weight")
+
+    def __init__(self, kind, pillar=None, natal=None, weight=1):
+        self.kind = kind  # 關係種類 (codes.LIU_HE, ...)
+        self.pillar = pillar  # 擇日柱 0-3，None 表示任一柱
+        self.natal = natal  # 本命柱 0-3，None 表示任一柱
+        self.weight = weight  # 偏好條件的分數，可為負
+
+    @classmethod
+    def parse(cls, text):
+        """
+        解析條件文字 "種類[:擇日柱-本命柱][=分數]"，柱以 年/月/日/時 表示，* 表示任一柱
+        例如 "六合:日-日"、"沖:*-年"、"三合:*-日=2"、"沖"（任一柱相沖）
+        :param text: 條件文字
+        :return: Condition
+        """
+        text = text.strip()
+        weight = 1
+        if "=" in text:
+            text, value = text.rsplit("=", 1)
+            try:
+                weight = int(value)
+            except ValueError:
+                raise ValueError(f"無效的分數: {value}") from None
+        name, _, where = text.partition(":")
+        if name not in codes.RELATION_NAMES:
+            raise ValueError(f"無效的關係種類: {name}")
+        pillar = natal = None
+        if where:
+            candidate_name, _, natal_name = where.partition("-")
+            pillar = _parse_pillar(candidate_name)
+            natal = _parse_pillar(natal_name or "*")
+        return cls(codes.RELATION_NAMES.index(name), pillar, natal, weight)
+
+    def matches(self, relation):
+        """
+        :param relation: codes.Relation（擇日柱的位置為 CANDIDATE + i）
+        :return: 是否符合條件
+        """
+        if relation.kind != self.kind:
+            return False
+        candidate = natal = False
+        for p in relation.positions:
+            if p >= CANDIDATE:
+                candidate = candidate or self.pillar is None or p - CANDIDATE == self.pillar
+            else:
+                natal = natal or self.natal is None or p == self.natal
+        return candidate and natal
+
+    def decided(self, known, final):
+        """
+        尚未符合時，是否已可確定不會符合（之後補上的柱不會再產生符合的關係）
+        :param known: 已知的擇日柱數
+        :param final: 是否已是最後一層
+        """
+        return final or (self.kind in PAIR_KINDS and self.pillar is not None and self.pillar < known)
+
+    def __str__(self):
+        where = ""
+        if self.pillar is not None or self.natal is not None:
+            where = f":{_pillar_name(self.pillar)}-{_pillar_name(self.natal)}"
+        return f"{codes.RELATION_NAMES[self.kind]}{where}"
+
+    def __repr__(self):
+        return f"Condition({self}, weight={self.weight})"
+
+
+def _parse_pillar(name):
+    if name in ("", "*"):
+        return None
+    if name not in codes.POSITIONS[:4]:
+        raise ValueError(f"無效的柱: {name}")
+    return codes.POSITIONS.index(name)
+
+
+def _pillar_name(pillar):
+    return "*" if pillar is None else codes.POSITIONS[pillar]
+
+
+def _conditions(values):
+    return tuple(value if isinstance(value, Condition) else Condition.parse(value) for value in values or ())
+
+
+def _relevant(relations):
+    # 只保留同時涉及擇日柱與本命柱的關係
+    return tuple(
+        r for r in relations
+        if any(p >= CANDIDATE for p in r.positions) and any(p < CANDIDATE for p in r.positions)
+    )
+
+
+def render_relation(relation):
+    """
+    產生關係文字，例如 "本命日支 子 六合 擇日日支 丑 化為 土"
+    :param relation: codes.Relation（擇日柱的位置為 CANDIDATE + i）
+    :return: str
+    """
+    if relation.is_stem:
+        names, part = codes.STEMS, "干"
+    else:
+        names, part = codes.BRANCHES, "支"
+    terms = [
+        f"擇日{codes.POSITIONS[p - CANDIDATE]}{part} {names[c]}" if p >= CANDIDATE
+        else f"本命{codes.POSITIONS[p]}{part} {names[c]}"
+        for p, c in zip(relation.positions, relation.codes)
+    ]
+    element = f"化為 {codes.ELEMENTS[relation.element]}" if relation.element else ""
+    if len(terms) == 3:
+        return f"{' '.join(terms)} {relation.name}{element}"
+    text = f"{terms[0]} {relation.name} {terms[1]}"
+    return f"{text} {element}" if element else text
+
+
+def render_matches(match):
+    """
+    :param match: DateSearch.run 產生的結果
+    :return: {使用者編號: [關係文字, ...]}
+    """
+    return {user_id: [render_relation(r) for r in relations] for user_id, relations in match["relations"].items()}
+
+
+def _segments(first_day, last_day):
+    """
+    將日數範圍切成年、月柱不變的區段
+    :param first_day: 起始日數（自 1970-01-01 起算），含
+    :param last_day: 結束日數，不含
+    :return: [(起始日數, 結束日數, 年柱編碼, 月柱編碼), ...]
+    """
+    jie_days, month_gan, month_zhi = month_table()
+    jie_days = jie_days.tolist()
+    month_codes = [codes.pillar_code(g, z) for g, z in zip(month_gan.tolist(), month_zhi.tolist())]
+    new_year_first, new_year_days = jieqi.lunar_new_year_days()
+    new_year_days = list(new_year_days)
+    if not jie_days or first_day < jie_days[0] or last_day > jie_days[-1]:
+        raise ValueError(f"日期超出節氣表範圍 ({jieqi.FIRST_YEAR}-{jieqi.LAST_YEAR})")
+
+    boundaries = sorted({first_day, last_day} | {d for d in jie_days + new_year_days if first_day < d < last_day})
+    segments = []
+    for a, b in zip(boundaries, boundaries[1:]):
+        lunar_year = new_year_first - 1 + bisect_right(new_year_days, a)
+        month = month_codes[bisect_right(jie_days, a) - 1]
+        segments.append((a, b, (lunar_year - 4) % 60, month))
+    return segments
+
+
+def hour_code(day_code, shichen):
+    """
+    求某日某時段的時柱編碼（五鼠遁；晚子時以次日日干起時干，日柱不換）
+    :param day_code: 日柱的六十甲子編碼
+    :param shichen: 時段 0-12（0 為早子時，12 為晚子時）
+    :return: 0-59
+    """
+    zhi = shichen % 12
+    gan = ((day_code % 10 + (shichen == 12)) % 5 * 2 + zhi) % 10
+    return codes.pillar_code(gan, zhi)
+
+
+class DateSearch:
+    """
+    擇日搜尋：require 為必須符合、forbid 為不可出現、prefer 為符合即加分（分數見 Condition.weight）的條件；
+    多人時每人都須通過 require / forbid，分數為各人分數之和
+    """
+
+    def __init__(self, require=(), forbid=(), prefer=()):
+        self.require = _conditions(require)
+        self.forbid = _conditions(forbid)
+        self.prefer = _conditions(prefer)
+        # 每個條件一個位元，關係集合先算成「符合哪些條件」的遮罩再快取
+        self._conditions = self.forbid + self.require + self.prefer
+        self._forbid_mask = (1 << len(self.forbid)) - 1
+        self._require_mask = ((1 << len(self.require)) - 1) << len(self.forbid)
+        self._prefer_bits = [(1 << (len(self.forbid) + len(self.require) + i), c) for i, c in enumerate(self.prefer)]
+        self.user_ids = []
+        self._user_groups = []
+        self._groups = {}
+        self._natal = []  # 各組的本命 (天干編碼, 地支編碼)
+        self._memo = []  # 各組的快取：擇日天干編碼 tuple 或地支編碼 tuple -> (相關關係, 條件遮罩)
+        self.stats = {"segments": 0, "days": 0, "hours": 0, "evaluations": 0}
+
+    def add(self, user_id, heavenly_stems, earthly_branches):
+        """
+        加入一位使用者；本命四柱相同者共用快取
+        :param user_id: 使用者編號
+        :param heavenly_stems: 本命天干列表 [年干, 月干, 日干, 時干]
+        :param earthly_branches: 本命地支列表 [年支, 月支, 日支, 時支]
+        """
+        natal = codes.encode_bazi(heavenly_stems, earthly_branches)
+        group = self._groups.get(natal)
+        if group is None:
+            group = self._groups[natal] = len(self._natal)
+            self._natal.append(natal)
+            self._memo.append(({}, {}))
+        self.user_ids.append(user_id)
+        self._user_groups.append(group)
+
+    def _mask(self, relations):
+        mask = 0
+        for i, condition in enumerate(self._conditions):
+            if any(condition.matches(r) for r in relations):
+                mask |= 1 << i
+        return mask
+
+    def _decided_mask(self, known, final):
+        mask = 0
+        for i, condition in enumerate(self._conditions):
+            if condition.decided(known, final):
+                mask |= 1 << i
+        return mask
+
+    def _relations(self, candidate, memo, natal, evaluate_args):
+        """
+        取得本命與擇日前 len(candidate) 柱之間的關係；由少一柱的結果加上涉及最後一柱的關係
+        :return: (相關關係, 條件遮罩)
+        """
+        found = memo.get(candidate)
+        if found is None:
+            self.stats["evaluations"] += 1
+            values = natal + candidate
+            positions = _NATAL_POSITIONS + _CANDIDATE_POSITIONS[:len(candidate)]
+            if len(candidate) == 1:
+                relations = _relevant(codes.evaluate(values, *evaluate_args, positions))
+                found = relations, self._mask(relations)
+            else:
+                parent, parent_mask = self._relations(candidate[:-1], memo, natal, evaluate_args)
+                relations = _relevant(codes.evaluate_last(values, *evaluate_args, positions))
+                found = parent + relations, parent_mask | self._mask(relations)
+            memo[candidate] = found
+        return found
+
+    def _group_relations(self, group, pillars):
+        """
+        :return: (某組本命與擇日柱之間的相關關係, 條件遮罩)
+        """
+        stems_memo, branches_memo = self._memo[group]
+        natal_stems, natal_branches = self._natal[group]
+        stems, stem_mask = self._relations(tuple(p % 10 for p in pillars), stems_memo, natal_stems, _STEM_TABLES)
+        branches, branch_mask = self._relations(
+            tuple(p % 12 for p in pillars), branches_memo, natal_branches, _BRANCH_TABLES
+        )
+        return stems + branches, stem_mask | branch_mask
+
+    def _group_bound(self, mask, decided):
+        """
+        :param mask: 已符合的條件遮罩
+        :param decided: 未符合即可確定不會符合的條件遮罩
+        :return: 分數上限；不可能通過 require / forbid 時回傳 None
+        """
+        if mask & self._forbid_mask or self._require_mask & decided & ~mask:
+            return None
+        bound = 0
+        for bit, condition in self._prefer_bits:
+            if mask & bit:
+                bound += condition.weight
+            elif not decided & bit:
+                bound += max(condition.weight, 0)
+        return bound
+
+    def _bound(self, pillars, decided):
+        """
+        :param pillars: 已知的擇日柱編碼 (年, 月[, 日[, 時]])
+        :param decided: 這一層的 _decided_mask
+        :return: 全部使用者的分數上限（最後一層即為實際分數）；任一人無法通過時回傳 None
+        """
+        bounds = {}
+        total = 0
+        for group in self._user_groups:
+            if group not in bounds:
+                bounds[group] = self._group_bound(self._group_relations(group, pillars)[1], decided)
+            if bounds[group] is None:
+                return None
+            total += bounds[group]
+        return total
+
+    def _matched(self, pillars):
+        found = {}
+        scored = tuple(self.require + self.prefer)
+        for user_id, group in zip(self.user_ids, self._user_groups):
+            relations, _ = self._group_relations(group, pillars)
+            found[user_id] = tuple(r for r in relations if any(c.matches(r) for c in scored))
+        return found
+
+    def run(self, start, end, by="hour", limit=None, min_score=None):
+        """
+        依分數由高到低、同分依時間先後，逐筆產生符合條件的時段
+        :param start: 起始日期 (date)，含
+        :param end: 結束日期 (date)，不含
+        :param by: "hour" 以時辰（每天 13 個時段）為單位，"day" 以日為單位（只看年、月、日柱）
+        :param limit: 最多產生幾筆，None 表示不限
+        :param min_score: 只產生分數不低於此值的結果
+        :return: 產生 {"start", "end", "pillars", "codes", "score", "relations": {使用者編號: (Relation, ...)}} 的產生器
+        """
+        if by not in ("hour", "day"):
+            raise ValueError(f"無效的單位: {by}")
+        if not self.user_ids:
+            return
+        final_level = _HOUR if by == "hour" else _DAY
+        decided = {level: self._decided_mask(level, level == final_level) for level in (_MONTH, _DAY, _HOUR)}
+        first_day = (start - EPOCH).days
+        last_day = (end - EPOCH).days
+        if first_day >= last_day:
+            return
+
+        heap = []
+        sequence = count()
+
+        def push(level, bound, seconds, payload):
+            if bound is not None and (min_score is None or bound >= min_score):
+                heapq.heappush(heap, (-bound, seconds, next(sequence), level, payload))
+
+        for a, b, year, month in _segments(first_day, last_day):
+            self.stats["segments"] += 1
+            push(_MONTH, self._bound((year, month), decided[_MONTH]), a * 86400, (a, b, year, month))
+
+        produced = 0
+        while heap:
+            negative, seconds, _, level, payload = heapq.heappop(heap)
+            if level == _MONTH:
+                a, b, year, month = payload
+                for day in range(a, b):
+                    self.stats["days"] += 1
+                    pillars = (year, month, (day + _DAY_CODE_OFFSET) % 60)
+                    push(_DAY, self._bound(pillars, decided[_DAY]), day * 86400, (day, pillars))
+            elif level < final_level:
+                day, pillars = payload
+                for shichen in range(13):
+                    self.stats["hours"] += 1
+                    hour_pillars = pillars + (hour_code(pillars[2], shichen),)
+                    push(_HOUR, self._bound(hour_pillars, decided[_HOUR]), day * 86400 + _SHICHEN_HOURS[shichen] * 3600,
+                         (day, hour_pillars, shichen))
+            else:
+                yield self._result(-negative, payload)
+                produced += 1
+                if limit is not None and produced >= limit:
+                    return
+
+    def _result(self, score, payload):
+        if len(payload) == 2:
+            day, pillars = payload
+            first = datetime.combine(EPOCH + timedelta(days=day), datetime.min.time())
+            start, end = first, first + timedelta(days=1)
+        else:
+            day, pillars, shichen = payload
+            first = datetime.combine(EPOCH + timedelta(days=day), datetime.min.time())
+            start = first + timedelta(hours=_SHICHEN_HOURS[shichen])
+            end = first + timedelta(hours=_SHICHEN_ENDS[shichen])
+        return {
+            "start": start,
+            "end": end,
+            "pillars": tuple(codes.JIA_ZI[p] for p in pillars),
+            "codes": pillars,
+            "score": score,
+            "relations": self._matched(pillars),
+        }
+
+
+def _parse_pillars(text):
+    pillars = [p for p in text.replace("，", ",").replace(" ", ",").split(",") if p]
+    if len(pillars) != 4 or any(len(p) != 2 for p in pillars):
+        raise ValueError(f"本命四柱格式應為 年柱,月柱,日柱,時柱: {text}")
+    return [p[0] for p in pillars], [p[1] for p in pillars]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="擇日：找出與本命八字形成指定關係的日子或時辰")
+    parser.add_argument("--charts", help="main.py --batch 輸出的命盤 JSONL（使用 id 與 pillars 欄位），- 表示標準輸入")
+    parser.add_argument("--pillars", action="append", default=[], help="本命四柱，例如 庚午,辛巳,甲子,辛未（可重複）")
+    parser.add_argument("--start", required=True, type=date.fromisoformat, help="起始日期 YYYY-MM-DD")
+    parser.add_argument("--end", required=True, type=date.fromisoformat, help="結束日期 YYYY-MM-DD（不含）")
+    parser.add_argument("--require", action="append", default=[], help="必須符合的條件，例如 六合:日-日（可重複）")
+    parser.add_argument("--forbid", action="append", default=[], help="不可出現的關係，例如 沖 或 沖:*-年（可重複）")
+    parser.add_argument("--prefer", action="append", default=[], help="符合即加分的條件，例如 三合:*-日=2（可重複）")
+    parser.add_argument("--by", choices=("hour", "day"), default="hour", help="以時辰或日為單位，預設 hour")
+    parser.add_argument("--limit", type=int, default=20, help="最多輸出幾筆，0 表示不限，預設 20")
+    parser.add_argument("--min-score", type=int, help="只輸出分數不低於此值的結果")
+    args = parser.parse_args()
+
+    try:
+        search = DateSearch(args.require, args.forbid, args.prefer)
+        for i, text in enumerate(args.pillars, start=1):
+            search.add(f"pillars{i}", *_parse_pillars(text))
+    except ValueError as e:
+        parser.error(str(e))
+    if args.charts:
+        stream = sys.stdin if args.charts == "-" else open(args.charts, encoding="utf-8")
+        for line_no, line in enumerate(stream, start=1):
+            if line.strip():
+                chart = json.loads(line)
+                pillars = chart["pillars"]
+                search.add(chart.get("id", line_no), [p[0] for p in pillars], [p[1] for p in pillars])
+    if not search.user_ids:
+        parser.error("請以 --charts 或 --pillars 指定本命八字")
+
+    for match in search.run(args.start, args.end, args.by, args.limit or None, args.min_score):
+        row = {
+            "start": match["start"].isoformat(),
+            "end": match["end"].isoformat(),
+            "pillars": match["pillars"],
+            "score": match["score"],
+            "relations": render_matches(match),
+        }
+        sys.stdout.write(json.dumps(row, ensure_ascii=False) + "\n")
+    print(search.stats, file=sys.stderr)